@@ -1,49 +1,501 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import selectors
+import socket
+import threading
+import time
 import json
 import sqlite3
 from datetime import datetime, timedelta
 import os
 import urllib.parse
-import uuid
-import hashlib
 import secrets
+import base64
 import re
-import io
-import email
-from email import message_from_bytes
+import db
+import json_codec
+import compression
+import multipart_parser
+import static_files
+import thumbnails
+import upload_store
+import outbox
+import reminder_scheduler
+import export_stream
+import capsule_import
+import passwords
+import metrics
+from router import Router, RouteNotFound, MethodNotAllowed, InvalidPathParameter
+from db import get_db
+from session_cache import SessionCache
+from session_reaper import SessionReaper
 
 # 获取当前脚本所在目录的绝对路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE = os.path.join(BASE_DIR, 'time_capsules.db')
-UPLOAD_FOLDER = os.path.join(os.path.dirname(BASE_DIR), 'uploads')
+UPLOAD_FOLDER = upload_store.UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MULTIPART_OVERHEAD = 64 * 1024  # multipart 分隔符、头部和其他字段的余量
+
+# 时间轴分页大小
+CAPSULE_PAGE_SIZE = 20
+CAPSULE_PAGE_MAX = 100
+
+# 时间轴列表字段：不返回 content 全文，只返回字数和已开启胶囊的预览
+CAPSULE_LIST_COLUMNS = '''
+    c.id, c.user_id, c.title, c.mood, c.tags, c.create_date, c.open_date, c.is_opened, c.open_time,
+    c.image_path, c.category_id, c.email_sent,
+    length(c.content) AS content_length,
+    CASE WHEN c.is_opened = 1 THEN substr(c.content, 1, 100) END AS preview
+'''
+
+# 全文搜索可指定的字段
+SEARCH_FIELDS = ['all', 'title', 'content', 'tags']
+
+# trigram 分词器能索引的最短词长度
+FTS_MIN_TERM_LENGTH = 3
+
+# 胶囊数不超过该值的用户直接在自己的胶囊中逐条匹配并排序：
+# FTS5 MATCH 会先匹配所有用户的胶囊再按 user_id 过滤，耗时随全站数据量增长
+SEARCH_SCAN_MAX_CAPSULES = 2000
+
+# 搜索排序的列权重（与 bm25 参数相同）和摘要长度（字符数，与 snippet() 的 16 个 trigram 词元相当）
+SEARCH_COLUMN_WEIGHTS = {'title': 10.0, 'content': 1.0, 'tags': 5.0}
+SNIPPET_LENGTH = 16
+
+# 服务器配置（可通过命令行参数或环境变量覆盖）
+SERVER_PORT = int(os.environ.get('CAPSULE_PORT', 5000))
+SERVER_MODE = os.environ.get('CAPSULE_SERVER_MODE', 'pool')  # pool / thread / single
+SERVER_WORKERS = int(os.environ.get('CAPSULE_WORKERS', 16))
+SERVER_BACKLOG = int(os.environ.get('CAPSULE_BACKLOG', 128))
+
+# HTTP/1.1 持久连接空闲多少秒后关闭
+KEEPALIVE_TIMEOUT = float(os.environ.get('CAPSULE_KEEPALIVE_TIMEOUT', 5))
+
+# 处理函数没有读取的请求体，不超过该字节数时读掉以复用连接，否则关闭连接
+MAX_DISCARD_BODY = 64 * 1024
+
+# 批量导入请求体的最大字节数
+MAX_IMPORT_SIZE = 64 * 1024 * 1024
+
+# 会话有效期（秒）和每个用户同时保留的会话数
+SESSION_LIFETIME = 365 * 24 * 3600
+MAX_SESSIONS_PER_USER = int(os.environ.get('CAPSULE_MAX_SESSIONS_PER_USER', 10))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def migrate_database():
-    """数据库迁移：添加新字段"""
-    conn = get_db()
-    
-    # 检查并添加 email_sent 字段到 capsules 表
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA table_info(capsules)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
+# 已验证会话的进程内缓存，登出和过期时立即移除
+session_cache = SessionCache()
+session_reaper = SessionReaper(session_cache)
+
+def _migration_add_email_sent(conn):
+    """v1：添加 email_sent 字段到 capsules 表"""
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(capsules)").fetchall()]
     if 'email_sent' not in columns:
-        print("正在添加 email_sent 字段到 capsules 表...")
         conn.execute('ALTER TABLE capsules ADD COLUMN email_sent INTEGER DEFAULT 0')
+
+def _migration_wal_and_indexes(conn):
+    """v2：开启 WAL，并为热点查询建立索引"""
+    # WAL 模式会写入数据库文件，之后所有连接都生效，读写互不阻塞
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    # 时间轴：WHERE user_id = ? ORDER BY create_date DESC
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsules_user_create ON capsules (user_id, create_date)')
+    # check_reminders.py：WHERE is_opened = 0 AND email_sent = 0 AND open_date BETWEEN ? AND ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsules_reminder ON capsules (is_opened, email_sent, open_date)')
+    # /api/reminders/check 与随机回顾：WHERE user_id = ? AND is_opened = ? ...
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsules_user_reminder ON capsules (user_id, is_opened, email_sent, open_date)')
+    # 删除分类时：WHERE category_id = ? AND user_id = ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsules_category ON capsules (category_id)')
+    # 分类列表：WHERE user_id = ? ORDER BY name
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_categories_user_name ON categories (user_id, name)')
+
+def _migration_list_filter_indexes(conn):
+    """v3：时间轴按分类分页的索引"""
+    # WHERE user_id = ? AND category_id = ? ORDER BY create_date DESC, id DESC
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsules_user_category_create ON capsules (user_id, category_id, create_date)')
+
+# 标签 JSON 数组展开为空格分隔的文本（json_each 会还原 \uXXXX 转义的中文）
+_FTS_TAGS_SQL = "(SELECT group_concat(value, ' ') FROM json_each(CASE WHEN json_valid({0}) THEN {0} END))"
+
+def _migration_fulltext_search(conn):
+    """v4：FTS5 全文索引（trigram 分词，支持中文子串匹配），由触发器与 capsules 同步"""
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS capsules_fts
+        USING fts5(title, content, tags, tokenize = 'trigram')
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_insert AFTER INSERT ON capsules BEGIN
+            INSERT INTO capsules_fts (rowid, title, content, tags)
+            VALUES (new.id, new.title, new.content, {_FTS_TAGS_SQL.format('new.tags')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_update AFTER UPDATE OF title, content, tags ON capsules BEGIN
+            UPDATE capsules_fts
+            SET title = new.title, content = new.content, tags = {_FTS_TAGS_SQL.format('new.tags')}
+            WHERE rowid = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS capsules_fts_delete AFTER DELETE ON capsules BEGIN
+            DELETE FROM capsules_fts WHERE rowid = old.id;
+        END
+    ''')
+    conn.execute('DELETE FROM capsules_fts')
+    conn.execute(f'''
+        INSERT INTO capsules_fts (rowid, title, content, tags)
+        SELECT id, title, content, {_FTS_TAGS_SQL.format('tags')} FROM capsules
+    ''')
+
+def _migration_upload_store(conn):
+    """v5：按内容寻址的上传文件表，由触发器维护胶囊对文件的引用计数"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            path TEXT PRIMARY KEY NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            uploaded_at REAL NOT NULL
+        )
+    ''')
+    # 回收查询：WHERE ref_count <= 0 AND uploaded_at < ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_uploads_unreferenced ON uploads (uploaded_at) WHERE ref_count <= 0')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS uploads_ref_insert AFTER INSERT ON capsules
+        WHEN new.image_path IS NOT NULL AND new.image_path != '' BEGIN
+            UPDATE uploads SET ref_count = ref_count + 1 WHERE path = new.image_path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS uploads_ref_update AFTER UPDATE OF image_path ON capsules
+        WHEN old.image_path IS NOT new.image_path BEGIN
+            UPDATE uploads SET ref_count = ref_count - 1 WHERE path = old.image_path;
+            UPDATE uploads SET ref_count = ref_count + 1 WHERE path = new.image_path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS uploads_ref_delete AFTER DELETE ON capsules
+        WHEN old.image_path IS NOT NULL AND old.image_path != '' BEGIN
+            UPDATE uploads SET ref_count = ref_count - 1 WHERE path = old.image_path;
+        END
+    ''')
+
+# 当前时间（Unix 秒，带小数），与 time.time() 一致
+_SQL_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+def _migration_upload_reference_time(conn):
+    """
+    v11：胶囊引用或解除引用文件时刷新 uploads.uploaded_at
+
+    回收保留期从文件最后一次被引用或解除引用时算起，而不是从上传时算起：
+    编辑胶囊换掉的旧图片、被删除后又要恢复的图片都还有完整的保留期。
+    """
+    for name in ('uploads_ref_insert', 'uploads_ref_update', 'uploads_ref_delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute(f'''
+        CREATE TRIGGER uploads_ref_insert AFTER INSERT ON capsules
+        WHEN new.image_path IS NOT NULL AND new.image_path != '' BEGIN
+            UPDATE uploads SET ref_count = ref_count + 1, uploaded_at = {_SQL_NOW} WHERE path = new.image_path;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER uploads_ref_update AFTER UPDATE OF image_path ON capsules
+        WHEN old.image_path IS NOT new.image_path BEGIN
+            UPDATE uploads SET ref_count = ref_count - 1, uploaded_at = {_SQL_NOW} WHERE path = old.image_path;
+            UPDATE uploads SET ref_count = ref_count + 1, uploaded_at = {_SQL_NOW} WHERE path = new.image_path;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER uploads_ref_delete AFTER DELETE ON capsules
+        WHEN old.image_path IS NOT NULL AND old.image_path != '' BEGIN
+            UPDATE uploads SET ref_count = ref_count - 1, uploaded_at = {_SQL_NOW} WHERE path = old.image_path;
+        END
+    ''')
+
+def _migration_email_outbox(conn):
+    """v6：提醒邮件发件箱"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            capsule_id INTEGER,
+            to_email TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            UNIQUE (kind, capsule_id)
+        )
+    ''')
+    # 领取任务：WHERE status = ? AND next_attempt_at <= ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)')
+
+def _migration_user_versions(conn):
+    """v7：每个用户的数据版本号，胶囊或分类有任何写入时由触发器加一（用作 ETag）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # 模板是所有用户共享的，使用 user_id = 0
+    for table, row_user_id in (('capsules', '{row}.user_id'), ('categories', '{row}.user_id'), ('templates', '0')):
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO user_versions (user_id, version) VALUES ({row_user_id.format(row=row)}, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+                END
+            ''')
+
+# capsule_stats 的分组键：心情、创建月份（YYYY-MM）、分类（无分类为 0）、是否已开启
+_STATS_KEY_SQL = "COALESCE({0}.mood, ''), substr({0}.create_date, 1, 7), COALESCE({0}.category_id, 0), COALESCE({0}.is_opened, 0)"
+_STATS_KEY_MATCH_SQL = (
+    "user_id = {0}.user_id AND mood = COALESCE({0}.mood, '') AND month = substr({0}.create_date, 1, 7) "
+    "AND category_id = COALESCE({0}.category_id, 0) AND is_opened = COALESCE({0}.is_opened, 0)"
+)
+# 标签 JSON 数组展开为去重的文本标签
+_TAGS_JSON_EACH_SQL = "SELECT DISTINCT value FROM json_each(CASE WHEN json_valid({0}) THEN {0} END) WHERE type = 'text'"
+
+# 胶囊的标签（去重，只计文本）
+_STATS_TAGS_SQL = _TAGS_JSON_EACH_SQL.format('{0}.tags')
+
+def _stats_add_sql(row):
+    return f'''
+        INSERT INTO capsule_stats (user_id, mood, month, category_id, is_opened, count)
+        VALUES ({row}.user_id, {_STATS_KEY_SQL.format(row)}, 1)
+        ON CONFLICT (user_id, mood, month, category_id, is_opened) DO UPDATE SET count = count + 1;
+    '''
+
+def _stats_remove_sql(row):
+    return f'''
+        UPDATE capsule_stats SET count = count - 1 WHERE {_STATS_KEY_MATCH_SQL.format(row)};
+        DELETE FROM capsule_stats WHERE {_STATS_KEY_MATCH_SQL.format(row)} AND count <= 0;
+    '''
+
+def _tag_stats_add_sql(row):
+    return f'''
+        INSERT INTO capsule_tag_stats (user_id, tag, count)
+        SELECT {row}.user_id, value, 1 FROM ({_STATS_TAGS_SQL.format(row)}) WHERE true
+        ON CONFLICT (user_id, tag) DO UPDATE SET count = count + 1;
+    '''
+
+def _tag_stats_remove_sql(row):
+    return f'''
+        UPDATE capsule_tag_stats SET count = count - 1
+        WHERE user_id = {row}.user_id AND tag IN ({_STATS_TAGS_SQL.format(row)});
+        DELETE FROM capsule_tag_stats WHERE user_id = {row}.user_id AND count <= 0;
+    '''
+
+def _migration_capsule_stats(conn):
+    """v8：按 心情 × 月份 × 分类 × 是否开启 和 标签 汇总的胶囊计数，由触发器增量维护"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS capsule_stats (
+            user_id INTEGER NOT NULL,
+            mood TEXT NOT NULL,
+            month TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            is_opened INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, mood, month, category_id, is_opened)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS capsule_tag_stats (
+            user_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, tag)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_insert AFTER INSERT ON capsules BEGIN
+            {_stats_add_sql('new')}
+            {_tag_stats_add_sql('new')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_delete AFTER DELETE ON capsules BEGIN
+            {_stats_remove_sql('old')}
+            {_tag_stats_remove_sql('old')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_stats_update
+        AFTER UPDATE OF user_id, mood, create_date, category_id, is_opened ON capsules BEGIN
+            {_stats_remove_sql('old')}
+            {_stats_add_sql('new')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_tag_stats_update AFTER UPDATE OF user_id, tags ON capsules BEGIN
+            {_tag_stats_remove_sql('old')}
+            {_tag_stats_add_sql('new')}
+        END
+    ''')
+
+    # 回填已有数据
+    conn.execute('DELETE FROM capsule_stats')
+    conn.execute('DELETE FROM capsule_tag_stats')
+    conn.execute(f'''
+        INSERT INTO capsule_stats (user_id, mood, month, category_id, is_opened, count)
+        SELECT user_id, {_STATS_KEY_SQL.format('capsules')}, COUNT(*) FROM capsules
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+    conn.execute('''
+        INSERT INTO capsule_tag_stats (user_id, tag, count)
+        SELECT capsules.user_id, tags.value, COUNT(DISTINCT capsules.id)
+        FROM capsules, json_each(CASE WHEN json_valid(capsules.tags) THEN capsules.tags END) AS tags
+        WHERE tags.type = 'text'
+        GROUP BY 1, 2
+    ''')
+
+def _migration_tag_tables(conn):
+    """v9：标签关联表 capsule_tags / template_tags，由触发器与 tags 字段（JSON 数组）同步"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS capsule_tags (
+            capsule_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (capsule_id, tag)
+        ) WITHOUT ROWID
+    ''')
+    # 按标签筛选：WHERE user_id = ? AND tag = ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_capsule_tags_user_tag ON capsule_tags (user_id, tag)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS template_tags (
+            template_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (template_id, tag)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_template_tags_tag ON template_tags (tag)')
+
+    capsule_tags_insert = f'''
+        INSERT OR IGNORE INTO capsule_tags (capsule_id, user_id, tag)
+        SELECT new.id, new.user_id, value FROM ({_TAGS_JSON_EACH_SQL.format('new.tags')});
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_tags_insert AFTER INSERT ON capsules BEGIN
+            {capsule_tags_insert}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS capsule_tags_update AFTER UPDATE OF tags, user_id ON capsules BEGIN
+            DELETE FROM capsule_tags WHERE capsule_id = old.id;
+            {capsule_tags_insert}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS capsule_tags_delete AFTER DELETE ON capsules BEGIN
+            DELETE FROM capsule_tags WHERE capsule_id = old.id;
+        END
+    ''')
+
+    template_tags_insert = f'''
+        INSERT OR IGNORE INTO template_tags (template_id, tag)
+        SELECT new.id, value FROM ({_TAGS_JSON_EACH_SQL.format('new.tags')});
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS template_tags_insert AFTER INSERT ON templates BEGIN
+            {template_tags_insert}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS template_tags_update AFTER UPDATE OF tags ON templates BEGIN
+            DELETE FROM template_tags WHERE template_id = old.id;
+            {template_tags_insert}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS template_tags_delete AFTER DELETE ON templates BEGIN
+            DELETE FROM template_tags WHERE template_id = old.id;
+        END
+    ''')
+
+    # 回填已有数据
+    conn.execute('''
+        INSERT OR IGNORE INTO capsule_tags (capsule_id, user_id, tag)
+        SELECT capsules.id, capsules.user_id, tags.value
+        FROM capsules, json_each(CASE WHEN json_valid(capsules.tags) THEN capsules.tags END) AS tags
+        WHERE tags.type = 'text'
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO template_tags (template_id, tag)
+        SELECT templates.id, tags.value
+        FROM templates, json_each(CASE WHEN json_valid(templates.tags) THEN templates.tags END) AS tags
+        WHERE tags.type = 'text'
+    ''')
+
+def _migration_compact_sessions(conn):
+    """v10：会话表去掉 username，时间改为 UNIX 时间戳（created_at 带小数，expires_at 为整秒），建立过期时间和每用户会话索引"""
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(sessions)')]
+    if 'username' in columns:
+        conn.execute('''
+            CREATE TABLE sessions_compact (
+                token TEXT PRIMARY KEY NOT NULL,
+                user_id INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            ) WITHOUT ROWID
+        ''')
+        # 旧的时间是本地时间的 ISO 字符串，'utc' 修饰符把它换算成 UTC 时间戳；已过期和无法解析的会话直接丢弃
+        conn.execute('''
+            INSERT INTO sessions_compact (token, user_id, created_at, expires_at)
+            SELECT token, user_id, created, expires FROM (
+                SELECT token, user_id,
+                       CAST(strftime('%s', created_at, 'utc') AS INTEGER) AS created,
+                       CAST(strftime('%s', expires_at, 'utc') AS INTEGER) AS expires
+                FROM sessions
+            )
+            WHERE created IS NOT NULL AND expires > CAST(strftime('%s', 'now') AS INTEGER)
+        ''')
+        conn.execute('DROP TABLE sessions')
+        conn.execute('ALTER TABLE sessions_compact RENAME TO sessions')
+    # 回收过期会话：WHERE expires_at <= ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+    # 每用户会话数上限：WHERE user_id = ? ORDER BY created_at DESC
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at)')
+
+# 按版本号顺序执行的数据库迁移，已执行的版本记录在 PRAGMA user_version 中
+SCHEMA_MIGRATIONS = [
+    (1, '添加 email_sent 字段', _migration_add_email_sent),
+    (2, '开启 WAL 并建立索引', _migration_wal_and_indexes),
+    (3, '添加时间轴分页索引', _migration_list_filter_indexes),
+    (4, '建立全文搜索索引', _migration_fulltext_search),
+    (5, '建立上传文件引用计数表', _migration_upload_store),
+    (6, '建立邮件发件箱', _migration_email_outbox),
+    (7, '建立用户数据版本号', _migration_user_versions),
+    (8, '建立胶囊统计汇总表', _migration_capsule_stats),
+    (9, '建立标签关联表', _migration_tag_tables),
+    (10, '精简会话表', _migration_compact_sessions),
+    (11, '上传文件保留期从最后一次引用算起', _migration_upload_reference_time),
+]
+
+def migrate_database():
+    """数据库迁移：按版本号执行尚未执行的迁移步骤"""
+    conn = get_db()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for target, description, migration in SCHEMA_MIGRATIONS:
+        if version >= target:
+            continue
+        print(f"正在执行数据库迁移 v{target}：{description}...")
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {target}')
         conn.commit()
-        print("✓ email_sent 字段添加成功")
-    else:
-        print("email_sent 字段已存在")
-    
-    conn.close()
+        version = target
+        print(f"✓ 数据库迁移 v{target} 完成")
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    conn.close()
 
 def init_db():
     conn = get_db()
@@ -73,6 +525,7 @@ def init_db():
             open_time TEXT,
             image_path TEXT,
             category_id INTEGER,
+            email_sent INTEGER DEFAULT 0,
             FOREIGN KEY (user_id) REFERENCES users(id),
             FOREIGN KEY (category_id) REFERENCES categories(id)
         )
@@ -96,11 +549,10 @@ def init_db():
         CREATE TABLE IF NOT EXISTS sessions (
             token TEXT PRIMARY KEY NOT NULL,
             user_id INTEGER NOT NULL,
-            username TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users(id)
-        )
+        ) WITHOUT ROWID
     ''')
 
     # 创建分类表
@@ -118,6 +570,9 @@ def init_db():
 
     conn.commit()
     conn.close()
+
+    # 执行数据库迁移（索引、新字段等）
+    migrate_database()
     
     # 初始化默认模板
     init_default_templates()
@@ -227,39 +682,50 @@ def init_default_templates():
         conn.commit()
     conn.close()
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def generate_token():
     return secrets.token_hex(32)
 
+def _delete_session(token):
+    session_cache.invalidate(token)
+    conn = get_db()
+    conn.execute('DELETE FROM sessions WHERE token = ?', (token,))
+    conn.commit()
+    conn.close()
+
 def get_user_from_token(token):
+    if not token:
+        return None
+
+    cached = session_cache.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if time.time() > expires_at:
+            # 会话已过期，删除它
+            _delete_session(token)
+            return None
+        return user_id
+
+    started = time.perf_counter()
     conn = get_db()
     session = conn.execute('SELECT user_id, expires_at FROM sessions WHERE token = ?', (token,)).fetchone()
     conn.close()
+    session_cache.record_lookup(time.perf_counter() - started)
 
     if not session:
         return None
 
-    # 检查会话是否过期
-    try:
-        expires_at = datetime.fromisoformat(session['expires_at'])
-        if datetime.now() > expires_at:
-            # 会话已过期，删除它
-            conn = get_db()
-            conn.execute('DELETE FROM sessions WHERE token = ?', (token,))
-            conn.commit()
-            conn.close()
-            return None
-    except ValueError:
+    # 检查会话是否过期（过期会话也会由 session_reaper 定期批量删除）
+    if time.time() > session['expires_at']:
+        _delete_session(token)
         return None
 
+    session_cache.put(token, (session['user_id'], session['expires_at']))
     return session['user_id']
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_capsule_data(data):
+def validate_capsule_data(data, allow_past_open_date=False):
     errors = []
     
     if not data.get('title') or len(data['title'].strip()) == 0:
@@ -277,9 +743,12 @@ def validate_capsule_data(data):
     else:
         try:
             open_date = datetime.fromisoformat(data['open_date'])
-            if open_date <= datetime.now():
+            if open_date.tzinfo is not None:
+                # 日期按本地时间的 ISO 字符串保存和比较，不接受带时区的时间
+                errors.append('开启日期不能包含时区')
+            elif open_date <= datetime.now() and not allow_past_open_date:
                 errors.append('开启日期必须在未来')
-        except ValueError:
+        except (TypeError, ValueError):
             errors.append('开启日期格式无效')
     
     valid_moods = ['happy', 'excited', 'peaceful', 'nostalgic', 'hopeful', 'anxious', 'sad', 'grateful', 'proud', 'relaxed', 'surprised', 'confident', 'thoughtful', 'tired', 'loved']
@@ -288,819 +757,1528 @@ def validate_capsule_data(data):
     
     return errors
 
-def send_json_response(handler, data, status=200):
+def encode_cursor(create_date, capsule_id):
+    raw = json.dumps([create_date, capsule_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        create_date, capsule_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(create_date, str) or not isinstance(capsule_id, int):
+        raise ValueError('Invalid cursor')
+    return create_date, capsule_id
+
+def build_capsule_filters(user_id, params):
+    """
+    根据查询参数生成胶囊过滤条件（表别名为 c）
+
+    Args:
+        user_id: 用户 ID
+        params: 查询参数
+            status: all / sealed / ready / opened
+            category_id: 分类 ID，none 表示未分类
+            from / to: 创建日期范围（from 含，to 不含）
+            tag: 标签（使用 capsule_tags 索引）
+
+    Returns:
+        list: WHERE 条件
+        list: 条件参数
+
+    Raises:
+        ValueError: 参数无效
+    """
+    conditions = ['c.user_id = ?']
+    args = [user_id]
+
+    status = params.get('status', 'all')
+    now = datetime.now().isoformat()
+    if status == 'opened':
+        conditions.append('c.is_opened = 1')
+    elif status == 'ready':
+        conditions.append('c.is_opened = 0 AND c.open_date <= ?')
+        args.append(now)
+    elif status == 'sealed':
+        conditions.append('c.is_opened = 0 AND c.open_date > ?')
+        args.append(now)
+    elif status != 'all':
+        raise ValueError('Invalid status')
+
+    category_id = params.get('category_id')
+    if category_id == 'none':
+        conditions.append('c.category_id IS NULL')
+    elif category_id:
+        try:
+            args.append(int(category_id))
+        except ValueError:
+            raise ValueError('Invalid category ID')
+        conditions.append('c.category_id = ?')
+
+    if params.get('from'):
+        conditions.append('c.create_date >= ?')
+        args.append(params['from'])
+    if params.get('to'):
+        conditions.append('c.create_date < ?')
+        args.append(params['to'])
+
+    if params.get('tag'):
+        conditions.append('c.id IN (SELECT capsule_id FROM capsule_tags WHERE user_id = ? AND tag = ?)')
+        args.extend([user_id, params['tag']])
+
+    return conditions, args
+
+def parse_page_limit(params):
+    try:
+        limit = int(params.get('limit', CAPSULE_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return max(1, min(limit, CAPSULE_PAGE_MAX))
+
+def query_capsule_page(conn, user_id, params):
+    """
+    按 (create_date, id) 倒序游标分页查询胶囊列表
+
+    Args:
+        conn: 数据库连接
+        user_id: 用户 ID
+        params: 查询参数，除 build_capsule_filters 支持的过滤条件外还有
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数
+
+    Returns:
+        list: 胶囊列表（精简字段）
+        str: 下一页游标，没有更多数据时为 None
+
+    Raises:
+        ValueError: 参数无效
+    """
+    conditions, args = build_capsule_filters(user_id, params)
+
+    if params.get('cursor'):
+        conditions.append('(c.create_date, c.id) < (?, ?)')
+        args.extend(decode_cursor(params['cursor']))
+
+    limit = parse_page_limit(params)
+
+    rows = conn.execute(f'''
+        SELECT {CAPSULE_LIST_COLUMNS} FROM capsules c
+        WHERE {' AND '.join(conditions)}
+        ORDER BY c.create_date DESC, c.id DESC
+        LIMIT ?
+    ''', args + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['create_date'], rows[-1]['id'])
+
+    return [dict(r) for r in rows], next_cursor
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+def _scan_score(row, terms, columns):
+    """近似 bm25 的相关度：按列加权、词频饱和（k1 = 1.2），不含 IDF"""
+    score = 0.0
+    for col in columns:
+        text = (row[f'fts_{col}'] or '').lower()
+        for term in terms:
+            tf = text.count(term)
+            score += SEARCH_COLUMN_WEIGHTS[col] * tf * 2.2 / (tf + 1.2)
+    return score
+
+def _scan_snippet(content, terms):
+    """与 snippet(capsules_fts, 1, '<mark>', '</mark>', '…', 16) 格式相同的摘要"""
+    content = content or ''
+    lowered = content.lower()
+    hits = [(lowered.find(term), len(term)) for term in terms]
+    hits = [hit for hit in hits if hit[0] >= 0]
+    start = 0
+    if hits:
+        first, length = min(hits)
+        start = max(0, first - max(0, SNIPPET_LENGTH - length) // 2)
+    end = min(len(content), start + SNIPPET_LENGTH)
+    start = max(0, end - SNIPPET_LENGTH)
+
+    parts = ['…'] if start > 0 else []
+    pos = start
+    while pos < end:
+        matched = next((term for term in terms if lowered.startswith(term, pos)), None)
+        if matched:
+            parts.append('<mark>' + content[pos:pos + len(matched)] + '</mark>')
+            pos += len(matched)
+        else:
+            parts.append(content[pos])
+            pos += 1
+    if pos < len(content):
+        parts.append('…')
+    return ''.join(parts)
+
+def _ranked_scan(conn, conditions, args, terms, columns, offset, limit):
+    """逐条匹配当前用户的胶囊，按相关度（相同时按创建时间倒序）排序，返回第 offset 条起的 limit + 1 条"""
+    rows = conn.execute(f'''
+        SELECT {CAPSULE_LIST_COLUMNS},
+               capsules_fts.title AS fts_title, capsules_fts.content AS fts_content, capsules_fts.tags AS fts_tags
+        FROM capsules c
+        JOIN capsules_fts ON capsules_fts.rowid = c.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY c.create_date DESC, c.id DESC
+    ''', args).fetchall()
+    terms = [term.lower() for term in terms]
+    # sorted() 是稳定排序，相关度相同的保持创建时间倒序
+    ranked = sorted(rows, key=lambda r: _scan_score(r, terms, columns), reverse=True)
+
+    capsules = []
+    for r in ranked[offset:offset + limit + 1]:
+        capsule = {key: r[key] for key in r.keys() if not key.startswith('fts_')}
+        capsule['snippet'] = _scan_snippet(r['fts_content'], terms) if r['is_opened'] == 1 else None
+        capsules.append(capsule)
+    return capsules
+
+def count_user_capsules(conn, user_id):
+    """用户的胶囊数（读取 capsule_stats 汇总表）"""
+    return conn.execute('SELECT COALESCE(SUM(count), 0) FROM capsule_stats WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+def search_capsules(conn, user_id, params):
+    """
+    全文搜索胶囊，按相关度排序并分页
+
+    胶囊数不超过 SEARCH_SCAN_MAX_CAPSULES 的用户在自己的胶囊中逐条匹配，
+    按近似 bm25 的相关度排序并生成摘要，耗时只与该用户的胶囊数有关；
+    胶囊较多的用户在所有关键词都不少于 3 个字符时使用 FTS5 trigram 索引，按 bm25 排序并生成摘要，
+    否则同样逐条匹配，按创建时间倒序排列。
+
+    Args:
+        conn: 数据库连接
+        user_id: 用户 ID
+        params: 查询参数，除 build_capsule_filters 支持的过滤条件外还有
+            q: 搜索关键词，空格分隔的多个词需要同时匹配
+            field: all / title / content / tags
+            offset: 跳过的结果数
+            limit: 每页条数
+
+    Returns:
+        list: 胶囊列表（精简字段，附带 snippet）
+        int: 下一页的 offset，没有更多结果时为 None
+
+    Raises:
+        ValueError: 参数无效
+    """
+    terms = params.get('q', '').split()
+    if not terms:
+        raise ValueError('Search query is required')
+
+    field = params.get('field', 'all')
+    if field not in SEARCH_FIELDS:
+        raise ValueError('Invalid search field')
+
+    try:
+        offset = max(0, int(params.get('offset', 0)))
+    except ValueError:
+        raise ValueError('Invalid offset')
+    limit = parse_page_limit(params)
+
+    conditions, args = build_capsule_filters(user_id, params)
+    columns = ['title', 'content', 'tags'] if field == 'all' else [field]
+    scan = count_user_capsules(conn, user_id) <= SEARCH_SCAN_MAX_CAPSULES
+
+    if not scan and all(len(term) >= FTS_MIN_TERM_LENGTH for term in terms):
+        match = ' AND '.join(_fts_phrase(term) for term in terms)
+        if field != 'all':
+            match = f'{field} : ({match})'
+        rows = conn.execute(f'''
+            SELECT {CAPSULE_LIST_COLUMNS},
+                   CASE WHEN c.is_opened = 1
+                        THEN snippet(capsules_fts, 1, '<mark>', '</mark>', '…', 16) END AS snippet
+            FROM capsules_fts
+            JOIN capsules c ON c.id = capsules_fts.rowid
+            WHERE capsules_fts MATCH ? AND {' AND '.join(conditions)}
+            ORDER BY bm25(capsules_fts, 10.0, 1.0, 5.0)
+            LIMIT ? OFFSET ?
+        ''', [match] + args + [limit + 1, offset]).fetchall()
+        rows = [dict(r) for r in rows]
+    else:
+        # 只在当前用户的胶囊范围内逐条匹配
+        # （拼接 '' 是为了绕开 FTS5 对少于 3 个中文字符的 LIKE 优化，它会漏掉结果）
+        for term in terms:
+            pattern = _like_pattern(term)
+            conditions.append('(' + ' OR '.join(f"(capsules_fts.{col} || '') LIKE ? ESCAPE '\\'" for col in columns) + ')')
+            args.extend([pattern] * len(columns))
+        if scan:
+            rows = _ranked_scan(conn, conditions, args, terms, columns, offset, limit)
+        else:
+            # 胶囊很多的用户搜索短词：不排序，按创建时间倒序分页
+            rows = conn.execute(f'''
+                SELECT {CAPSULE_LIST_COLUMNS}, NULL AS snippet
+                FROM capsules c
+                JOIN capsules_fts ON capsules_fts.rowid = c.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY c.create_date DESC, c.id DESC
+                LIMIT ? OFFSET ?
+            ''', args + [limit + 1, offset]).fetchall()
+            rows = [dict(r) for r in rows]
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+
+    return rows, next_offset
+
+# 模板的数据版本号保存在 user_id = 0 下
+SHARED_VERSION_USER_ID = 0
+
+def get_data_version(user_id):
+    """用户数据版本号（user_versions 表主键查询，不访问 capsules 表）"""
+    conn = get_db()
+    row = conn.execute('SELECT version FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    return row['version'] if row else 0
+
+# 结果取决于当前时间（open_date 与 now 比较）的 status 过滤条件，这类响应不做 ETag
+TIME_DEPENDENT_STATUSES = ('sealed', 'ready')
+
+def make_etag(user_id, version):
+    return f'W/"{user_id}-{version}"'
+
+def send_not_modified(handler, etag):
+    handler.send_response(304)
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', 'private, no-cache')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('Vary', 'Authorization, Accept-Encoding')
+    handler.end_headers()
+
+def send_json_response(handler, data, status=200, headers=None):
+    send_json_bytes(handler, json_codec.dumps(data), status, headers)
+
+def send_json_bytes(handler, body, status=200, headers=None):
+    """发送已序列化的 JSON 响应体，客户端支持时压缩；headers 为额外的响应头"""
+    compressible = len(body) >= compression.COMPRESSION_THRESHOLD
+    body, encoding = compression.compress(body, handler.headers.get('Accept-Encoding', ''))
     handler.send_response(status)
     handler.send_header('Content-type', 'application/json')
     handler.send_header('Access-Control-Allow-Origin', '*')
+    etag = getattr(handler, 'response_etag', None)
+    if etag and status == 200:
+        # 客户端每次都用 If-None-Match 验证缓存
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', 'private, no-cache')
+        handler.send_header('Vary', 'Authorization, Accept-Encoding')
+    elif compressible:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if encoding:
+        handler.send_header('Content-Encoding', encoding)
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.send_header('Content-Length', str(len(body)))
     handler.end_headers()
-    handler.wfile.write(json.dumps(data).encode())
+    handler.wfile.write(body)
 
 def send_cors_response(handler):
     handler.send_response(200)
     handler.send_header('Access-Control-Allow-Origin', '*')
     handler.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
     handler.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+    handler.send_header('Content-Length', '0')
     handler.end_headers()
 
-def send_file_response(handler, filepath):
+def send_file_response(handler, filepath, extra_headers=None):
     try:
-        with open(filepath, 'rb') as f:
-            content = f.read()
-
-        content_type = 'image/jpeg'
-        if filepath.endswith('.png'):
-            content_type = 'image/png'
-        elif filepath.endswith('.gif'):
-            content_type = 'image/gif'
-        elif filepath.endswith('.webp'):
-            content_type = 'image/webp'
-
-        handler.send_response(200)
-        handler.send_header('Content-type', content_type)
-        handler.send_header('Access-Control-Allow-Origin', '*')
-        handler.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        handler.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, Range')
-        handler.send_header('Cache-Control', 'public, max-age=31536000')  # 缓存一年
-        handler.send_header('Content-Length', str(len(content)))
-        handler.send_header('Accept-Ranges', 'bytes')
-        handler.end_headers()
-        handler.wfile.write(content)
-        print(f'[FILE] Served {filepath} ({len(content)} bytes)')
+        static_files.send_file(handler, filepath, extra_headers)
     except FileNotFoundError:
         print(f'[FILE] File not found: {filepath}')
         send_json_response(handler, {'error': 'File not found'}, 404)
     except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError):
         # 客户端断开连接，静默处理
-        print(f'[FILE] Client disconnected while serving {filepath}')
+        pass
     except Exception as e:
         print(f'[FILE] Error serving file {filepath}: {e}')
         send_json_response(handler, {'error': 'Internal server error'}, 500)
 
-class RequestHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        pass
-
-    def get_auth_token(self):
-        auth_header = self.headers.get('Authorization', '')
-        if auth_header.startswith('Bearer '):
-            return auth_header[7:]
+def resolve_upload_path(relative_path):
+    """把 /uploads/ 之后的路径映射到 UPLOAD_FOLDER 内的文件，越界时返回 None"""
+    filepath = os.path.normpath(os.path.join(UPLOAD_FOLDER, urllib.parse.unquote(relative_path)))
+    if not filepath.startswith(UPLOAD_FOLDER + os.sep):
         return None
+    return filepath
+
+# 路由表：处理函数的签名为 handler(request_handler, **路径参数)
+# 路由选项：
+#   auth=True       需要登录，request_handler.user_id 为当前用户
+#   json_body=True  需要 JSON 请求体，request_handler.data 为解析后的数据
+#   etag='user'     响应只取决于当前用户的胶囊和分类，按用户数据版本号做 ETag / 304
+#                   （status=sealed/ready 的结果随时间变化，不做 ETag）
+#   etag='shared'   响应只取决于共享数据（模板），按共享版本号做 ETag / 304
+router = Router()
+
+# 路径参数类型不符时的错误信息
+PATH_PARAM_ERRORS = {
+    'capsule_id': 'Invalid capsule ID',
+    'category_id': 'Invalid category ID',
+}
+
+
+# Serve static files from uploads directory
+@router.get('/uploads/<path:filename>')
+def get_upload(handler, filename):
+    filepath = resolve_upload_path(filename)
+    if not filepath or not os.path.isfile(filepath):
+        send_json_response(handler, {'error': 'File not found'}, 404)
+        return
+
+    # ?w=320：返回对应宽度档位的缩略图（尚未生成时返回原图）
+    extra_headers = None
+    if handler.query.get('w', '').isdigit():
+        accept_webp = 'image/webp' in handler.headers.get('Accept', '')
+        variant = thumbnails.find_variant(filepath, int(handler.query['w']), accept_webp)
+        extra_headers = {'Vary': 'Accept'}
+        if variant:
+            filepath = variant
+        else:
+            # 代替缩略图返回的原图不能长期缓存在缩略图 URL 下，生成后客户端重新验证即可拿到缩略图
+            extra_headers['Cache-Control'] = 'no-cache'
+    send_file_response(handler, filepath, extra_headers)
+
+
+# Get current user
+@router.get('/api/auth/me')
+def get_current_user(handler):
+    token = handler.get_auth_token()
+    if not token:
+        send_json_response(handler, {'error': 'Not authenticated'}, 401)
+        return
+
+    user_id = get_user_from_token(token)
+    if not user_id:
+        send_json_response(handler, {'error': 'Invalid token'}, 401)
+        return
 
-    def do_OPTIONS(self):
-        send_cors_response(self)
+    conn = get_db()
+    user = conn.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,)).fetchone()
+    conn.close()
 
-    def do_GET(self):
+    if user:
+        send_json_response(handler, dict(user))
+    else:
+        send_json_response(handler, {'error': 'User not found'}, 404)
+
+
+# Get user's capsules
+@router.get('/api/capsules', auth=True, etag='user')
+def list_capsules(handler):
+    user_id = handler.user_id
+    if handler.query:
+        # 分页模式：游标分页 + 服务端过滤，返回不含 content 全文的精简字段
+        conn = get_db()
         try:
-            # Serve static files from uploads directory
-            if self.path.startswith('/uploads/'):
-                filename = self.path[9:]
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                if os.path.exists(filepath):
-                    send_file_response(self, filepath)
-                else:
-                    send_json_response(self, {'error': 'File not found'}, 404)
-            
-            # Get current user
-            elif self.path == '/api/auth/me':
-                token = self.get_auth_token()
-                if not token:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                user_id = get_user_from_token(token)
-                if not user_id:
-                    send_json_response(self, {'error': 'Invalid token'}, 401)
-                    return
-                
-                conn = get_db()
-                user = conn.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,)).fetchone()
-                conn.close()
-                
-                if user:
-                    send_json_response(self, dict(user))
-                else:
-                    send_json_response(self, {'error': 'User not found'}, 404)
-            
-            # Get user's capsules
-            elif self.path == '/api/capsules':
-                print('GET /api/capsules - Request received')
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                print(f'GET /api/capsules - Token: {token}, User ID: {user_id}')
-                print(f'GET /api/capsules - Authorization header: {self.headers.get("Authorization", "None")}')
-
-                if not user_id:
-                    print('GET /api/capsules - Not authenticated')
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
+            capsules, next_cursor = query_capsule_page(conn, user_id, handler.query)
+        except ValueError as e:
+            send_json_response(handler, {'error': str(e)}, 400)
+            return
+        finally:
+            conn.close()
+        send_json_response(handler, {'capsules': capsules, 'next_cursor': next_cursor})
+        return
 
-                try:
-                    conn = get_db()
-                    print('GET /api/capsules - Executing query...')
-                    capsules = conn.execute('SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC', (user_id,)).fetchall()
-                    conn.close()
-                    result = [dict(c) for c in capsules]
-                    print(f'GET /api/capsules - Found {len(result)} capsules')
-                    print(f'GET /api/capsules - Result: {result}')
-                    send_json_response(self, result)
-                except Exception as e:
-                    print(f'GET /api/capsules - Error: {str(e)}')
-                    import traceback
-                    traceback.print_exc()
-                    send_json_response(self, {'error': 'Internal server error'}, 500)
-            
-            # Get random opened capsule
-            elif self.path.startswith('/api/capsules/') and '/random' in self.path:
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                conn = get_db()
-                capsule = conn.execute('''
-                    SELECT * FROM capsules WHERE user_id = ? AND is_opened = 1 
-                    ORDER BY RANDOM() LIMIT 1
-                ''', (user_id,)).fetchone()
-                conn.close()
-                
-                if capsule:
-                    send_json_response(self, dict(capsule))
-                else:
-                    send_json_response(self, {'error': 'No opened capsules found'}, 404)
-            
-            # Get single capsule
-            elif self.path.startswith('/api/capsules/') and '/random' not in self.path and '/batch' not in self.path:
-                try:
-                    capsule_id = int(self.path.split('/')[-1])
-                    token = self.get_auth_token()
-                    user_id = get_user_from_token(token)
-                    
-                    if not user_id:
-                        send_json_response(self, {'error': 'Not authenticated'}, 401)
-                        return
-                    
-                    conn = get_db()
-                    capsule = conn.execute('SELECT * FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, user_id)).fetchone()
-                    conn.close()
-                    
-                    if capsule:
-                        send_json_response(self, dict(capsule))
-                    else:
-                        send_json_response(self, {'error': 'Capsule not found'}, 404)
-                except ValueError:
-                    send_json_response(self, {'error': 'Invalid capsule ID'}, 400)
-            
-            # Get mood statistics
-            elif self.path == '/api/stats/mood':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                conn = get_db()
-                capsules = conn.execute('SELECT mood FROM capsules WHERE user_id = ? AND mood != ""', (user_id,)).fetchall()
-                conn.close()
-                mood_counts = {}
-                for c in capsules:
-                    mood = c['mood']
-                    mood_counts[mood] = mood_counts.get(mood, 0) + 1
-                send_json_response(self, mood_counts)
-            
-            # Get templates
-            elif self.path == '/api/templates':
-                conn = get_db()
-                templates = conn.execute('SELECT * FROM templates ORDER BY is_default DESC, name').fetchall()
-                conn.close()
-                result = [dict(t) for t in templates]
-                send_json_response(self, result)
-
-            # Get user's categories
-            elif self.path == '/api/categories':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
+    # 完整列表：由 SQLite 直接生成 JSON
+    conn = get_db()
+    body = json_codec.query_json_array(conn, 'SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC', (user_id,))
+    conn.close()
+    send_json_bytes(handler, body)
 
-                conn = get_db()
-                categories = conn.execute('SELECT * FROM categories WHERE user_id = ? ORDER BY name', (user_id,)).fetchall()
-                conn.close()
-                result = [dict(c) for c in categories]
-                send_json_response(self, result)
 
-            else:
-                send_json_response(self, {'error': 'Not found'}, 404)
-        except Exception as e:
-            print(f"Error in GET: {str(e)}")
-            send_json_response(self, {'error': 'Internal server error'}, 500)
+# Full-text search
+@router.get('/api/capsules/search', auth=True)
+def search(handler):
+    conn = get_db()
+    try:
+        capsules, next_offset = search_capsules(conn, handler.user_id, handler.query)
+    except ValueError as e:
+        send_json_response(handler, {'error': str(e)}, 400)
+        return
+    finally:
+        conn.close()
+    send_json_response(handler, {'capsules': capsules, 'next_offset': next_offset})
+
+
+# Get random opened capsule
+@router.get('/api/capsules/random', auth=True)
+def get_random_capsule(handler):
+    conn = get_db()
+    capsule = conn.execute('''
+        SELECT * FROM capsules WHERE user_id = ? AND is_opened = 1
+        ORDER BY RANDOM() LIMIT 1
+    ''', (handler.user_id,)).fetchone()
+    conn.close()
 
-    def do_POST(self):
-        try:
-            # Register user
-            if self.path == '/api/auth/register':
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
-                
-                post_data = self.rfile.read(content_length)
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
-                
-                username = data.get('username', '').strip()
-                password = data.get('password', '')
-                email = data.get('email', '').strip()
-                
-                if not username or len(username) < 3:
-                    send_json_response(self, {'error': 'Username must be at least 3 characters'}, 400)
-                    return
-                
-                if not password or len(password) < 6:
-                    send_json_response(self, {'error': 'Password must be at least 6 characters'}, 400)
-                    return
-                
-                if not email or '@' not in email:
-                    send_json_response(self, {'error': 'Invalid email'}, 400)
-                    return
-                
-                conn = get_db()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT INTO users (username, password_hash, email, created_at)
-                        VALUES (?, ?, ?, ?)
-                    ''', (username, hash_password(password), email, datetime.now().isoformat()))
-                    conn.commit()
-                    user_id = cursor.lastrowid
-                    conn.close()
-                    send_json_response(self, {'message': 'User registered successfully', 'user_id': user_id}, 201)
-                except sqlite3.IntegrityError:
-                    conn.close()
-                    send_json_response(self, {'error': 'Username or email already exists'}, 409)
-            
-            # Login user
-            elif self.path == '/api/auth/login':
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
-                
-                post_data = self.rfile.read(content_length)
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
-                
-                username = data.get('username', '').strip()
-                password = data.get('password', '')
-                
-                conn = get_db()
-                user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-                conn.close()
-                
-                if not user or user['password_hash'] != hash_password(password):
-                    send_json_response(self, {'error': 'Invalid username or password'}, 401)
-                    return
-                
-                token = generate_token()
-                now = datetime.now()
-                expires_at = now.replace(year=now.year + 1)  # 1 年后过期
-
-                conn = get_db()
-                conn.execute('''
-                    INSERT INTO sessions (token, user_id, username, created_at, expires_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (token, user['id'], user['username'], now.isoformat(), expires_at.isoformat()))
-                conn.commit()
-                conn.close()
-
-                send_json_response(self, {
-                    'message': 'Login successful',
-                    'token': token,
-                    'user': {
-                        'id': user['id'],
-                        'username': user['username'],
-                        'email': user['email']
-                    }
-                })
-            
-            # Logout user
-            elif self.path == '/api/auth/logout':
-                token = self.get_auth_token()
-                if token:
-                    conn = get_db()
-                    conn.execute('DELETE FROM sessions WHERE token = ?', (token,))
-                    conn.commit()
-                    conn.close()
-                send_json_response(self, {'message': 'Logout successful'})
-            
-            # Upload image
-            elif self.path == '/api/upload':
-                token = self.get_auth_token()
-                print(f'[UPLOAD] Token received: {token}')
-
-                if not get_user_from_token(token):
-                    print('[UPLOAD] Authentication failed')
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
+    if capsule:
+        send_json_response(handler, dict(capsule))
+    else:
+        send_json_response(handler, {'error': 'No opened capsules found'}, 404)
 
-                content_type = self.headers.get('Content-Type', '')
-                content_length = int(self.headers.get('Content-Length', 0))
 
-                print(f'[UPLOAD] Content-Type: {content_type}')
-                print(f'[UPLOAD] Content-Length: {content_length}')
+# Get single capsule
+@router.get('/api/capsules/<int:capsule_id>', auth=True, etag='user')
+def get_capsule(handler, capsule_id):
+    conn = get_db()
+    capsule = conn.execute('SELECT * FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, handler.user_id)).fetchone()
+    conn.close()
 
-                if not content_type.startswith('multipart/form-data'):
-                    print('[UPLOAD] Invalid content type, expected multipart/form-data')
-                    send_json_response(self, {'error': 'Invalid content type, expected multipart/form-data'}, 400)
-                    return
+    if capsule:
+        send_json_response(handler, dict(capsule))
+    else:
+        send_json_response(handler, {'error': 'Capsule not found'}, 404)
 
-                if content_length == 0:
-                    print('[UPLOAD] No content length')
-                    send_json_response(self, {'error': 'No file uploaded'}, 400)
-                    return
 
-                # 读取请求体
-                body_bytes = self.rfile.read(content_length)
-                print(f'[UPLOAD] Read {len(body_bytes)} bytes')
+# Get mood statistics
+@router.get('/api/stats/mood', auth=True, etag='user')
+def get_mood_stats(handler):
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT mood, SUM(count) AS count FROM capsule_stats
+        WHERE user_id = ? AND mood != '' GROUP BY mood
+    ''', (handler.user_id,)).fetchall()
+    conn.close()
+    send_json_response(handler, {row['mood']: row['count'] for row in rows})
 
-# 使用 email 模块解析 multipart 数据（替代已弃用的 cgi）
-                try:
-                    # 解析 multipart/form-data
-                    msg = message_from_bytes(
-                        b'Content-Type: ' + content_type.encode() + b'\n\n' + body_bytes
-                    )
-
-                    file_data = None
-                    filename = None
-
-                    # 查找文件字段
-                    for part in msg.walk():
-                        content_disposition = part.get('Content-Disposition', '')
-                        if 'name="file"' in content_disposition:
-                            filename = part.get_filename()
-                            if filename:
-                                filename = os.path.basename(filename)
-                                file_data = part.get_payload(decode=True)
-                                break
-
-                    if not filename or not file_data:
-                        print('[UPLOAD] No file found in request')
-                        send_json_response(self, {'error': 'No file uploaded'}, 400)
-                        return
-
-                    print(f'[UPLOAD] Original filename: {filename}')
-
-                    if not allowed_file(filename):
-                        print(f'[UPLOAD] Invalid file type: {filename}')
-                        send_json_response(self, {'error': 'Invalid file type. Allowed: png, jpg, jpeg, gif, webp'}, 400)
-                        return
-
-                    if len(file_data) > MAX_FILE_SIZE:
-                        print(f'[UPLOAD] File too large: {len(file_data)} bytes')
-                        send_json_response(self, {'error': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB'}, 400)
-                        return
-
-                    ext = filename.rsplit('.', 1)[1].lower()
-                    new_filename = f"{uuid.uuid4().hex}.{ext}"
-                    filepath = os.path.join(UPLOAD_FOLDER, new_filename)
-
-                    with open(filepath, 'wb') as f:
-                        f.write(file_data)
-
-                    print(f'[UPLOAD] Success: {filename} ({len(file_data)} bytes) -> {new_filename}')
-                    send_json_response(self, {'path': f'/uploads/{new_filename}'})
-
-                except Exception as e:
-                    print(f'[UPLOAD] Error: {str(e)}')
-                    import traceback
-                    traceback.print_exc()
-                    send_json_response(self, {'error': f'Upload failed: {str(e)}'}, 500)
-            
-            # Create capsule
-            elif self.path == '/api/capsules':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
-                
-                post_data = self.rfile.read(content_length)
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
-                
-                errors = validate_capsule_data(data)
-                if errors:
-                    send_json_response(self, {'error': 'Validation failed', 'details': errors}, 400)
-                    return
-                
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date, image_path, category_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    data['title'].strip(),
-                    data['content'].strip(),
-                    data.get('mood', ''),
-                    json.dumps(data.get('tags', [])),
-                    datetime.now().isoformat(),
-                    data['open_date'],
-                    data.get('image_path', ''),
-                    data.get('category_id')
-                ))
-                conn.commit()
-                capsule_id = cursor.lastrowid
-                conn.close()
-                send_json_response(self, {'id': capsule_id, 'message': 'Capsule created successfully'}, 201)
-            
-            # Open capsule
-            elif self.path.endswith('/open'):
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                try:
-                    capsule_id = int(self.path.split('/')[-2])
-                    conn = get_db()
-                    now = datetime.now().isoformat()
-                    conn.execute('''
-                        UPDATE capsules SET is_opened = 1, open_time = ? WHERE id = ? AND user_id = ?
-                    ''', (now, capsule_id, user_id))
-                    conn.commit()
-                    conn.close()
-                    send_json_response(self, {'message': 'Capsule opened successfully'})
-                except ValueError:
-                    send_json_response(self, {'error': 'Invalid capsule ID'}, 400)
-            
-            # Batch delete capsules
-            elif self.path == '/api/capsules/batch':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
-                
-                post_data = self.rfile.read(content_length)
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
-                
-                capsule_ids = data.get('ids', [])
-                if not isinstance(capsule_ids, list) or len(capsule_ids) == 0:
-                    send_json_response(self, {'error': 'Invalid capsule IDs'}, 400)
-                    return
-                
-                conn = get_db()
-                placeholders = ','.join(['?'] * len(capsule_ids))
-                cursor = conn.cursor()
-                cursor.execute(f'DELETE FROM capsules WHERE id IN ({placeholders}) AND user_id = ?', capsule_ids + [user_id])
-                deleted_count = cursor.rowcount
-                conn.commit()
-                conn.close()
-                
-                send_json_response(self, {'message': f'Deleted {deleted_count} capsules'})
-            
-            # Batch export capsules
-            elif self.path == '/api/capsules/export':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
 
-                conn = get_db()
-                capsules = conn.execute('SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC', (user_id,)).fetchall()
-                conn.close()
+# 标签排行返回的标签数
+TOP_TAGS_LIMIT = 20
 
-                result = [dict(c) for c in capsules]
-                send_json_response(self, {'capsules': result, 'export_date': datetime.now().isoformat()})
+# Get capsule statistics
+# 只读取 capsule_stats / capsule_tag_stats 汇总表，耗时与胶囊数量无关
+@router.get('/api/stats', auth=True, etag='user')
+def get_stats(handler):
+    conn = get_db()
+    rows = conn.execute(
+        'SELECT mood, month, category_id, is_opened, count FROM capsule_stats WHERE user_id = ?',
+        (handler.user_id,)
+    ).fetchall()
+    tags = conn.execute('''
+        SELECT tag, count FROM capsule_tag_stats WHERE user_id = ?
+        ORDER BY count DESC, tag LIMIT ?
+    ''', (handler.user_id, TOP_TAGS_LIMIT)).fetchall()
+    conn.close()
 
-            # Create category
-            elif self.path == '/api/categories':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
+    total = opened = 0
+    moods = {}
+    months = {}
+    categories = {}
+    for row in rows:
+        count = row['count']
+        total += count
+        if row['is_opened']:
+            opened += count
+        if row['mood']:
+            moods[row['mood']] = moods.get(row['mood'], 0) + count
+        month = months.setdefault(row['month'], {'month': row['month'], 'count': 0, 'opened': 0})
+        month['count'] += count
+        if row['is_opened']:
+            month['opened'] += count
+        # 无分类的胶囊以 0 表示
+        category_id = str(row['category_id'])
+        categories[category_id] = categories.get(category_id, 0) + count
+
+    send_json_response(handler, {
+        'total': total,
+        'opened': opened,
+        'sealed': total - opened,
+        'moods': moods,
+        'months': [months[month] for month in sorted(months)],
+        'categories': categories,
+        'tags': [{'tag': row['tag'], 'count': row['count']} for row in tags],
+    })
+
+
+# Get templates
+@router.get('/api/templates', etag='shared')
+def list_templates(handler):
+    conn = get_db()
+    if handler.query.get('tag'):
+        # ?tag=旅行：按标签筛选（使用 template_tags 索引）
+        templates = conn.execute('''
+            SELECT * FROM templates
+            WHERE id IN (SELECT template_id FROM template_tags WHERE tag = ?)
+            ORDER BY is_default DESC, name
+        ''', (handler.query['tag'],)).fetchall()
+    else:
+        templates = conn.execute('SELECT * FROM templates ORDER BY is_default DESC, name').fetchall()
+    conn.close()
+    result = [dict(t) for t in templates]
+    send_json_response(handler, result)
 
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
 
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
+# 标签补全返回的标签数
+TAG_SUGGESTION_LIMIT = 10
 
-                post_data = self.rfile.read(content_length)
+# Tag autocomplete
+# ?prefix=旅：返回以 prefix 开头的标签，按使用次数排序（读取 capsule_tag_stats 主键范围）
+@router.get('/api/tags', auth=True, etag='user')
+def suggest_tags(handler):
+    prefix = handler.query.get('prefix', '')
+    try:
+        limit = max(1, min(int(handler.query.get('limit', TAG_SUGGESTION_LIMIT)), CAPSULE_PAGE_MAX))
+    except ValueError:
+        send_json_response(handler, {'error': 'Invalid limit'}, 400)
+        return
 
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
+    conn = get_db()
+    # U+10FFFF 是最大的码位，[prefix, prefix + U+10FFFF) 覆盖所有以 prefix 开头的标签
+    rows = conn.execute('''
+        SELECT tag, count FROM capsule_tag_stats
+        WHERE user_id = ? AND tag >= ? AND tag < ?
+        ORDER BY count DESC, tag LIMIT ?
+    ''', (handler.user_id, prefix, prefix + '\U0010ffff', limit)).fetchall()
+    conn.close()
+    send_json_response(handler, {'tags': [{'tag': row['tag'], 'count': row['count']} for row in rows]})
 
-                name = data.get('name', '').strip()
-                color = data.get('color', '#667eea')
-                icon = data.get('icon', 'bi-folder')
 
-                if not name:
-                    send_json_response(self, {'error': 'Category name is required'}, 400)
-                    return
+# Get user's categories
+@router.get('/api/categories', auth=True, etag='user')
+def list_categories(handler):
+    conn = get_db()
+    categories = conn.execute('SELECT * FROM categories WHERE user_id = ? ORDER BY name', (handler.user_id,)).fetchall()
+    conn.close()
+    result = [dict(c) for c in categories]
+    send_json_response(handler, result)
 
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO categories (user_id, name, color, icon, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, name, color, icon, datetime.now().isoformat()))
-                conn.commit()
-                category_id = cursor.lastrowid
-                conn.close()
-
-                send_json_response(self, {'id': category_id, 'message': 'Category created successfully'}, 201)
-
-            # 手动触发邮件提醒检查
-            elif self.path == '/api/reminders/check':
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                try:
-                    import email_sender
-                    
-                    conn = get_db()
-                    
-                    # 获取当前用户所有未开启且未发送提醒的胶囊
-                    today = datetime.now()
-                    future_7days = today + timedelta(days=7)
-                    
-                    query = '''
-                        SELECT c.id, c.title, c.open_date, c.email_sent, u.username, u.email
-                        FROM capsules c
-                        JOIN users u ON c.user_id = u.id
-                        WHERE c.user_id = ?
-                          AND c.is_opened = 0 
-                          AND c.email_sent = 0
-                          AND c.open_date BETWEEN ? AND ?
-                        ORDER BY c.open_date ASC
-                    '''
-                    
-                    capsules = conn.execute(query, (user_id, today.strftime('%Y-%m-%d'), future_7days.strftime('%Y-%m-%d'))).fetchall()
-                    
-                    sent_count = 0
-                    failed_count = 0
-                    results = []
-                    
-                    for capsule in capsules:
-                        capsule_id = capsule['id']
-                        title = capsule['title']
-                        open_date = capsule['open_date']
-                        username = capsule['username']
-                        email = capsule['email']
-                        
-                        # 发送邮件
-                        success, error = email_sender.send_reminder_email(email, username, title, open_date)
-                        
-                        if success:
-                            # 更新邮件发送状态
-                            conn.execute('UPDATE capsules SET email_sent = 1 WHERE id = ?', (capsule_id,))
-                            conn.commit()
-                            sent_count += 1
-                            results.append({
-                                'capsule_id': capsule_id,
-                                'title': title,
-                                'status': 'sent',
-                                'email': email
-                            })
-                        else:
-                            failed_count += 1
-                            results.append({
-                                'capsule_id': capsule_id,
-                                'title': title,
-                                'status': 'failed',
-                                'error': error
-                            })
-                    
-                    conn.close()
-                    
-                    send_json_response({
-                        'total': len(capsules),
-                        'sent': sent_count,
-                        'failed': failed_count,
-                        'results': results
-                    })
-                    
-                except Exception as e:
-                    print(f"Error in reminders check: {str(e)}")
-                    send_json_response(self, {'error': str(e)}, 500)
 
-            else:
-                send_json_response(self, {'error': 'Not found'}, 404)
-        except Exception as e:
-            print(f"Error in POST: {str(e)}")
-            send_json_response(self, {'error': 'Internal server error'}, 500)
+# Register user
+@router.post('/api/auth/register', json_body=True)
+def register(handler):
+    data = handler.data
+    username = data.get('username', '').strip()
+    password = data.get('password', '')
+    email = data.get('email', '').strip()
 
-    def do_PUT(self):
-        print('do_PUT called for path:', self.path)
-        try:
-            if self.path.startswith('/api/capsules/'):
-                print('PUT /api/capsules - Request received')
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
-                print(f'PUT /api/capsules - Token: {token}, User ID: {user_id}')
-                
-                if not user_id:
-                    print('PUT /api/capsules - Not authenticated')
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
-                
-                try:
-                    capsule_id = int(self.path.split('/')[-1])
-                except ValueError:
-                    send_json_response(self, {'error': 'Invalid capsule ID'}, 400)
-                    return
-                
-                print(f'PUT /api/capsules - Updating capsule {capsule_id}')
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    send_json_response(self, {'error': 'No data provided'}, 400)
-                    return
-                
-                post_data = self.rfile.read(content_length)
-                print(f'PUT /api/capsules - Received {content_length} bytes')
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                    print(f'PUT /api/capsules - Parsed data: {data}')
-                except json.JSONDecodeError:
-                    send_json_response(self, {'error': 'Invalid JSON'}, 400)
-                    return
-                
-                errors = validate_capsule_data(data)
-                if errors:
-                    print(f'PUT /api/capsules - Validation errors: {errors}')
-                    send_json_response(self, {'error': 'Validation failed', 'details': errors}, 400)
-                    return
+    if not username or len(username) < 3:
+        send_json_response(handler, {'error': 'Username must be at least 3 characters'}, 400)
+        return
 
-                # 检查胶囊是否已开启
-                conn = get_db()
-                capsule = conn.execute('SELECT is_opened FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, user_id)).fetchone()
-                if not capsule:
-                    conn.close()
-                    send_json_response(self, {'error': 'Capsule not found'}, 404)
-                    return
+    if not password or len(password) < 6:
+        send_json_response(handler, {'error': 'Password must be at least 6 characters'}, 400)
+        return
 
-                if capsule['is_opened']:
-                    conn.close()
-                    send_json_response(self, {'error': 'Cannot edit an opened capsule. Once opened, a time capsule cannot be modified.'}, 400)
-                    return
+    if not email or '@' not in email:
+        send_json_response(handler, {'error': 'Invalid email'}, 400)
+        return
 
-                cursor = conn.cursor()
-                print('PUT /api/capsules - Executing UPDATE query...')
-                cursor.execute('''
-                    UPDATE capsules SET title = ?, content = ?, mood = ?, tags = ?, open_date = ?, image_path = ?, category_id = ?
-                    WHERE id = ? AND user_id = ?
-                ''', (
-                    data['title'].strip(),
-                    data['content'].strip(),
-                    data.get('mood', ''),
-                    json.dumps(data.get('tags', [])),
-                    data['open_date'],
-                    data.get('image_path', ''),
-                    data.get('category_id'),
-                    capsule_id,
-                    user_id
-                ))
-                conn.commit()
-                updated_count = cursor.rowcount
-                print(f'PUT /api/capsules - Updated {updated_count} rows')
-                conn.close()
-                
-                if updated_count > 0:
-                    send_json_response(self, {'message': 'Capsule updated successfully'})
-                else:
-                    send_json_response(self, {'error': 'Capsule not found'}, 404)
-            else:
-                send_json_response(self, {'error': 'Not found'}, 404)
-        except Exception as e:
-            print(f"Error in PUT: {str(e)}")
-            send_json_response(self, {'error': 'Internal server error'}, 500)
+    try:
+        password_hash = passwords.hash_in_pool(password)
+    except passwords.HashPoolBusy:
+        send_json_response(handler, {'error': 'Server busy, please try again'}, 503)
+        return
 
-    def do_DELETE(self):
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO users (username, password_hash, email, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (username, password_hash, email, datetime.now().isoformat()))
+        conn.commit()
+        user_id = cursor.lastrowid
+        conn.close()
+        send_json_response(handler, {'message': 'User registered successfully', 'user_id': user_id}, 201)
+    except sqlite3.IntegrityError:
+        conn.close()
+        send_json_response(handler, {'error': 'Username or email already exists'}, 409)
+
+
+# Login user
+@router.post('/api/auth/login', json_body=True)
+def login(handler):
+    username = handler.data.get('username', '').strip()
+    password = handler.data.get('password', '')
+
+    conn = get_db()
+    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+    conn.close()
+
+    try:
+        verified = passwords.verify_in_pool(password, user['password_hash'] if user else None)
+        if verified and passwords.needs_rehash(user['password_hash']):
+            # 旧的 sha256 哈希或旧参数：换成当前配置的哈希
+            conn = get_db()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                         (passwords.hash_in_pool(password), user['id'], user['password_hash']))
+            conn.commit()
+            conn.close()
+    except passwords.HashPoolBusy:
+        send_json_response(handler, {'error': 'Server busy, please try again'}, 503)
+        return
+
+    if not verified:
+        send_json_response(handler, {'error': 'Invalid username or password'}, 401)
+        return
+
+    token = generate_token()
+    # created_at 保存到微秒（同一秒内的多次登录也能排出先后），expires_at 取整秒
+    now = time.time()
+
+    conn = get_db()
+    conn.execute('''
+        INSERT INTO sessions (token, user_id, created_at, expires_at)
+        VALUES (?, ?, ?, ?)
+    ''', (token, user['id'], now, int(now) + SESSION_LIFETIME))
+    # 超出每用户会话数上限时注销最早的会话（新会话本身不参与排序，不会注销自己）
+    evicted = [row['token'] for row in conn.execute('''
+        DELETE FROM sessions WHERE token IN (
+            SELECT token FROM sessions WHERE user_id = ? AND token != ?
+            ORDER BY created_at DESC LIMIT -1 OFFSET ?
+        ) RETURNING token
+    ''', (user['id'], token, max(MAX_SESSIONS_PER_USER - 1, 0)))]
+    conn.commit()
+    conn.close()
+    for evicted_token in evicted:
+        session_cache.invalidate(evicted_token)
+
+    send_json_response(handler, {
+        'message': 'Login successful',
+        'token': token,
+        'user': {
+            'id': user['id'],
+            'username': user['username'],
+            'email': user['email']
+        }
+    })
+
+
+# Logout user
+@router.post('/api/auth/logout')
+def logout(handler):
+    token = handler.get_auth_token()
+    if token:
+        _delete_session(token)
+    send_json_response(handler, {'message': 'Logout successful'})
+
+
+# Upload image
+@router.post('/api/upload', auth=True)
+def upload_image(handler):
+    content_type = handler.headers.get('Content-Type', '')
+    content_length = int(handler.headers.get('Content-Length', 0))
+
+    if not content_type.startswith('multipart/form-data'):
+        print('[UPLOAD] Invalid content type, expected multipart/form-data')
+        send_json_response(handler, {'error': 'Invalid content type, expected multipart/form-data'}, 400)
+        return
+
+    if content_length == 0:
+        print('[UPLOAD] No content length')
+        send_json_response(handler, {'error': 'No file uploaded'}, 400)
+        return
+
+    if content_length > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        print(f'[UPLOAD] Request too large: {content_length} bytes')
+        handler.close_connection = True
+        send_json_response(handler, {'error': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB'}, 400)
+        return
+
+    # 流式解析 multipart 数据，文件分块写入临时文件
+    try:
+        boundary = multipart_parser.parse_boundary(content_type)
+        upload = multipart_parser.receive_file(
+            handler.rfile, content_length, boundary, 'file',
+            UPLOAD_FOLDER, MAX_FILE_SIZE, allowed_file
+        )
+        handler.body_consumed = True
+    except multipart_parser.MultipartError as e:
+        print(f'[UPLOAD] Rejected: {e}')
+        # 请求体可能没有读完，不能复用该连接
+        handler.close_connection = True
+        send_json_response(handler, {'error': str(e)}, 400)
+        return
+
+    if upload is None:
+        print('[UPLOAD] No file found in request')
+        send_json_response(handler, {'error': 'No file uploaded'}, 400)
+        return
+
+    try:
+        ext = upload.filename.rsplit('.', 1)[1].lower()
+
+        # 按内容哈希存储，相同文件只保存一份
+        image_path, filepath, deduplicated = upload_store.store_file(
+            upload.path, upload.sha256, ext, upload.size
+        )
+
+        metrics.upload_bytes.inc(amount=upload.size)
+        metrics.uploads.inc('deduplicated' if deduplicated else 'stored')
+        if not deduplicated:
+            # 后台生成缩略图
+            thumbnails.submit(filepath)
+        send_json_response(handler, {'path': image_path})
+
+    except Exception as e:
+        upload.discard()
+        print(f'[UPLOAD] Error: {str(e)}')
+        import traceback
+        traceback.print_exc()
+        send_json_response(handler, {'error': f'Upload failed: {str(e)}'}, 500)
+
+
+# Create capsule
+@router.post('/api/capsules', auth=True, json_body=True)
+def create_capsule(handler):
+    data = handler.data
+    errors = validate_capsule_data(data)
+    if errors:
+        send_json_response(handler, {'error': 'Validation failed', 'details': errors}, 400)
+        return
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date, image_path, category_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        handler.user_id,
+        data['title'].strip(),
+        data['content'].strip(),
+        data.get('mood', ''),
+        json.dumps(data.get('tags', [])),
+        datetime.now().isoformat(),
+        data['open_date'],
+        data.get('image_path', ''),
+        data.get('category_id')
+    ))
+    conn.commit()
+    capsule_id = cursor.lastrowid
+    conn.close()
+
+    # 安排开启提醒
+    reminder_scheduler.scheduler.schedule(capsule_id, data['open_date'])
+    send_json_response(handler, {'id': capsule_id, 'message': 'Capsule created successfully'}, 201)
+
+
+# Open capsule
+@router.post('/api/capsules/<int:capsule_id>/open', auth=True)
+def open_capsule(handler, capsule_id):
+    conn = get_db()
+    now = datetime.now().isoformat()
+    conn.execute('''
+        UPDATE capsules SET is_opened = 1, open_time = ? WHERE id = ? AND user_id = ?
+    ''', (now, capsule_id, handler.user_id))
+    conn.commit()
+    conn.close()
+    send_json_response(handler, {'message': 'Capsule opened successfully'})
+
+
+# Batch delete capsules
+@router.post('/api/capsules/batch', auth=True, json_body=True)
+def batch_delete_capsules(handler):
+    capsule_ids = handler.data.get('ids', [])
+    if not isinstance(capsule_ids, list) or len(capsule_ids) == 0:
+        send_json_response(handler, {'error': 'Invalid capsule IDs'}, 400)
+        return
+
+    conn = get_db()
+    placeholders = ','.join(['?'] * len(capsule_ids))
+    cursor = conn.cursor()
+    cursor.execute(f'DELETE FROM capsules WHERE id IN ({placeholders}) AND user_id = ? RETURNING id', capsule_ids + [handler.user_id])
+    deleted_ids = [row['id'] for row in cursor.fetchall()]
+    deleted_count = len(deleted_ids)
+    conn.commit()
+    conn.close()
+
+    for deleted_id in deleted_ids:
+        reminder_scheduler.scheduler.cancel(deleted_id)
+
+    # 由后台线程回收不再被引用的图片
+    upload_store.collector.notify()
+
+    send_json_response(handler, {'message': f'Deleted {deleted_count} capsules'})
+
+
+# Batch export capsules
+# ?format=json（默认）、ndjson 或 zip（包含图片），分块流式发送
+@router.post('/api/capsules/export', auth=True)
+def export_capsules(handler):
+    export_format = handler.query.get('format', 'json')
+    if export_format not in export_stream.EXPORT_FORMATS:
+        send_json_response(handler, {'error': 'Unsupported export format'}, 400)
+        return
+
+    conn = get_db()
+    try:
+        rows = json_codec.iter_json_rows(conn, 'SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC', (handler.user_id,))
+        image_paths = ()
+        if export_format == 'zip':
+            # 使用独立游标，与 rows 交替读取互不影响
+            image_paths = (row['image_path'] for row in conn.execute('''
+                SELECT DISTINCT image_path FROM capsules
+                WHERE user_id = ? AND image_path LIKE '/uploads/%'
+            ''', (handler.user_id,)))
+        export_stream.stream_export(handler, export_format, rows, datetime.now().isoformat(),
+                                    image_paths, resolve_upload_path)
+    finally:
+        conn.close()
+
+
+# Bulk import capsules
+# 请求体为 NDJSON，每行一个胶囊（可直接使用 ?format=ndjson 导出的文件）
+@router.post('/api/capsules/import', auth=True)
+def import_capsules(handler):
+    try:
+        content_length = int(handler.headers['Content-Length'])
+    except (TypeError, ValueError):
+        send_json_response(handler, {'error': 'Content-Length required'}, 411)
+        return
+    if content_length > MAX_IMPORT_SIZE:
+        send_json_response(handler, {'error': f'Import file too large (max {MAX_IMPORT_SIZE // (1024 * 1024)}MB)'}, 413)
+        return
+
+    handler.body_consumed = True
+    conn = get_db()
+    try:
+        lines = capsule_import.iter_lines(handler.rfile, content_length)
+        result = capsule_import.import_capsules(conn, handler.user_id, lines, validate_capsule_data)
+    except Exception:
+        # 请求体可能没有读完，不能再复用连接
+        handler.close_connection = True
+        raise
+    finally:
+        conn.close()
+    print(f"[IMPORT] User {handler.user_id}: {result['imported']} imported, {result['failed']} failed")
+    send_json_response(handler, result)
+
+
+# Create category
+@router.post('/api/categories', auth=True, json_body=True)
+def create_category(handler):
+    name = handler.data.get('name', '').strip()
+    color = handler.data.get('color', '#667eea')
+    icon = handler.data.get('icon', 'bi-folder')
+
+    if not name:
+        send_json_response(handler, {'error': 'Category name is required'}, 400)
+        return
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO categories (user_id, name, color, icon, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (handler.user_id, name, color, icon, datetime.now().isoformat()))
+    conn.commit()
+    category_id = cursor.lastrowid
+    conn.close()
+
+    send_json_response(handler, {'id': category_id, 'message': 'Category created successfully'}, 201)
+
+
+# 手动触发邮件提醒检查
+@router.post('/api/reminders/check', auth=True)
+def check_reminders(handler):
+    try:
+        conn = get_db()
+
+        # 获取当前用户所有未开启且未发送提醒的胶囊
+        today = datetime.now()
+        future_7days = today + timedelta(days=7)
+
+        query = '''
+            SELECT c.id, c.title, c.open_date, c.email_sent, u.username, u.email
+            FROM capsules c
+            JOIN users u ON c.user_id = u.id
+            WHERE c.user_id = ?
+              AND c.is_opened = 0
+              AND c.email_sent = 0
+              AND c.open_date BETWEEN ? AND ?
+            ORDER BY c.open_date ASC
+        '''
+
+        capsules = conn.execute(query, (handler.user_id, today.strftime('%Y-%m-%d'), future_7days.strftime('%Y-%m-%d'))).fetchall()
+
+        # 只写入发件箱，由后台线程发送
+        queued_count = outbox.enqueue_reminders(conn, capsules)
+        conn.commit()
+        conn.close()
+        outbox.worker.notify()
+
+        send_json_response(handler, {
+            'total': len(capsules),
+            'queued': queued_count,
+            'results': [
+                {'capsule_id': capsule['id'], 'title': capsule['title'], 'status': 'queued', 'email': capsule['email']}
+                for capsule in capsules
+            ]
+        })
+
+    except Exception as e:
+        print(f"Error in reminders check: {str(e)}")
+        send_json_response(handler, {'error': str(e)}, 500)
+
+
+# Update capsule
+@router.put('/api/capsules/<int:capsule_id>', auth=True, json_body=True)
+def update_capsule(handler, capsule_id):
+    user_id = handler.user_id
+    data = handler.data
+
+    errors = validate_capsule_data(data)
+    if errors:
+        send_json_response(handler, {'error': 'Validation failed', 'details': errors}, 400)
+        return
+
+    # 检查胶囊是否已开启
+    conn = get_db()
+    capsule = conn.execute('SELECT is_opened FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, user_id)).fetchone()
+    if not capsule:
+        conn.close()
+        send_json_response(handler, {'error': 'Capsule not found'}, 404)
+        return
+
+    if capsule['is_opened']:
+        conn.close()
+        send_json_response(handler, {'error': 'Cannot edit an opened capsule. Once opened, a time capsule cannot be modified.'}, 400)
+        return
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE capsules SET title = ?, content = ?, mood = ?, tags = ?, open_date = ?, image_path = ?, category_id = ?
+        WHERE id = ? AND user_id = ?
+    ''', (
+        data['title'].strip(),
+        data['content'].strip(),
+        data.get('mood', ''),
+        json.dumps(data.get('tags', [])),
+        data['open_date'],
+        data.get('image_path', ''),
+        data.get('category_id'),
+        capsule_id,
+        user_id
+    ))
+    conn.commit()
+    updated_count = cursor.rowcount
+    conn.close()
+
+    if updated_count > 0:
+        # 开启日期可能已修改，重新安排提醒
+        reminder_scheduler.scheduler.schedule(capsule_id, data['open_date'])
+
+    # 更换图片后由后台线程回收旧图片
+    upload_store.collector.notify()
+
+    if updated_count > 0:
+        send_json_response(handler, {'message': 'Capsule updated successfully'})
+    else:
+        send_json_response(handler, {'error': 'Capsule not found'}, 404)
+
+
+# Delete capsule
+@router.delete('/api/capsules/<int:capsule_id>', auth=True)
+def delete_capsule(handler, capsule_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, handler.user_id))
+    deleted_count = cursor.rowcount
+    conn.commit()
+    conn.close()
+
+    if deleted_count > 0:
+        reminder_scheduler.scheduler.cancel(capsule_id)
+
+    # 由后台线程回收不再被引用的图片
+    upload_store.collector.notify()
+
+    if deleted_count > 0:
+        send_json_response(handler, {'message': 'Capsule deleted successfully'})
+    else:
+        send_json_response(handler, {'error': 'Capsule not found'}, 404)
+
+
+# Delete category
+@router.delete('/api/categories/<int:category_id>', auth=True)
+def delete_category(handler, category_id):
+    user_id = handler.user_id
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # 将该分类下的胶囊的 category_id 设为 NULL
+    cursor.execute('UPDATE capsules SET category_id = NULL WHERE category_id = ? AND user_id = ?', (category_id, user_id))
+
+    # 删除分类
+    cursor.execute('DELETE FROM categories WHERE id = ? AND user_id = ?', (category_id, user_id))
+    deleted_count = cursor.rowcount
+    conn.commit()
+    conn.close()
+
+    if deleted_count > 0:
+        send_json_response(handler, {'message': 'Category deleted successfully'})
+    else:
+        send_json_response(handler, {'error': 'Category not found'}, 404)
+
+
+# 设置后 /metrics 需要 Authorization: Bearer <token>
+METRICS_TOKEN = os.environ.get('CAPSULE_METRICS_TOKEN')
+
+@metrics.registry.add_collector
+def collect_runtime_metrics():
+    """连接池、会话、提醒和发件箱的当前状态（每次抓取时读取）"""
+    pool_stats = db.pool.stats()
+    cache_stats = session_cache.stats()
+    reaper_stats = session_reaper.stats()
+    conn = get_db()
+    try:
+        outbox_stats = outbox.stats(conn)
+    finally:
+        conn.close()
+    return [
+        ('capsule_db_pool_max_connections', 'gauge', 'Database connection pool size', pool_stats['max_size']),
+        ('capsule_db_pool_idle_connections', 'gauge', 'Idle pooled database connections', pool_stats['idle']),
+        ('capsule_session_cache_entries', 'gauge', 'Sessions held in the in-process cache', cache_stats['size']),
+        ('capsule_session_cache_hits_total', 'counter', 'Session cache hits', cache_stats['hits']),
+        ('capsule_session_cache_misses_total', 'counter', 'Session cache misses', cache_stats['misses']),
+        ('capsule_session_lookups_total', 'counter', 'Session table lookups on cache miss', cache_stats['db_lookups']),
+        ('capsule_session_lookup_seconds_total', 'counter', 'Time spent in session table lookups', cache_stats['db_lookup_seconds']),
+        ('capsule_session_lookup_max_seconds', 'gauge', 'Slowest session table lookup', cache_stats['db_lookup_max_ms'] / 1000),
+        ('capsule_sessions', 'gauge', 'Rows in the sessions table after the last reaper pass', reaper_stats['table_size']),
+        ('capsule_sessions_reaped_total', 'counter', 'Expired sessions deleted by the reaper', reaper_stats['reaped_total']),
+        ('capsule_reminders_scheduled', 'gauge', 'Capsule reminders waiting in the scheduler', reminder_scheduler.scheduler.pending_count()),
+        ('capsule_email_outbox_pending', 'gauge', 'Emails waiting to be sent', outbox_stats['pending'] + outbox_stats['sending']),
+        ('capsule_email_outbox_dead', 'gauge', 'Emails that permanently failed', outbox_stats['dead']),
+    ]
+
+# Prometheus metrics
+@router.get('/metrics')
+def get_metrics(handler):
+    if METRICS_TOKEN and not secrets.compare_digest(handler.get_auth_token() or '', METRICS_TOKEN):
+        send_json_response(handler, {'error': 'Not authenticated'}, 401)
+        return
+    body = metrics.registry.render()
+    handler.send_response(200)
+    handler.send_header('Content-type', metrics.CONTENT_TYPE)
+    handler.send_header('Cache-Control', 'no-store')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # 使用持久连接，所有响应都必须带 Content-Length
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # 响应头和响应体分两次写出，持久连接上 Nagle 算法与客户端延迟确认叠加会让每个响应多等约 40ms
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # pool 模式下一次只处理已经到达的请求，之后连接空闲时标记 idle，
+        # 由服务器交给选择器等待下一个请求，不占用工作线程
+        if not getattr(self.server, 'parks_idle_connections', False):
+            super().handle()
+            return
+        self.idle = False
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.request_buffered():
+                self.idle = True
+                return
+            self.handle_one_request()
+
+    def resume(self):
+        """空闲连接上有新请求到达时，由服务器在工作线程中调用"""
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def finish(self):
+        if getattr(self, 'idle', False):
+            # 连接保持打开，rfile 中可能还缓存着下一个请求的数据
+            self.wfile.flush()
+            return
+        super().finish()
+
+    def request_buffered(self):
+        """连接上是否已经有下一个请求的数据（不阻塞）"""
+        self.connection.settimeout(0)
         try:
-            if self.path.startswith('/api/capsules/'):
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
 
-                if not user_id:
-                    send_json_response(self, {'error': 'Not authenticated'}, 401)
-                    return
+    def log_message(self, format, *args):
+        pass
 
-                try:
-                    capsule_id = int(self.path.split('/')[-1])
-                except ValueError:
-                    send_json_response(self, {'error': 'Invalid capsule ID'}, 400)
-                    return
+    def log_request(self, code='-', size='-'):
+        # send_response() 会调用它，借此记下状态码供指标使用
+        self.response_status = code
 
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM capsules WHERE id = ? AND user_id = ?', (capsule_id, user_id))
-                deleted_count = cursor.rowcount
-                conn.commit()
-                conn.close()
+    def get_auth_token(self):
+        auth_header = self.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            return auth_header[7:]
+        return None
 
-                if deleted_count > 0:
-                    send_json_response(self, {'message': 'Capsule deleted successfully'})
-                else:
-                    send_json_response(self, {'error': 'Capsule not found'}, 404)
+    def read_json_body(self):
+        """
+        读取并解析 JSON 请求体
 
-            elif self.path.startswith('/api/categories/'):
-                token = self.get_auth_token()
-                user_id = get_user_from_token(token)
+        Returns:
+            dict: 解析后的数据；请求体为空或格式错误时已发送 400 响应并返回 None
+        """
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length == 0:
+            send_json_response(self, {'error': 'No data provided'}, 400)
+            return None
 
-                if not user_id:
+        post_data = self.rfile.read(content_length)
+        self.body_consumed = True
+
+        try:
+            return json_codec.loads(post_data)
+        except json_codec.JSONDecodeError:
+            send_json_response(self, {'error': 'Invalid JSON'}, 400)
+            return None
+
+    def discard_request_body(self):
+        """
+        处理函数没有读取请求体时（如未登录被拒绝），把请求体读掉，
+        否则它会被当作同一连接上的下一个请求；请求体过大或长度未知时直接关闭连接
+        """
+        if self.body_consumed or self.close_connection:
+            return
+        if 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.close_connection = True
+            return
+        if length <= 0:
+            return
+        if length > MAX_DISCARD_BODY:
+            self.close_connection = True
+            return
+        self.rfile.read(length)
+
+    def dispatch(self, method):
+        """按路由表分发请求，依次执行路由选项对应的中间件（登录校验、JSON 解析）"""
+        parsed = urllib.parse.urlsplit(self.path)
+        self.body_consumed = False
+        self.response_status = None
+        route_label = 'unmatched'
+        started = time.perf_counter()
+        db.reset_query_time()
+        metrics.in_flight.inc()
+        try:
+            try:
+                route, params = router.resolve(method, parsed.path)
+            except MethodNotAllowed as e:
+                send_json_response(self, {'error': 'Method not allowed'}, 405, {'Allow': ', '.join(e.allowed)})
+                return
+            except RouteNotFound:
+                send_json_response(self, {'error': 'Not found'}, 404)
+                return
+            except InvalidPathParameter as e:
+                send_json_response(self, {'error': PATH_PARAM_ERRORS.get(e.name, str(e))}, 400)
+                return
+
+            route_label = route.pattern
+            self.query = dict(urllib.parse.parse_qsl(parsed.query))
+            self.user_id = None
+            self.data = None
+            self.response_etag = None
+
+            if route.options.get('auth'):
+                self.user_id = get_user_from_token(self.get_auth_token())
+                if not self.user_id:
                     send_json_response(self, {'error': 'Not authenticated'}, 401)
                     return
 
-                try:
-                    category_id = int(self.path.split('/')[-1])
-                except ValueError:
-                    send_json_response(self, {'error': 'Invalid category ID'}, 400)
+            etag_scope = route.options.get('etag')
+            if etag_scope and self.query.get('status') in TIME_DEPENDENT_STATUSES:
+                # 结果随当前时间变化，没有写入也可能不同，不做 ETag
+                etag_scope = None
+            if etag_scope:
+                version_user_id = self.user_id if etag_scope == 'user' else SHARED_VERSION_USER_ID
+                self.response_etag = make_etag(version_user_id, get_data_version(version_user_id))
+                if_none_match = self.headers.get('If-None-Match')
+                if if_none_match and static_files.etag_matches(if_none_match, self.response_etag):
+                    send_not_modified(self, self.response_etag)
                     return
 
-                conn = get_db()
-                cursor = conn.cursor()
+            if route.options.get('json_body'):
+                self.data = self.read_json_body()
+                if self.data is None:
+                    return
 
-                # 将该分类下的胶囊的 category_id 设为 NULL
-                cursor.execute('UPDATE capsules SET category_id = NULL WHERE category_id = ? AND user_id = ?', (category_id, user_id))
+            route.handler(self, **params)
+        except Exception as e:
+            print(f"Error in {method}: {str(e)}")
+            send_json_response(self, {'error': 'Internal server error'}, 500)
+        finally:
+            self.discard_request_body()
+            metrics.in_flight.dec()
+            metrics.observe_request(method, route_label, self.response_status or 'none', time.perf_counter() - started, db.query_time())
 
-                # 删除分类
-                cursor.execute('DELETE FROM categories WHERE id = ? AND user_id = ?', (category_id, user_id))
-                deleted_count = cursor.rowcount
-                conn.commit()
-                conn.close()
+    def do_OPTIONS(self):
+        send_cors_response(self)
+        self.body_consumed = False
+        self.discard_request_body()
+
+    def do_GET(self):
+        self.dispatch('GET')
 
-                if deleted_count > 0:
-                    send_json_response(self, {'message': 'Category deleted successfully'})
-                else:
-                    send_json_response(self, {'error': 'Category not found'}, 404)
+    def do_POST(self):
+        self.dispatch('POST')
 
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+class PooledHTTPServer(HTTPServer):
+    """
+    使用有界线程池处理请求的 HTTPServer
+
+    所有工作线程都在忙时，主循环不再 accept 新连接，
+    新连接在内核的 accept 队列（backlog）中等待，而不是无限堆积线程。
+
+    工作线程只处理连接上已经到达的请求；持久连接空闲时交给后台线程的选择器，
+    下一个请求到达后再分配工作线程，空闲超过 KEEPALIVE_TIMEOUT 秒的连接被关闭。
+    空闲的浏览器连接因此不会占满线程池。
+    """
+
+    parks_idle_connections = True
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT):
+        # request_queue_size 必须在 server_activate() 调用 listen() 之前设置
+        self.request_queue_size = backlog
+        self.workers = workers
+        self.keepalive_timeout = keepalive_timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='capsule-worker')
+        super().__init__(server_address, handler_class)
+
+        # 空闲连接：handler -> 关闭时间（超时相同，按加入顺序即按关闭时间排序）
+        self._idle = OrderedDict()
+        self._parked = []
+        self._idle_lock = threading.Lock()
+        self._idle_stop = False
+        self._idle_selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._idle_selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._idle_thread = threading.Thread(target=self._idle_loop, name='capsule-keepalive', daemon=True)
+        self._idle_thread.start()
+
+    def process_request(self, request, client_address):
+        # 等待空闲的工作线程，保证排队请求数不超过线程池大小
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # 线程池已关闭
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._release_connection(request, handler)
+
+    def _resume_worker(self, handler):
+        try:
+            handler.resume()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            self._release_connection(handler.request, handler)
+
+    def _release_connection(self, request, handler):
+        """请求处理完毕：空闲的持久连接交给选择器，其余关闭；释放工作线程"""
+        try:
+            if handler is not None and getattr(handler, 'idle', False):
+                self._park(handler)
             else:
-                send_json_response(self, {'error': 'Not found'}, 404)
-        except Exception as e:
-            print(f"Error in DELETE: {str(e)}")
-            send_json_response(self, {'error': 'Internal server error'}, 500)
+                self.shutdown_request(request)
+        finally:
+            self._slots.release()
+
+    def _park(self, handler):
+        with self._idle_lock:
+            if not self._idle_stop:
+                self._parked.append(handler)
+                handler = None
+        if handler is not None:
+            # 服务器正在关闭
+            self._close_idle(handler)
+            return
+        self._wake_idle_loop()
+
+    def _wake_idle_loop(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except BlockingIOError:
+            # 唤醒数据还没被读走，选择器已经会返回
+            pass
 
-def run_server():
+    def _close_idle(self, handler):
+        handler.idle = False
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        self.shutdown_request(handler.request)
+
+    def _idle_loop(self):
+        selector = self._idle_selector
+        while True:
+            with self._idle_lock:
+                parked, self._parked = self._parked, []
+                stopping = self._idle_stop
+            if stopping:
+                break
+            deadline = time.monotonic() + self.keepalive_timeout
+            for handler in parked:
+                selector.register(handler.connection, selectors.EVENT_READ, handler)
+                self._idle[handler] = deadline
+
+            timeout = None
+            if self._idle:
+                timeout = max(0, next(iter(self._idle.values())) - time.monotonic())
+            for key, _ in selector.select(timeout):
+                if key.data is None:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                handler = key.data
+                selector.unregister(handler.connection)
+                del self._idle[handler]
+                # 与新连接一样等待空闲的工作线程
+                self._slots.acquire()
+                try:
+                    self._executor.submit(self._resume_worker, handler)
+                except RuntimeError:
+                    self._slots.release()
+                    self._close_idle(handler)
+
+            now = time.monotonic()
+            while self._idle:
+                handler, expires_at = next(iter(self._idle.items()))
+                if expires_at > now:
+                    break
+                selector.unregister(handler.connection)
+                del self._idle[handler]
+                self._close_idle(handler)
+
+        for handler in list(self._idle):
+            selector.unregister(handler.connection)
+            self._close_idle(handler)
+        self._idle.clear()
+        for handler in parked:
+            self._close_idle(handler)
+
+    def server_close(self):
+        super().server_close()
+        with self._idle_lock:
+            self._idle_stop = True
+        self._wake_idle_loop()
+        self._idle_thread.join()
+        self._executor.shutdown(wait=True)
+        self._idle_selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+
+class BacklogThreadingHTTPServer(ThreadingHTTPServer):
+    """每个连接一个线程（不限数量），仅支持配置 backlog"""
+
+    def __init__(self, server_address, handler_class, backlog=SERVER_BACKLOG):
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler_class)
+
+
+class BacklogHTTPServer(HTTPServer):
+    """单线程串行处理请求（旧行为），仅支持配置 backlog"""
+
+    def __init__(self, server_address, handler_class, backlog=SERVER_BACKLOG):
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler_class)
+
+
+def create_server(mode=SERVER_MODE, port=SERVER_PORT, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG):
+    """
+    根据运行模式创建 HTTP 服务器
+
+    Args:
+        mode: pool（有界线程池，默认）、thread（每连接一线程）或 single（单线程）
+        port: 监听端口
+        workers: pool 模式下的工作线程数
+        backlog: 监听队列长度
+
+    Returns:
+        HTTPServer: 已绑定端口的服务器实例
+    """
+    server_address = ('', port)
+    if mode == 'pool':
+        return PooledHTTPServer(server_address, RequestHandler, workers=workers, backlog=backlog)
+    if mode == 'thread':
+        return BacklogThreadingHTTPServer(server_address, RequestHandler, backlog=backlog)
+    if mode == 'single':
+        return BacklogHTTPServer(server_address, RequestHandler, backlog=backlog)
+    raise ValueError(f'Unknown server mode: {mode}')
+
+def run_server(mode=SERVER_MODE, port=SERVER_PORT, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG):
     init_db()
-    server_address = ('', 5000)
-    httpd = HTTPServer(server_address, RequestHandler)
-    print('Server running on http://localhost:5000')
-    httpd.serve_forever()
+    httpd = create_server(mode, port, workers, backlog)
+    if mode == 'pool':
+        print(f'Server running on http://localhost:{port} (mode={mode}, workers={workers}, backlog={backlog})')
+    else:
+        print(f'Server running on http://localhost:{port} (mode={mode}, backlog={backlog})')
+    # 后台发送发件箱中的提醒邮件，并在提醒到期时入队
+    outbox.worker.start()
+    reminder_scheduler.scheduler.start()
+    session_reaper.start()
+    upload_store.collector.start()
+    passwords.pool.start()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        reminder_scheduler.scheduler.stop()
+        outbox.worker.stop()
+        session_reaper.stop()
+        upload_store.collector.stop()
+        passwords.pool.shutdown()
+        db.pool.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='时间胶囊后端服务')
+    parser.add_argument('--mode', choices=['pool', 'thread', 'single'], default=SERVER_MODE,
+                        help='请求处理模式：pool=有界线程池，thread=每连接一线程，single=单线程')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='监听端口')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='pool 模式下的工作线程数')
+    parser.add_argument('--backlog', type=int, default=SERVER_BACKLOG, help='监听队列长度')
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    # 运行数据库迁移
-    migrate_database()
-    
-    # 初始化数据库
-    init_db()
-    
-    # 运行服务器
-    run_server()
+    args = parse_args()
+
+    # 运行服务器（启动时会初始化数据库并执行迁移）
+    run_server(args.mode, args.port, args.workers, args.backlog)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+批量导入基准测试
+
+生成 N 行 NDJSON（字段与 /api/capsules/export?format=ndjson 的输出相同），
+通过 capsule_import.import_capsules 导入到空数据库，报告每秒导入的行数。
+
+用法：
+    python bench_import.py                         # 50000 行
+    python bench_import.py --rows 200000 --batch-size 1000
+    python bench_import.py --batch-size 1          # 每行一个事务，对比逐条创建胶囊
+
+数据库通过 CAPSULE_DATABASE 放在临时目录，不会改动 time_capsules.db。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='批量导入基准测试')
+    parser.add_argument('--rows', type=int, default=50000, help='导入的行数')
+    parser.add_argument('--batch-size', type=int, help='每个事务写入的行数（默认 IMPORT_BATCH_SIZE）')
+    return parser.parse_args()
+
+
+WORDS = (
+    'hello world time capsule memory summer winter coffee travel family friend dream '
+    '今天 天气 很好 我们 一起 去 海边 回忆 未来 生日快乐 朋友 家人 旅行 毕业 时间胶囊'
+).split()
+
+MOODS = ['happy', 'excited', 'peaceful', 'nostalgic', 'hopeful']
+
+
+def make_ndjson(rows):
+    rng = random.Random(1)
+    lines = []
+    for i in range(rows):
+        lines.append(json.dumps({
+            'id': i + 1,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(4)),
+            'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+            'mood': rng.choice(MOODS),
+            'tags': json.dumps(rng.sample(WORDS, 2), ensure_ascii=False),
+            'create_date': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00',
+            'open_date': f'20{rng.randint(20, 40)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00',
+            'is_opened': rng.random() < 0.3,
+            'image_path': '',
+            'category_id': None,
+        }, ensure_ascii=False))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='capsule-bench-import-')
+    os.environ['CAPSULE_DATABASE'] = os.path.join(workdir, 'import.db')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app  # 必须在设置 CAPSULE_DATABASE 之后导入
+    import capsule_import
+    import db
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.init_db()
+        if args.batch_size:
+            capsule_import.IMPORT_BATCH_SIZE = args.batch_size
+        conn = db.get_db()
+        try:
+            user_id = conn.execute('''
+                INSERT INTO users (username, password_hash, email, created_at)
+                VALUES ('bench', '', 'bench@example.com', '2024-01-01T00:00:00')
+            ''').lastrowid
+            conn.commit()
+
+            body = make_ndjson(args.rows)
+            started = time.perf_counter()
+            lines = capsule_import.iter_lines(io.BytesIO(body), len(body))
+            result = capsule_import.import_capsules(conn, user_id, lines, app.validate_capsule_data)
+            elapsed = time.perf_counter() - started
+        finally:
+            conn.close()
+        print(f'{args.rows} 行（{len(body) / 1024 / 1024:.1f}MB），每批 {capsule_import.IMPORT_BATCH_SIZE} 行')
+        print(f'导入 {result["imported"]} 行，失败 {result["failed"]} 行，'
+              f'耗时 {elapsed:.2f}s，{result["imported"] / elapsed:,.0f} 行/秒')
+    finally:
+        db.pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
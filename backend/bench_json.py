@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+胶囊列表 JSON 序列化基准测试
+
+在 N 个胶囊（默认 10000）上对比 GET /api/capsules 完整列表生成响应体的三种方式：
+    dict+json    旧实现：[dict(row) ...] 再 json.dumps().encode()
+    dict+codec   [dict(row) ...] 再 json_codec.dumps()（安装了 orjson 时使用 orjson）
+    sqlite       json_codec.query_json_array()：SQLite 直接生成 JSON 文本（当前实现）
+
+每种方式包含执行查询的时间，报告每次的毫秒数和每秒行数；开始前先检查三者解析后的结果相同。
+
+用法：
+    python bench_json.py
+    python bench_json.py --rows 50000 --repeat 10
+
+数据库和上传目录放在临时目录（CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER），不会改动 time_capsules.db。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+WORDS = (
+    'hello world time capsule memory summer winter coffee travel family friend dream '
+    '今天 天气 很好 我们 一起 去 海边 回忆 未来 生日快乐 朋友 家人 旅行 毕业 时间胶囊 🎉 "quoted"'
+).split()
+
+MOODS = ['happy', 'excited', 'peaceful', 'nostalgic', 'hopeful', None]
+
+SQL = 'SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='胶囊列表 JSON 序列化基准测试')
+    parser.add_argument('--rows', type=int, default=10000, help='胶囊数')
+    parser.add_argument('--repeat', type=int, default=5, help='每种方式的重复次数，取最快的一次')
+    return parser.parse_args()
+
+
+def fill(conn, rows):
+    rng = random.Random(1)
+    user_id = conn.execute('''
+        INSERT INTO users (username, password_hash, email, created_at)
+        VALUES ('bench', '', 'bench@example.com', '2024-01-01T00:00:00')
+    ''').lastrowid
+    conn.executemany('''
+        INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date,
+                              is_opened, open_time, image_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(
+        user_id,
+        ' '.join(rng.choice(WORDS) for _ in range(4)),
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+        rng.choice(MOODS),
+        json.dumps(rng.sample(WORDS, 2), ensure_ascii=False) if rng.random() < 0.8 else None,
+        f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:{i % 60:02d}',
+        f'20{rng.randint(20, 40)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00',
+        int(rng.random() < 0.3),
+        None,
+        f'ab/{i:08x}.png' if rng.random() < 0.2 else '',
+    ) for i in range(rows)])
+    conn.commit()
+    return user_id
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='capsule-bench-json-')
+    os.environ['CAPSULE_DATABASE'] = os.path.join(workdir, 'json.db')
+    os.environ['CAPSULE_UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app  # 必须在设置 CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER 之后导入
+    import db
+    import json_codec
+
+    methods = {
+        'dict+json': lambda conn, params: json.dumps([dict(row) for row in conn.execute(SQL, params)]).encode(),
+        'dict+codec': lambda conn, params: json_codec.dumps([dict(row) for row in conn.execute(SQL, params)]),
+        'sqlite': lambda conn, params: json_codec.query_json_array(conn, SQL, params),
+    }
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.init_db()
+        conn = db.get_db()
+        try:
+            params = (fill(conn, args.rows),)
+            bodies = {name: method(conn, params) for name, method in methods.items()}
+            expected = json.loads(bodies['dict+json'])
+            for name, body in bodies.items():
+                assert json.loads(body) == expected, name
+
+            print(f'{args.rows} 个胶囊，json_codec 后端：{json_codec.BACKEND}，{args.repeat} 次取最快')
+            print(f'{"method":<12}{"ms":>10}{"rows/s":>14}{"KB":>10}')
+            for name, method in methods.items():
+                best = float('inf')
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    method(conn, params)
+                    best = min(best, time.perf_counter() - started)
+                print(f'{name:<12}{best * 1000:>10.1f}{args.rows / best:>14,.0f}{len(bodies[name]) / 1024:>10.0f}')
+        finally:
+            conn.close()
+    finally:
+        db.pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
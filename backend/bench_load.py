@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+服务器并发压测
+
+在本进程内按不同模式（--mode pool/thread/single）启动服务器，分两个阶段测量 GET /api/capsules 的延迟：
+    idle  只有读请求
+    load  读请求的同时，有客户端限速上传大文件（模拟慢速上传）并不断调用 POST /api/reminders/check
+
+pool 模式下 load 阶段的 p99 应与 idle 阶段接近；single 模式下读请求要排在慢上传后面，p99 接近一次上传的耗时。
+每个请求都新建连接（single 模式下一个持久连接会独占整个服务器）。
+
+用法：
+    python bench_load.py                         # 依次测试 pool 和 single
+    python bench_load.py --mode pool --workers 4 --duration 20
+    python bench_load.py --upload-size 8 --upload-rate 2  # 8MB 文件，每秒 2MB
+
+数据库和上传目录通过 CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER 放在临时目录，不影响 time_capsules.db 和 uploads/。
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='服务器并发压测')
+    parser.add_argument('--mode', nargs='+', choices=['pool', 'thread', 'single'], default=['pool', 'single'],
+                        help='要测试的服务器模式')
+    parser.add_argument('--workers', type=int, default=8, help='pool 模式下的工作线程数')
+    parser.add_argument('--backlog', type=int, default=64, help='监听队列长度')
+    parser.add_argument('--duration', type=float, default=10, help='每个阶段的秒数')
+    parser.add_argument('--readers', type=int, default=4, help='并发读客户端数')
+    parser.add_argument('--uploaders', type=int, default=2, help='并发上传客户端数')
+    parser.add_argument('--checkers', type=int, default=1, help='并发调用提醒检查的客户端数')
+    parser.add_argument('--upload-size', type=float, default=4, help='每次上传的文件大小（MB）')
+    parser.add_argument('--upload-rate', type=float, default=4, help='每个上传客户端的发送速度（MB/s）')
+    parser.add_argument('--capsules', type=int, default=200, help='测试用户的胶囊数')
+    return parser.parse_args()
+
+
+USER = {'username': 'loadtest', 'password': 'secret12', 'email': 'loadtest@example.com'}
+CHUNK_SIZE = 64 * 1024
+
+
+def request(port, method, path, body=None, token=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if isinstance(body, dict):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, data
+    finally:
+        conn.close()
+
+
+def upload(port, token, content, rate):
+    """按 rate（MB/s）限速发送 multipart 请求体"""
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load.png"\r\n'
+            'Content-Type: image/png\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.putrequest('POST', '/api/upload')
+        conn.putheader('Authorization', f'Bearer {token}')
+        conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+        conn.putheader('Content-Length', str(len(head) + len(content) + len(tail)))
+        conn.endheaders()
+        conn.send(head)
+        delay = CHUNK_SIZE / (rate * 1024 * 1024)
+        for start in range(0, len(content), CHUNK_SIZE):
+            conn.send(content[start:start + CHUNK_SIZE])
+            time.sleep(delay)
+        conn.send(tail)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def setup_user(port, capsules):
+    """注册测试用户并直接写入胶囊（其中一部分 7 天内开启，供提醒检查使用）"""
+    import app  # main() 设置 CAPSULE_DATABASE 之后才导入
+    import db
+
+    request(port, 'POST', '/api/auth/register', USER)
+    status, data = request(port, 'POST', '/api/auth/login', USER)
+    if status != 200:
+        raise SystemExit(f'登录失败：{status} {data[:200]!r}')
+    token = json.loads(data)['token']
+
+    conn = db.get_db()
+    try:
+        user_id = conn.execute('SELECT id FROM users WHERE username = ?', (USER['username'],)).fetchone()[0]
+        if not app.count_user_capsules(conn, user_id):
+            now = datetime.now()
+            conn.executemany('''
+                INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date)
+                VALUES (?, ?, ?, 'happy', '["load"]', ?, ?)
+            ''', [
+                (user_id, f'capsule {i}', 'load test ' * 20, now.isoformat(),
+                 (now + timedelta(days=3 if i % 10 == 0 else 365)).isoformat())
+                for i in range(capsules)
+            ])
+            conn.commit()
+    finally:
+        conn.close()
+    return token
+
+
+def run_phase(args, port, token, with_load):
+    stop = threading.Event()
+    latencies = []
+    counts = {'uploads': 0, 'checks': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                status, _ = request(port, 'GET', '/api/capsules?limit=20', token=token)
+            except OSError:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    counts['errors'] += 1
+
+    def uploader():
+        content = os.urandom(int(args.upload_size * 1024 * 1024))
+        while not stop.is_set():
+            try:
+                ok = upload(port, token, content, args.upload_rate) == 200
+            except OSError:
+                ok = False
+            with lock:
+                counts['uploads' if ok else 'errors'] += 1
+
+    def checker():
+        while not stop.is_set():
+            try:
+                ok = request(port, 'POST', '/api/reminders/check', token=token)[0] == 200
+            except OSError:
+                ok = False
+            with lock:
+                counts['checks' if ok else 'errors'] += 1
+            stop.wait(0.05)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    if with_load:
+        threads += [threading.Thread(target=uploader) for _ in range(args.uploaders)]
+        threads += [threading.Thread(target=checker) for _ in range(args.checkers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, counts
+
+
+def run_mode(args, mode):
+    import app
+
+    httpd = app.create_server(mode, 0, args.workers, args.backlog)
+    port = httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        token = setup_user(port, args.capsules)
+        results = []
+        for phase, with_load in (('idle', False), ('load', True)):
+            latencies, counts = run_phase(args, port, token, with_load)
+            results.append((phase, latencies, counts))
+        return results
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='capsule-load-')
+    os.environ['CAPSULE_DATABASE'] = os.path.join(workdir, 'load.db')
+    os.environ['CAPSULE_UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app  # 必须在设置 CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER 之后导入
+    import db
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.init_db()
+    print(f'GET /api/capsules：{args.readers} 个读客户端；load 阶段另有 {args.uploaders} 个上传客户端'
+          f'（{args.upload_size:g}MB，{args.upload_rate:g}MB/s）和 {args.checkers} 个提醒检查客户端，每阶段 {args.duration:g}s')
+    print(f'{"mode":<8}{"phase":<7}{"requests":>9}{"p50 (ms)":>10}{"p99 (ms)":>10}{"max (ms)":>10}'
+          f'{"uploads":>9}{"checks":>8}{"errors":>8}')
+    try:
+        for mode in args.mode:
+            # 服务器端的日志（上传、缩略图等）不输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = run_mode(args, mode)
+            for phase, latencies, counts in results:
+                print(f'{mode:<8}{phase:<7}{len(latencies):>9}'
+                      f'{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 99) * 1000:>10.1f}'
+                      f'{(max(latencies) if latencies else float("nan")) * 1000:>10.1f}'
+                      f'{counts["uploads"]:>9}{counts["checks"]:>8}{counts["errors"]:>8}')
+    finally:
+        db.pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
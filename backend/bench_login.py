@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+登录基准测试
+
+在本进程内启动 pool 模式的服务器，对每个哈希线程数（--hash-workers）分两个阶段测量：
+    idle   只有一个持久连接的客户端轮询 GET /api/templates
+    login  同时有 --clients 个客户端不断登录（其中一部分使用不存在的用户名）
+
+输出登录吞吐（次/秒）、登录延迟以及 GET /api/templates 的 p50/p99，
+用来观察 KDF 计算对其他接口延迟的影响：哈希线程数接近请求线程数时，相当于在每个请求线程里直接计算哈希。
+
+用法：
+    python bench_login.py                                  # 哈希线程数 2 和 12 对比
+    python bench_login.py --hash-workers 1 2 4 --clients 8 --duration 5
+    python bench_login.py --scrypt-n 32768                 # 调整 scrypt 强度
+
+数据库通过 CAPSULE_DATABASE 放在临时目录，不会改动 time_capsules.db。
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='登录基准测试')
+    parser.add_argument('--hash-workers', type=int, nargs='+', default=[2, 12], help='要测试的哈希线程数')
+    parser.add_argument('--clients', type=int, default=12, help='并发登录的客户端数')
+    parser.add_argument('--unknown-ratio', type=float, default=0.25, help='使用不存在的用户名登录的比例')
+    parser.add_argument('--workers', type=int, default=16, help='请求线程数')
+    parser.add_argument('--duration', type=float, default=10, help='每个阶段的秒数')
+    parser.add_argument('--scrypt-n', type=int, help='scrypt 的 N 参数（默认 CAPSULE_SCRYPT_N 或 16384）')
+    return parser.parse_args()
+
+
+def post_json(port, path, body):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_phase(args, port, users, with_logins):
+    stop = threading.Event()
+    api_latencies = []
+    login_latencies = []
+    counts = {'busy': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def poller():
+        # 持久连接，模拟浏览器
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.request('GET', '/api/templates')
+                response = conn.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if response.status == 200:
+                        api_latencies.append(elapsed)
+                    else:
+                        counts['errors'] += 1
+                stop.wait(0.01)
+        finally:
+            conn.close()
+
+    def login_client(index):
+        user = users[index % len(users)]
+        rng = random.Random(index)
+        while not stop.is_set():
+            if rng.random() < args.unknown_ratio:
+                body, expected = {'username': f'nobody{index}', 'password': 'secret12'}, 401
+            else:
+                body, expected = user, 200
+            started = time.perf_counter()
+            status = post_json(port, '/api/auth/login', body)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == expected:
+                    login_latencies.append(elapsed)
+                elif status == 503:
+                    counts['busy'] += 1
+                else:
+                    counts['errors'] += 1
+
+    threads = [threading.Thread(target=poller)]
+    if with_logins:
+        threads += [threading.Thread(target=login_client, args=(i,)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return api_latencies, login_latencies, counts, time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='capsule-bench-login-')
+    os.environ['CAPSULE_DATABASE'] = os.path.join(workdir, 'login.db')
+    if args.scrypt_n:
+        os.environ['CAPSULE_SCRYPT_N'] = str(args.scrypt_n)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app  # 必须在设置 CAPSULE_DATABASE / CAPSULE_SCRYPT_N 之后导入
+    import db
+    import passwords
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.init_db()
+    httpd = app.create_server('pool', 0, args.workers, 128)
+    port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    users = [{'username': f'bench{i}', 'password': 'secret12', 'email': f'bench{i}@example.com'}
+             for i in range(args.clients)]
+    try:
+        passwords.pool.start()
+        for user in users:
+            post_json(port, '/api/auth/register', user)
+
+        print(f'{passwords.PASSWORD_SCHEME}（N={passwords.SCRYPT_N}），{args.workers} 个请求线程，'
+              f'{args.clients} 个登录客户端（{args.unknown_ratio:.0%} 为不存在的用户），每阶段 {args.duration:g}s')
+        print(f'{"hash":>5}  {"phase":<6}{"logins/s":>9}{"login p50":>11}{"login p99":>11}'
+              f'{"api p50":>9}{"api p99":>9}{"busy":>6}{"errors":>7}')
+        for workers in args.hash_workers:
+            old_pool, passwords.pool = passwords.pool, passwords.HashPool(workers=workers)
+            old_pool.shutdown()
+            passwords.pool.start()
+            for phase, with_logins in (('idle', False), ('login', True)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    api, logins, counts, elapsed = run_phase(args, port, users, with_logins)
+                print(f'{workers:>5}  {phase:<6}{len(logins) / elapsed:>9.1f}'
+                      f'{percentile(logins, 50) * 1000:>11.1f}{percentile(logins, 99) * 1000:>11.1f}'
+                      f'{percentile(api, 50) * 1000:>9.1f}{percentile(api, 99) * 1000:>9.1f}'
+                      f'{counts["busy"]:>6}{counts["errors"]:>7}')
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        passwords.pool.shutdown()
+        db.pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+路由分发基准测试
+
+用 timeit 对比两种方式从请求路径找到处理函数的耗时（微秒/次）：
+    trie   router.Router.resolve()（当前实现）
+    chain  旧的 do_GET / do_POST 中的 if/elif 链：按方法分组、按注册顺序逐条比较，
+           静态路由用 ==，带参数的路由用正则
+
+两种方式使用同一张路由表（app.router.routes）。样本路径覆盖每条路由，
+另加几条不存在的路径（chain 需要比较完整条链才能得出 404）。
+
+用法：
+    python bench_router.py
+    python bench_router.py --number 200000
+
+数据库和上传目录放在临时目录（CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER），不会改动 time_capsules.db。
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+SAMPLES = {'int': '12345', 'str': 'name', 'path': 'ab/cd/photo.png'}
+PATTERNS = {'int': r'(\d+)', 'str': r'([^/]+)', 'path': r'(.+)'}
+
+MISSES = [
+    ('GET', '/api/unknown'),
+    ('GET', '/api/capsules/12345/close'),
+    ('POST', '/api/stats'),
+    ('GET', '/favicon.ico'),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='路由分发基准测试')
+    parser.add_argument('--number', type=int, default=100000, help='每条路径的调用次数')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最快的一次')
+    return parser.parse_args()
+
+
+def sample_path(pattern):
+    segments = []
+    for segment in pattern.split('/'):
+        if segment.startswith('<'):
+            segment = SAMPLES[segment[1:-1].rpartition(':')[0] or 'str']
+        segments.append(segment)
+    return '/'.join(segments)
+
+
+def build_chain(routes):
+    """按方法分组的 (字面路径或正则, 参数名, Route) 列表，与旧实现一样逐条比较"""
+    chain = {}
+    for route in routes:
+        names = []
+        parts = []
+        for segment in route.pattern.split('/'):
+            if segment.startswith('<'):
+                kind, _, name = segment[1:-1].rpartition(':')
+                names.append(name)
+                segment = PATTERNS[kind or 'str']
+            else:
+                segment = re.escape(segment)
+            parts.append(segment)
+        matcher = re.compile('/'.join(parts) + '/?$').match if names else route.pattern
+        chain.setdefault(route.method, []).append((matcher, names, route))
+    return chain
+
+
+def resolve_chain(chain, method, path):
+    for matcher, names, route in chain.get(method, ()):
+        if not names:
+            if path == matcher:
+                return route, {}
+            continue
+        match = matcher(path)
+        if match:
+            return route, dict(zip(names, match.groups()))
+    return None, None
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='capsule-bench-router-')
+    os.environ['CAPSULE_DATABASE'] = os.path.join(workdir, 'router.db')
+    os.environ['CAPSULE_UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app  # 必须在设置 CAPSULE_DATABASE / CAPSULE_UPLOAD_FOLDER 之后导入
+    from router import RouteNotFound
+
+    try:
+        router = app.router
+        chain = build_chain(router.routes)
+        requests = [(route.method, sample_path(route.pattern)) for route in router.routes]
+
+        # 两种方式必须得到相同的结果
+        for method, path in requests:
+            assert resolve_chain(chain, method, path)[0] is router.resolve(method, path)[0], (method, path)
+        for method, path in MISSES:
+            assert resolve_chain(chain, method, path)[0] is None, (method, path)
+
+        def run_trie(method, path):
+            try:
+                router.resolve(method, path)
+            except RouteNotFound:
+                pass
+
+        def run_chain(method, path):
+            resolve_chain(chain, method, path)
+
+        def measure(func, method, path):
+            timer = timeit.Timer(lambda: func(method, path))
+            return min(timer.repeat(args.repeat, args.number)) / args.number * 1e6
+
+        print(f'{len(router.routes)} 条路由，每条路径 {args.number} 次 × {args.repeat} 轮（取最快）')
+        print(f'{"method":<7}{"path":<34}{"trie µs":>9}{"chain µs":>10}')
+        totals = {'trie': 0.0, 'chain': 0.0}
+        for method, path in requests + MISSES:
+            trie = measure(run_trie, method, path)
+            linear = measure(run_chain, method, path)
+            totals['trie'] += trie
+            totals['chain'] += linear
+            print(f'{method:<7}{path:<34}{trie:>9.2f}{linear:>10.2f}')
+        count = len(requests) + len(MISSES)
+        print(f'{"mean":<41}{totals["trie"] / count:>9.2f}{totals["chain"] / count:>10.2f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
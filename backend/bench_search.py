@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+全文搜索基准测试
+
+生成合成数据集（默认 1000 个用户共 100000 个胶囊），分别测量：
+    scan  胶囊较少的用户：在自己的胶囊中逐条匹配并排序（search_capsules 的默认路径）
+    fts   强制使用 FTS5 MATCH（胶囊数超过 SEARCH_SCAN_MAX_CAPSULES 的用户走这条路径）
+
+用法：
+    python bench_search.py                      # 生成 /tmp 下的数据库并测试
+    python bench_search.py --capsules 20000 --users 100
+    python bench_search.py --db /tmp/bench.db --keep   # 复用已生成的数据库
+
+数据库通过 CAPSULE_DATABASE 指定，不会改动 time_capsules.db。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='全文搜索基准测试')
+    parser.add_argument('--capsules', type=int, default=100000, help='胶囊总数')
+    parser.add_argument('--users', type=int, default=1000, help='用户数（胶囊平均分配）')
+    parser.add_argument('--repeat', type=int, default=20, help='每个查询重复次数')
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'capsule_bench_search.db'), help='数据库文件')
+    parser.add_argument('--keep', action='store_true', help='数据库已存在时直接使用')
+    return parser.parse_args()
+
+
+args = parse_args()
+if not args.keep:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+os.environ['CAPSULE_DATABASE'] = args.db
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # 必须在设置 CAPSULE_DATABASE 之后导入
+from db import get_db
+
+WORDS = (
+    'hello world time capsule memory summer winter coffee travel family friend dream '
+    'river mountain city night morning rain sunshine book music letter future past '
+    '今天 天气 很好 我们 一起 去 海边 回忆 未来 生日快乐 朋友 家人 旅行 毕业 时间胶囊'
+).split()
+
+QUERIES = ['hello world', '生日快乐', 'coffee', '海边']
+
+
+def populate(conn, capsules, users):
+    rng = random.Random(1)
+    conn.execute('BEGIN')
+    conn.executemany(
+        "INSERT INTO users (id, username, password_hash, email, created_at) VALUES (?, ?, '', ?, '2024-01-01T00:00:00')",
+        [(uid, f'bench{uid}', f'bench{uid}@example.com') for uid in range(1, users + 1)])
+    batch = []
+    for i in range(capsules):
+        batch.append((
+            i % users + 1,
+            ' '.join(rng.choice(WORDS) for _ in range(4)),
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+            json.dumps(rng.sample(WORDS, 2), ensure_ascii=False),
+            f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00',
+        ))
+        if len(batch) == 10000:
+            _insert(conn, batch)
+            batch = []
+    if batch:
+        _insert(conn, batch)
+    conn.commit()
+
+
+def _insert(conn, batch):
+    conn.executemany('''
+        INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date, is_opened)
+        VALUES (?, ?, ?, '', ?, ?, '2030-01-01T00:00:00', 1)
+    ''', batch)
+
+
+def measure(conn, user_id, query, repeat):
+    app.search_capsules(conn, user_id, {'q': query})
+    started = time.perf_counter()
+    for _ in range(repeat):
+        capsules, _ = app.search_capsules(conn, user_id, {'q': query})
+    return (time.perf_counter() - started) / repeat * 1000, len(capsules)
+
+
+def main():
+    app.init_db()
+    conn = get_db()
+    try:
+        existing = conn.execute('SELECT COUNT(*) FROM capsules').fetchone()[0]
+        if not existing:
+            started = time.perf_counter()
+            populate(conn, args.capsules, args.users)
+            print(f'生成 {args.capsules} 个胶囊 / {args.users} 个用户：{time.perf_counter() - started:.1f}s')
+        total = conn.execute('SELECT COUNT(*) FROM capsules').fetchone()[0]
+        user_id = 1
+        user_total = app.count_user_capsules(conn, user_id)
+        print(f'数据库 {args.db}：共 {total} 个胶囊，测试用户有 {user_total} 个胶囊')
+        print(f'{"query":<14}{"scan (ms)":>12}{"fts (ms)":>12}{"results":>8}')
+
+        threshold = app.SEARCH_SCAN_MAX_CAPSULES
+        for query in QUERIES:
+            app.SEARCH_SCAN_MAX_CAPSULES = max(threshold, user_total)
+            scan_ms, count = measure(conn, user_id, query, args.repeat)
+            app.SEARCH_SCAN_MAX_CAPSULES = -1
+            fts_ms, _ = measure(conn, user_id, query, args.repeat)
+            print(f'{query:<14}{scan_ms:>12.2f}{fts_ms:>12.2f}{count:>8}')
+        app.SEARCH_SCAN_MAX_CAPSULES = threshold
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+批量导入胶囊
+
+请求体为 NDJSON（每行一个胶囊，可以直接使用 /api/capsules/export?format=ndjson 导出的文件），
+边读边校验，每 IMPORT_BATCH_SIZE 行用一次 executemany 写入并提交一次事务。
+某一行校验失败（包括校验时抛出的异常）只跳过该行，错误按行号报告。
+"""
+
+import json
+from datetime import datetime
+
+import json_codec
+import reminder_scheduler
+
+# 每个事务写入的行数
+IMPORT_BATCH_SIZE = 500
+
+# 单行的最大字节数（content 最多 5000 个字符）
+MAX_LINE_LENGTH = 256 * 1024
+
+# 响应中最多列出的错误行数
+MAX_REPORTED_ERRORS = 100
+
+# 每次从请求体读取的字节数
+READ_SIZE = 64 * 1024
+
+INSERT_SQL = '''
+    INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date,
+                          image_path, category_id, is_opened, open_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def iter_lines(stream, content_length):
+    """
+    从请求体中逐行读取
+
+    Args:
+        stream: 请求体输入流
+        content_length: 请求体字节数
+
+    Yields:
+        int: 行号（从 1 开始）
+        bytes: 行内容；超过 MAX_LINE_LENGTH 时为 None
+    """
+    remaining = content_length
+    buffer = b''
+    line_number = 0
+    too_long = False
+    while remaining > 0:
+        chunk = stream.read(min(READ_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            yield line_number, None if too_long or len(line) > MAX_LINE_LENGTH else line
+            too_long = False
+        if len(buffer) > MAX_LINE_LENGTH:
+            # 丢弃超长行已读到的部分，读到换行时报告
+            buffer = b''
+            too_long = True
+    if buffer or too_long:
+        yield line_number + 1, None if too_long or len(buffer) > MAX_LINE_LENGTH else buffer
+
+
+def _parse_tags(tags):
+    # 导出文件中 tags 是 JSON 文本，手工编写的文件里可能是数组
+    if isinstance(tags, str):
+        try:
+            tags = json.loads(tags)
+        except ValueError:
+            return None
+    if tags is None:
+        return []
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        return None
+    return tags
+
+
+def _optional_datetime(value):
+    """合法且不带时区的 ISO 时间原样返回，否则返回 None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        if datetime.fromisoformat(value).tzinfo is not None:
+            return None
+    except ValueError:
+        return None
+    return value
+
+
+def prepare_row(data, user_id, category_ids, validate, now):
+    """
+    校验一行并转换为 INSERT_SQL 的参数
+
+    导入的胶囊允许开启日期在过去（恢复导出的旧胶囊）；
+    不属于当前用户的分类被清空，id、user_id、email_sent 等字段被忽略。
+
+    Args:
+        data: 解析后的一行
+        user_id: 当前用户
+        category_ids: 当前用户的分类 ID 集合
+        validate: 胶囊校验函数（app.validate_capsule_data）
+        now: 没有 create_date 时使用的创建时间
+
+    Returns:
+        tuple: INSERT_SQL 参数；校验失败时为 None
+        list: 错误信息
+    """
+    if not isinstance(data, dict):
+        return None, ['每行必须是一个 JSON 对象']
+    for field in ('title', 'content', 'open_date'):
+        if not isinstance(data.get(field), (str, type(None))):
+            return None, [f'{field} 必须是字符串']
+    errors = validate(data, allow_past_open_date=True)
+    tags = _parse_tags(data.get('tags'))
+    if tags is None:
+        errors.append('标签格式无效')
+    if errors:
+        return None, errors
+
+    image_path = data.get('image_path')
+    if not isinstance(image_path, str) or not image_path.startswith('/uploads/'):
+        image_path = ''
+    category_id = data.get('category_id')
+    if not isinstance(category_id, int) or category_id not in category_ids:
+        category_id = None
+    is_opened = 1 if data.get('is_opened') else 0
+    open_time = _optional_datetime(data.get('open_time')) if is_opened else None
+
+    return (
+        user_id,
+        data['title'].strip(),
+        data['content'].strip(),
+        data.get('mood') or '',
+        json.dumps(tags),
+        _optional_datetime(data.get('create_date')) or now,
+        data['open_date'],
+        image_path,
+        category_id,
+        is_opened,
+        open_time,
+    ), []
+
+
+def _insert_batch(conn, user_id, rows):
+    """
+    在一个事务中写入一批行，并为其中未开启的胶囊安排提醒
+
+    Returns:
+        int: 写入的行数
+    """
+    # BEGIN IMMEDIATE 先拿到写锁，事务内的 max(id) 和新插入的 id 不会与其他请求交错
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM capsules').fetchone()[0]
+        conn.executemany(INSERT_SQL, rows)
+        inserted = conn.execute('''
+            SELECT id, open_date FROM capsules
+            WHERE id > ? AND user_id = ? AND is_opened = 0
+        ''', (last_id, user_id)).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for row in inserted:
+        reminder_scheduler.scheduler.schedule(row['id'], row['open_date'])
+    return len(rows)
+
+
+def import_capsules(conn, user_id, lines, validate):
+    """
+    导入胶囊
+
+    Args:
+        conn: 数据库连接
+        user_id: 当前用户
+        lines: iter_lines() 返回的 (行号, 内容) 迭代器
+        validate: 胶囊校验函数
+
+    Returns:
+        dict: {'imported': 写入行数, 'failed': 失败行数, 'errors': [{'line': 行号, 'errors': [...]}]}
+    """
+    category_ids = {row['id'] for row in conn.execute('SELECT id FROM categories WHERE user_id = ?', (user_id,))}
+    now = datetime.now().isoformat()
+    result = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(line_number, errors):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line_number, 'errors': errors})
+
+    batch = []
+    for line_number, line in lines:
+        if line is None:
+            fail(line_number, ['行过长'])
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = json_codec.loads(line)
+        except json_codec.JSONDecodeError:
+            fail(line_number, ['JSON 格式无效'])
+            continue
+        try:
+            params, errors = prepare_row(data, user_id, category_ids, validate, now)
+        except Exception as e:
+            # 校验函数未预料到的输入只记为该行的错误，不中断整个导入
+            print(f'[IMPORT] Line {line_number} failed validation: {e!r}')
+            params, errors = None, ['字段格式无效']
+        if errors:
+            fail(line_number, errors)
+            continue
+        batch.append(params)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            result['imported'] += _insert_batch(conn, user_id, batch)
+            batch = []
+    if batch:
+        result['imported'] += _insert_batch(conn, user_id, batch)
+    return result
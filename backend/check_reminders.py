@@ -1,30 +1,29 @@
 #!/usr/bin/env python3
 """
 定时任务：检查即将开启的胶囊并发送邮件提醒
-建议使用 cron 或 systemd timer 定期运行此脚本
+后端服务运行时由进程内的提醒调度器（reminder_scheduler.py）按时入队，无需定时运行此脚本；
+未运行后端服务时可使用 cron 或 systemd timer 定期运行此脚本
+
+提醒先写入发件箱（email_outbox 表），失败的邮件会在之后的运行中按退避时间重试
 """
 
 import sys
 import os
 from datetime import datetime, timedelta
-import sqlite3
-import email_sender
 
 # 添加当前目录到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# 数据库路径
-DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'time_capsules.db')
-
-def get_db():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+import email_sender
+import outbox
+from db import get_db
 
-def check_and_send_reminders():
+def check_and_send_reminders(deliver=True):
     """
-    检查即将开启的胶囊并发送邮件提醒
+    检查即将开启的胶囊，把提醒邮件加入发件箱并发送
+
+    Args:
+        deliver: 是否在本进程中发送；后端服务运行时由服务的后台线程发送，可传 False 只入队
     """
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始检查即将开启的胶囊...")
     
@@ -50,34 +49,18 @@ def check_and_send_reminders():
         
         print(f"找到 {len(capsules)} 个即将开启的胶囊")
         
+        # 写入发件箱（已入队的胶囊不会重复入队）
+        queued_count = outbox.enqueue_reminders(conn, capsules)
+        conn.commit()
+        conn.close()
+        print(f"新加入发件箱: {queued_count} 封")
+        
         sent_count = 0
         failed_count = 0
-        
-        for capsule in capsules:
-            capsule_id = capsule['id']
-            title = capsule['title']
-            open_date = capsule['open_date']
-            username = capsule['username']
-            email = capsule['email']
-            
-            print(f"\n处理胶囊 {capsule_id}: {title}")
-            print(f"  用户: {username} ({email})")
-            print(f"  开启日期: {open_date}")
-            
-            # 发送邮件
-            success, error = email_sender.send_reminder_email(email, username, title, open_date)
-            
-            if success:
-                # 更新邮件发送状态
-                conn.execute('UPDATE capsules SET email_sent = 1 WHERE id = ?', (capsule_id,))
-                conn.commit()
-                sent_count += 1
-                print(f"  ✓ 邮件发送成功")
-            else:
-                failed_count += 1
-                print(f"  ✗ 邮件发送失败: {error}")
-        
-        conn.close()
+        if deliver:
+            # 发送发件箱中所有到期的邮件（含之前失败待重试的）
+            sent_count, failed_count = outbox.run_pending()
+            email_sender.close_pools()
         
         print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 检查完成")
         print(f"成功发送: {sent_count} 封")
@@ -93,8 +76,8 @@ def check_and_send_reminders():
 
 
 if __name__ == "__main__":
-    # 运行检查
-    sent, failed = check_and_send_reminders()
+    # 运行检查（--enqueue-only：只入队，由后端服务发送）
+    sent, failed = check_and_send_reminders(deliver='--enqueue-only' not in sys.argv[1:])
     
     # 返回状态码
     sys.exit(0 if failed == 0 else 1)
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+响应压缩
+
+按请求头 Accept-Encoding 协商压缩算法，只压缩超过阈值的响应体。
+上传的图片本身已经压缩，不经过这里。
+
+依赖 brotli（可选）：未安装时只使用 gzip。
+"""
+
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli 未安装
+    brotli = None
+
+# 小于该字节数的响应不压缩（压缩收益抵不上开销）
+COMPRESSION_THRESHOLD = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _parse_accept_encoding(header):
+    """'gzip, br;q=0.8, *;q=0' -> {'gzip': 1.0, 'br': 0.8, '*': 0.0}"""
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header):
+    """
+    选择压缩算法
+
+    Args:
+        header: Accept-Encoding 请求头
+
+    Returns:
+        str: 'br' 或 'gzip'；客户端不接受压缩时返回 None
+    """
+    if not header:
+        return None
+    accepted = _parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = None
+    best_quality = 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, accept_encoding):
+    """
+    按协商结果压缩响应体
+
+    Args:
+        body: 响应体
+        accept_encoding: Accept-Encoding 请求头
+
+    Returns:
+        bytes: 响应体（可能已压缩）
+        str: Content-Encoding；未压缩时为 None
+    """
+    if len(body) < COMPRESSION_THRESHOLD:
+        return body, None
+    encoding = negotiate(accept_encoding)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    return body, None
+
+
+class StreamCompressor:
+    """
+    流式压缩（用于分块传输的响应）
+
+    Attributes:
+        encoding: Content-Encoding；客户端不接受压缩时为 None，数据原样输出
+    """
+
+    def __init__(self, accept_encoding):
+        self.encoding = negotiate(accept_encoding)
+        if self.encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif self.encoding == 'gzip':
+            # wbits=31：带 gzip 头和尾
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            self._compressor = None
+
+    def compress(self, data):
+        if self._compressor is None:
+            return data
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """结束压缩流，返回剩余数据"""
+        if self._compressor is None:
+            return b''
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
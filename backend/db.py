@@ -0,0 +1,253 @@
+"""
+数据库连接池
+
+app.py 和 check_reminders.py 共用同一个连接池：连接在首次创建时设置好
+PRAGMA，之后被反复借出和归还，请求处理过程中不再有建立连接的开销。
+"""
+
+import gc
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+# 数据库路径（基准测试等脚本可用 CAPSULE_DATABASE 指定其他文件）
+DATABASE = os.environ.get('CAPSULE_DATABASE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'time_capsules.db')
+
+# 连接池上限（同时借出的连接数）
+POOL_SIZE = int(os.environ.get('CAPSULE_DB_POOL_SIZE', 32))
+
+# 连接池耗尽时等待空闲连接的秒数
+POOL_TIMEOUT = 30
+
+# 连接池耗尽超过该秒数仍没有空闲连接时，做一次垃圾回收，找回处于引用循环中的未归还连接
+LEAK_CHECK_DELAY = 1
+
+# 空闲超过该秒数的连接在借出前做一次健康检查
+HEALTH_CHECK_INTERVAL = 30
+
+# 写锁等待时间（秒）
+BUSY_TIMEOUT = 5
+
+# 每个连接创建时执行一次的 PRAGMA
+CONNECTION_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',  # WAL 模式下安全且提交更快
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -8000',  # 约 8MB 页缓存
+]
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """连接池在等待时间内没有空闲连接"""
+
+
+# 当前线程累计的 SQL 执行时间（秒），用于统计每个请求的数据库耗时
+_query_time = threading.local()
+
+
+def reset_query_time():
+    """把当前线程累计的 SQL 执行时间清零（请求开始时调用）"""
+    _query_time.seconds = 0.0
+
+
+def query_time():
+    """当前线程自上次 reset_query_time() 以来的 SQL 执行时间（秒）"""
+    return getattr(_query_time, 'seconds', 0.0)
+
+
+def _add_query_time(started):
+    _query_time.seconds = getattr(_query_time, 'seconds', 0.0) + time.perf_counter() - started
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录 execute 耗时的游标（conn.cursor() 返回的游标）"""
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _add_query_time(started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _add_query_time(started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    连接池中的连接
+
+    调用 close() 时把连接归还给连接池，而不是真正关闭，
+    因此原有的 get_db() ... conn.close() 写法无需修改。
+    execute/executemany/commit 的耗时计入当前线程的 query_time()
+    （只统计执行到第一行结果的时间，之后逐行读取的时间不计入）。
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _add_query_time(started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _add_query_time(started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _add_query_time(started)
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def _close(self):
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    有上限的 SQLite 连接池（借出/归还模式）
+
+    Args:
+        database: 数据库文件路径
+        max_size: 同时借出的连接数上限
+        timeout: 连接池耗尽时的等待秒数
+    """
+
+    def __init__(self, database, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._gc_lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=BUSY_TIMEOUT,
+            factory=PooledConnection,
+            check_same_thread=False,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn._pool = self
+        conn._returned_at = time.monotonic()
+        return conn
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - conn._returned_at < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _on_leaked(self):
+        # 借出的连接未调用 close() 就被回收，归还其占用的名额
+        self._slots.release()
+
+    def _wait_for_slot(self):
+        # 连接正常归还时立即释放名额，连接池只是忙时直接等待
+        delay = min(LEAK_CHECK_DELAY, self.timeout)
+        if self._slots.acquire(timeout=delay):
+            return
+        # 等待了较长时间：可能有未调用 close() 的连接（sqlite3 连接自带引用循环，只能由垃圾回收释放），
+        # 只由一个等待的线程做一次完整回收
+        if self._gc_lock.acquire(blocking=False):
+            try:
+                print(f'[DB] Pool exhausted for {delay}s, collecting garbage to reclaim leaked connections')
+                gc.collect()
+            finally:
+                self._gc_lock.release()
+        if not self._slots.acquire(timeout=self.timeout - delay):
+            raise PoolTimeoutError('database connection pool exhausted')
+
+    def acquire(self):
+        """借出一个连接"""
+        self._wait_for_slot()
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    conn = self._connect()
+                    break
+                if self._is_healthy(conn):
+                    break
+                conn._close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        conn.row_factory = sqlite3.Row
+        conn._finalizer = weakref.finalize(conn, self._on_leaked)
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚（与直接关闭连接的行为一致）"""
+        finalizer = getattr(conn, '_finalizer', None)
+        if finalizer is None or not finalizer.detach():
+            # 重复归还
+            return
+        conn._finalizer = None
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            reusable = True
+        except sqlite3.Error:
+            reusable = False
+
+        with self._lock:
+            if reusable and not self._closed:
+                conn._returned_at = time.monotonic()
+                self._idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn._close()
+        self._slots.release()
+
+    def close(self):
+        """关闭所有空闲连接，之后归还的连接也会被直接关闭"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn._close()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {'max_size': self.max_size, 'idle': idle}
+
+
+pool = ConnectionPool(DATABASE)
+
+
+def get_db():
+    """从连接池借出连接，用完后调用 conn.close() 归还"""
+    return pool.acquire()
@@ -13,4 +13,13 @@ SENDER_EMAIL = "@qq.com"
 SENDER_PASSWORD = ""
 
 # 发件人显示名称
-SENDER_NAME = "时间胶囊"
\ No newline at end of file
+SENDER_NAME = "时间胶囊"
+
+# 连接池：同时保持的已登录 SMTP 会话数（即并发发送数）
+SMTP_POOL_SIZE = 4
+
+# 每个 SMTP 服务器每秒最多发送的邮件数（QQ 邮箱对发送频率有限制）
+SMTP_RATE_LIMIT = 5
+
+# SMTP 连接超时秒数
+SMTP_TIMEOUT = 30
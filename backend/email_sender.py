@@ -1,10 +1,219 @@
 import smtplib
 import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.utils import formataddr
-from datetime import datetime
+import queue
+import threading
+import time
+from email.errors import HeaderParseError
 import email_config
+import email_templates
+
+# 连接断开等可重连的错误（收件人被拒等错误重连也没用，直接返回失败）
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class RateLimiter:
+    """
+    令牌桶限速器（线程安全）
+
+    Args:
+        rate: 每秒允许的次数，为 0 时不限速
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，必要时阻塞等待"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+
+def get_ssl_context():
+    """所有 SMTP 连接共用的 SSL 上下文（创建一次约需几十毫秒，只创建一次）"""
+    global _ssl_context
+    with _ssl_context_lock:
+        if _ssl_context is None:
+            _ssl_context = ssl.create_default_context()
+        return _ssl_context
+
+
+class SMTPPool:
+    """
+    已登录 SMTP 会话的连接池
+
+    会话按需建立并在发送后放回池中复用，省去每封邮件的 TLS 握手和登录。
+    发送时会话已断开（服务器超时关闭等）会自动重连一次再发送。
+
+    Args:
+        server: SMTP 服务器地址
+        port: 端口
+        size: 最多同时保持的会话数，默认 SMTP_POOL_SIZE
+        rate: 每秒最多发送的邮件数，默认 SMTP_RATE_LIMIT
+    """
+
+    def __init__(self, server, port, size=None, rate=None):
+        self.server = server
+        self.port = port
+        self.size = size or email_config.SMTP_POOL_SIZE
+        self.limiter = RateLimiter(email_config.SMTP_RATE_LIMIT if rate is None else rate)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        if email_config.SMTP_USE_SSL:
+            conn = smtplib.SMTP_SSL(self.server, self.port, timeout=email_config.SMTP_TIMEOUT, context=get_ssl_context())
+        else:
+            # 非 SSL 端口：服务器支持时升级为 STARTTLS（本地测试服务器可不支持）
+            conn = smtplib.SMTP(self.server, self.port, timeout=email_config.SMTP_TIMEOUT)
+            conn.ehlo()
+            if conn.has_extn('starttls'):
+                conn.starttls(context=get_ssl_context())
+                conn.ehlo()
+        if email_config.SENDER_PASSWORD:
+            conn.login(email_config.SENDER_EMAIL, email_config.SENDER_PASSWORD)
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def send(self, to_email, message):
+        """
+        通过池中的会话发送一封邮件
+
+        Args:
+            to_email: 收件人邮箱
+            message: 完整的邮件文本（msg.as_string()）
+
+        Raises:
+            smtplib.SMTPException, OSError: 发送失败
+        """
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+
+            self.limiter.acquire()
+            try:
+                if conn is None:
+                    conn = self._connect()
+                try:
+                    conn.sendmail(email_config.SENDER_EMAIL, to_email, message)
+                except RECONNECT_ERRORS:
+                    # 会话已失效，重连后重试一次
+                    self._discard(conn)
+                    conn = self._connect()
+                    conn.sendmail(email_config.SENDER_EMAIL, to_email, message)
+            except smtplib.SMTPRecipientsRefused:
+                # 会话本身仍可用
+                self._idle.put(conn)
+                raise
+            except BaseException:
+                if conn is not None:
+                    self._discard(conn)
+                raise
+            self._idle.put(conn)
+
+    def close(self):
+        """关闭所有空闲会话"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except Exception:
+                self._discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool():
+    """当前配置的 SMTP 服务器对应的连接池（每个服务器一个，各自限速）"""
+    key = (email_config.SMTP_SERVER, email_config.SMTP_PORT)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPPool(*key)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def is_permanent_error(error):
+    """
+    判断发送错误是否为永久性错误（重试也不会成功）
+
+    收件人/发件人被拒、其他 5xx 响应和无法生成的邮件头（地址含换行）视为永久错误；
+    连接失败、超时、4xx 临时错误和登录失败（可能是配置问题，修正后可重试）视为临时错误。
+    """
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, HeaderParseError)):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def build_reminder_message(to_email, username, capsule_title, open_date):
+    """
+    生成胶囊开启提醒邮件
+
+    Args:
+        to_email: 收件人邮箱
+        username: 用户名
+        capsule_title: 胶囊标题
+        open_date: 开启日期
+
+    Returns:
+        str: 完整的邮件文本
+    """
+    return email_templates.REMINDER.render(to_email, username, capsule_title=capsule_title, open_date=open_date)
+
+
+def build_reminder_messages(reminders):
+    """
+    批量生成提醒邮件
+
+    Args:
+        reminders: (to_email, username, capsule_title, open_date) 元组的列表
+
+    Returns:
+        list: 与 reminders 顺序对应的邮件文本
+    """
+    return email_templates.REMINDER.render_many([
+        {'to_email': to_email, 'username': username, 'capsule_title': capsule_title, 'open_date': open_date}
+        for to_email, username, capsule_title, open_date in reminders
+    ])
+
 
 def send_reminder_email(to_email, username, capsule_title, open_date):
     """
@@ -21,103 +230,10 @@ def send_reminder_email(to_email, username, capsule_title, open_date):
         str: 错误信息（如果失败）
     """
     try:
-        # 创建邮件
-        msg = MIMEMultipart()
-        msg['From'] = formataddr((email_config.SENDER_NAME, email_config.SENDER_EMAIL))
-        msg['To'] = formataddr((username, to_email))
-        msg['Subject'] = f'📬 您的时间胶囊"{capsule_title}"即将开启！'
+        message = build_reminder_message(to_email, username, capsule_title, open_date)
         
-        # 邮件正文
-        html_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: 'Microsoft YaHei', Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .header {{
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    padding: 30px;
-                    text-align: center;
-                    border-radius: 10px 10px 0 0;
-                }}
-                .content {{
-                    background: #f8f9fa;
-                    padding: 30px;
-                    border-radius: 0 0 10px 10px;
-                }}
-                .capsule-info {{
-                    background: white;
-                    padding: 20px;
-                    border-radius: 8px;
-                    margin: 20px 0;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                .footer {{
-                    text-align: center;
-                    color: #666;
-                    margin-top: 20px;
-                    font-size: 12px;
-                }}
-                .btn {{
-                    display: inline-block;
-                    padding: 12px 30px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    text-decoration: none;
-                    border-radius: 25px;
-                    margin: 20px 0;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🕐 时间胶囊提醒</h1>
-                </div>
-                <div class="content">
-                    <p>亲爱的 <strong>{username}</strong>：</p>
-                    <p>您好！您创建的时间胶囊即将到开启日期了！</p>
-                    
-                    <div class="capsule-info">
-                        <h3>📦 胶囊信息</h3>
-                        <p><strong>标题：</strong>{capsule_title}</p>
-                        <p><strong>开启日期：</strong>{open_date}</p>
-                        <p><strong>状态：</strong>🔓 等待开启</p>
-                    </div>
-                    
-                    <p>时光流逝，当初封存的记忆即将重现。请在开启日期后登录系统查看您的胶囊内容。</p>
-                    
-                    <div style="text-align: center;">
-                        <p>祝您回忆愉快！✨</p>
-                    </div>
-                </div>
-                <div class="footer">
-                    <p>此邮件由时间胶囊系统自动发送，请勿回复</p>
-                    <p>开启时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-        
-        # 创建SSL上下文
-        context = ssl.create_default_context()
-        
-        # 发送邮件
-        with smtplib.SMTP_SSL(email_config.SMTP_SERVER, email_config.SMTP_PORT, context=context) as server:
-            server.login(email_config.SENDER_EMAIL, email_config.SENDER_PASSWORD)
-            server.sendmail(email_config.SENDER_EMAIL, to_email, msg.as_string())
+        # 通过连接池发送邮件
+        get_pool().send(to_email, message)
             
         print(f"邮件发送成功：{to_email}")
         return True, None
@@ -141,78 +257,9 @@ def send_welcome_email(to_email, username):
         str: 错误信息（如果失败）
     """
     try:
-        msg = MIMEMultipart()
-        msg['From'] = formataddr((email_config.SENDER_NAME, email_config.SENDER_EMAIL))
-        msg['To'] = formataddr((username, to_email))
-        msg['Subject'] = f'🎉 欢迎加入时间胶囊！'
-        
-        html_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: 'Microsoft YaHei', Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .header {{
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    padding: 30px;
-                    text-align: center;
-                    border-radius: 10px 10px 0 0;
-                }}
-                .content {{
-                    background: #f8f9fa;
-                    padding: 30px;
-                    border-radius: 0 0 10px 10px;
-                }}
-                .footer {{
-                    text-align: center;
-                    color: #666;
-                    margin-top: 20px;
-                    font-size: 12px;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🎉 欢迎加入时间胶囊！</h1>
-                </div>
-                <div class="content">
-                    <p>亲爱的 <strong>{username}</strong>：</p>
-                    <p>感谢您注册时间胶囊系统！</p>
-                    <p>时间胶囊是一个情感化的记忆回溯系统，让您可以：</p>
-                    <ul>
-                        <li>🕐 创建时间胶囊，设定未来开启日期</li>
-                        <li>📝 添加文字、心情、标签和图片</li>
-                        <li>🔓 到达开启日期后解封胶囊</li>
-                        <li>📊 查看心情统计变化趋势</li>
-                        <li>🎲 随机回顾过去开启的胶囊</li>
-                    </ul>
-                    <p>开始记录您的人生故事吧！✨</p>
-                </div>
-                <div class="footer">
-                    <p>此邮件由时间胶囊系统自动发送，请勿回复</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-        
-        context = ssl.create_default_context()
+        message = email_templates.WELCOME.render(to_email, username)
         
-        with smtplib.SMTP_SSL(email_config.SMTP_SERVER, email_config.SMTP_PORT, context=context) as server:
-            server.login(email_config.SENDER_EMAIL, email_config.SENDER_PASSWORD)
-            server.sendmail(email_config.SENDER_EMAIL, to_email, msg.as_string())
+        get_pool().send(to_email, message)
             
         print(f"欢迎邮件发送成功：{to_email}")
         return True, None
@@ -0,0 +1,281 @@
+"""
+邮件模板
+
+模板在导入时编译一次，渲染时只替换收件人相关的字段（${username} 等），
+邮件头、MIME 结构和发件人地址都预先生成，不再为每封邮件构造 MIMEMultipart。
+"""
+
+import base64
+import functools
+import html
+import secrets
+from datetime import datetime
+from email.errors import HeaderParseError
+from email.header import Header
+from email.utils import formataddr
+from string import Template
+
+import email_config
+
+
+@functools.lru_cache(maxsize=256)
+def _encode_header(value):
+    """非 ASCII 的邮件头按 RFC 2047 编码"""
+    try:
+        value.encode('ascii')
+        return value
+    except UnicodeEncodeError:
+        return Header(value, 'utf-8').encode()
+
+
+def _check_header(value):
+    """邮件头的值不能含换行，否则可以注入额外的邮件头（与 email 包生成邮件时的检查相同）"""
+    if '\r' in value or '\n' in value:
+        raise HeaderParseError(f'header value appears to contain an embedded header: {value!r}')
+    return value
+
+
+def _single_line(value):
+    """主题中的字段（胶囊标题等）把换行替换为空格"""
+    return ' '.join(str(value).splitlines())
+
+
+@functools.lru_cache(maxsize=16)
+def _sender_header(name, address):
+    return formataddr((_check_header(name), _check_header(address)))
+
+
+class MessageTemplate:
+    """
+    预编译的 HTML 邮件模板
+
+    生成的邮件结构与 MIMEMultipart + MIMEText(html, 'html', 'utf-8') 相同。
+    HTML 中的字段会做转义；主题中的字段去掉换行，收件人地址和名称含换行时抛出 HeaderParseError。
+
+    Args:
+        subject: 主题模板（string.Template 语法）
+        body: HTML 正文模板（string.Template 语法）
+    """
+
+    def __init__(self, subject, body):
+        self.subject = Template(subject)
+        self.body = Template(body)
+        self._boundary = f'==============={secrets.randbelow(10 ** 19):019d}=='
+        self._part_header = (
+            f'--{self._boundary}\n'
+            'Content-Type: text/html; charset="utf-8"\n'
+            'MIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: base64\n\n'
+        )
+        self._footer = f'--{self._boundary}--\n'
+        # 主题不含字段时只编码一次
+        self._static_subject = _encode_header(subject) if not self.subject.get_identifiers() else None
+
+    def _render(self, sender, to_email, username, fields):
+        to_header = formataddr((_check_header(username), _check_header(to_email)))
+        subject = self._static_subject or _encode_header(
+            self.subject.substitute({key: _single_line(value) for key, value in fields.items()}))
+        escaped = {key: html.escape(str(value)) for key, value in fields.items()}
+        body = self.body.substitute(escaped, username=html.escape(username))
+        encoded_body = base64.encodebytes(body.encode('utf-8')).decode('ascii')
+        return (
+            f'Content-Type: multipart/mixed; boundary="{self._boundary}"\n'
+            'MIME-Version: 1.0\n'
+            f'From: {sender}\n'
+            f'To: {to_header}\n'
+            f'Subject: {subject}\n\n'
+            f'{self._part_header}{encoded_body}{self._footer}'
+        )
+
+    def render(self, to_email, username, **fields):
+        """
+        生成一封邮件
+
+        Args:
+            to_email: 收件人邮箱
+            username: 收件人名称
+            **fields: 模板中的其他字段
+
+        Returns:
+            str: 完整的邮件文本
+
+        Raises:
+            HeaderParseError: 收件人地址或名称含换行
+        """
+        return self.render_many([dict(fields, to_email=to_email, username=username)])[0]
+
+    def render_many(self, recipients):
+        """
+        批量生成邮件，发件人、发送时间等公共部分只计算一次
+
+        Args:
+            recipients: 字典列表，每个字典包含 to_email、username 和模板字段
+
+        Returns:
+            list: 与 recipients 顺序对应的邮件文本
+
+        Raises:
+            HeaderParseError: 有收件人的地址或名称含换行
+        """
+        sender = _sender_header(email_config.SENDER_NAME, email_config.SENDER_EMAIL)
+        sent_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        messages = []
+        for recipient in recipients:
+            fields = dict(recipient)
+            to_email = fields.pop('to_email')
+            username = fields.pop('username')
+            fields.setdefault('sent_time', sent_time)
+            messages.append(self._render(sender, to_email, username, fields))
+        return messages
+
+
+REMINDER_SUBJECT = '📬 您的时间胶囊"${capsule_title}"即将开启！'
+
+REMINDER_BODY = """\
+<html>
+<head>
+    <style>
+        body {
+            font-family: 'Microsoft YaHei', Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }
+        .container {
+            max-width: 600px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        .header {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 30px;
+            text-align: center;
+            border-radius: 10px 10px 0 0;
+        }
+        .content {
+            background: #f8f9fa;
+            padding: 30px;
+            border-radius: 0 0 10px 10px;
+        }
+        .capsule-info {
+            background: white;
+            padding: 20px;
+            border-radius: 8px;
+            margin: 20px 0;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        .footer {
+            text-align: center;
+            color: #666;
+            margin-top: 20px;
+            font-size: 12px;
+        }
+        .btn {
+            display: inline-block;
+            padding: 12px 30px;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            text-decoration: none;
+            border-radius: 25px;
+            margin: 20px 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🕐 时间胶囊提醒</h1>
+        </div>
+        <div class="content">
+            <p>亲爱的 <strong>${username}</strong>：</p>
+            <p>您好！您创建的时间胶囊即将到开启日期了！</p>
+
+            <div class="capsule-info">
+                <h3>📦 胶囊信息</h3>
+                <p><strong>标题：</strong>${capsule_title}</p>
+                <p><strong>开启日期：</strong>${open_date}</p>
+                <p><strong>状态：</strong>🔓 等待开启</p>
+            </div>
+
+            <p>时光流逝，当初封存的记忆即将重现。请在开启日期后登录系统查看您的胶囊内容。</p>
+
+            <div style="text-align: center;">
+                <p>祝您回忆愉快！✨</p>
+            </div>
+        </div>
+        <div class="footer">
+            <p>此邮件由时间胶囊系统自动发送，请勿回复</p>
+            <p>开启时间：${sent_time}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+WELCOME_SUBJECT = '🎉 欢迎加入时间胶囊！'
+
+WELCOME_BODY = """\
+<html>
+<head>
+    <style>
+        body {
+            font-family: 'Microsoft YaHei', Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }
+        .container {
+            max-width: 600px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        .header {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 30px;
+            text-align: center;
+            border-radius: 10px 10px 0 0;
+        }
+        .content {
+            background: #f8f9fa;
+            padding: 30px;
+            border-radius: 0 0 10px 10px;
+        }
+        .footer {
+            text-align: center;
+            color: #666;
+            margin-top: 20px;
+            font-size: 12px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🎉 欢迎加入时间胶囊！</h1>
+        </div>
+        <div class="content">
+            <p>亲爱的 <strong>${username}</strong>：</p>
+            <p>感谢您注册时间胶囊系统！</p>
+            <p>时间胶囊是一个情感化的记忆回溯系统，让您可以：</p>
+            <ul>
+                <li>🕐 创建时间胶囊，设定未来开启日期</li>
+                <li>📝 添加文字、心情、标签和图片</li>
+                <li>🔓 到达开启日期后解封胶囊</li>
+                <li>📊 查看心情统计变化趋势</li>
+                <li>🎲 随机回顾过去开启的胶囊</li>
+            </ul>
+            <p>开始记录您的人生故事吧！✨</p>
+        </div>
+        <div class="footer">
+            <p>此邮件由时间胶囊系统自动发送，请勿回复</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+# 胶囊开启提醒：字段 capsule_title、open_date
+REMINDER = MessageTemplate(REMINDER_SUBJECT, REMINDER_BODY)
+
+# 注册欢迎邮件
+WELCOME = MessageTemplate(WELCOME_SUBJECT, WELCOME_BODY)
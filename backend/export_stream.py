@@ -0,0 +1,161 @@
+"""
+流式导出
+
+胶囊逐行从数据库游标读取、边读边写到分块传输（Transfer-Encoding: chunked）的响应中，
+服务器内存占用与胶囊数量无关，客户端收到响应头后即可开始保存文件。
+
+格式：
+    json    {"capsules": [...], "export_date": "..."}，与原导出接口相同
+    ndjson  每行一个胶囊
+    zip     capsules.json 加上胶囊引用的图片（保存在 uploads/ 目录下，路径与 image_path 一致）
+"""
+
+import zipfile
+
+import compression
+import json_codec
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'zip': ('application/zip', 'zip'),
+}
+
+# 凑够该字节数再发送一个分块
+CHUNK_SIZE = 64 * 1024
+
+
+class ChunkedWriter:
+    """
+    把写入的数据按分块传输编码发送给客户端（HTTP/1.0 客户端直接写出并在结束后关闭连接）
+
+    只提供 write/flush/close，没有 tell/seek，zipfile 会按不可定位的流写入。
+    """
+
+    def __init__(self, handler, compressor=None, chunk_size=CHUNK_SIZE):
+        self._wfile = handler.wfile
+        self._chunked = handler.request_version == 'HTTP/1.1'
+        self._compressor = compressor
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._send()
+        return len(data)
+
+    def flush(self):
+        # zipfile 每写完一个文件都会调用 flush()，这里不发送，由 write() 凑满分块
+        pass
+
+    def close(self):
+        """发送剩余数据和结束分块"""
+        if self._compressor is not None:
+            self._buffer += self._compressor.flush()
+        self._send()
+        if self._chunked:
+            self._wfile.write(b'0\r\n\r\n')
+
+    def _send(self):
+        if not self._buffer:
+            return
+        if self._chunked:
+            self._wfile.write(b'%x\r\n' % len(self._buffer) + self._buffer + b'\r\n')
+        else:
+            self._wfile.write(self._buffer)
+        self._buffer.clear()
+
+
+def _start_response(handler, export_format, export_date, encoding):
+    content_type, extension = EXPORT_FORMATS[export_format]
+    handler.send_response(200)
+    handler.send_header('Content-type', content_type)
+    handler.send_header('Content-Disposition', f'attachment; filename="time-capsules-{export_date[:10]}.{extension}"')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('Cache-Control', 'no-store')
+    if encoding:
+        handler.send_header('Content-Encoding', encoding)
+    if handler.request_version == 'HTTP/1.1':
+        handler.send_header('Transfer-Encoding', 'chunked')
+    else:
+        handler.close_connection = True
+    handler.end_headers()
+
+
+def _write_json(out, rows, export_date):
+    out.write(b'{"capsules":[')
+    for index, row in enumerate(rows):
+        if index:
+            out.write(b',')
+        out.write(row)
+    out.write(b'],"export_date":' + json_codec.dumps(export_date) + b'}')
+
+
+def _write_ndjson(out, rows):
+    for row in rows:
+        out.write(row + b'\n')
+
+
+def _write_zip(out, rows, export_date, image_paths, resolve_path):
+    with zipfile.ZipFile(out, 'w') as archive:
+        info = zipfile.ZipInfo('capsules.json', date_time=_zip_date_time(export_date))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w', force_zip64=True) as entry:
+            _write_json(entry, rows, export_date)
+
+        # 图片本身已经压缩，直接存储
+        for image_path in image_paths:
+            filepath = resolve_path(image_path[len('/uploads/'):])
+            if not filepath:
+                continue
+            try:
+                archive.write(filepath, image_path.lstrip('/'), compress_type=zipfile.ZIP_STORED)
+            except FileNotFoundError:
+                print(f'[EXPORT] Missing image skipped: {image_path}')
+
+
+def _zip_date_time(export_date):
+    """'2024-01-02T03:04:05.678' -> (2024, 1, 2, 3, 4, 5)"""
+    date, _, time = export_date.partition('T')
+    return tuple(int(part) for part in date.split('-')) + tuple(int(float(part)) for part in time.split(':'))
+
+
+def stream_export(handler, export_format, rows, export_date, image_paths=(), resolve_path=None):
+    """
+    以分块传输发送导出文件
+
+    响应头发出后出错（包括客户端中途断开）时无法再返回错误状态码，
+    只记录日志并关闭连接，客户端会收到不完整的响应。
+
+    Args:
+        handler: 请求处理器
+        export_format: 'json'、'ndjson' 或 'zip'
+        rows: 胶囊 JSON 文本的迭代器（见 json_codec.iter_json_rows）
+        export_date: 导出时间（ISO 格式）
+        image_paths: 要打包的图片 image_path 迭代器（仅 zip）
+        resolve_path: 把 /uploads/ 之后的路径映射为文件路径的函数（仅 zip）
+    """
+    # zip 内部已经压缩，不再做传输压缩
+    compressor = None
+    if export_format != 'zip':
+        compressor = compression.StreamCompressor(handler.headers.get('Accept-Encoding', ''))
+    _start_response(handler, export_format, export_date, compressor and compressor.encoding)
+
+    out = ChunkedWriter(handler, compressor if compressor and compressor.encoding else None)
+    try:
+        if export_format == 'zip':
+            _write_zip(out, rows, export_date, image_paths, resolve_path)
+        elif export_format == 'ndjson':
+            _write_ndjson(out, rows)
+        else:
+            _write_json(out, rows, export_date)
+        out.close()
+    except (BrokenPipeError, ConnectionResetError):
+        print('[EXPORT] Client disconnected during export')
+        handler.close_connection = True
+    except Exception as e:
+        print(f'[EXPORT] Export aborted: {str(e)}')
+        handler.close_connection = True
@@ -0,0 +1,122 @@
+"""
+JSON 编解码
+
+安装了 orjson 时使用 orjson，否则使用紧凑格式的标准库 json（无多余空格、不转义中文）。
+大列表可以用 query_json_array() 让 SQLite 直接生成 JSON 文本，不为每行构造 Python 字典。
+
+依赖 orjson（可选）：未安装时使用标准库 json。
+"""
+
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装
+    orjson = None
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+# 解析失败时抛出的异常（orjson.JSONDecodeError 也是它的子类）
+JSONDecodeError = json.JSONDecodeError
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj):
+    """
+    序列化为 UTF-8 字节串
+
+    Returns:
+        bytes: JSON 文本
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def loads(data):
+    """
+    解析 JSON（bytes 或 str）
+
+    Raises:
+        JSONDecodeError: 格式错误或编码无效
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise JSONDecodeError(str(e), '', 0)
+    return json.loads(data)
+
+
+# SQL 语句 -> 结果列名
+_columns_cache = {}
+_columns_lock = threading.Lock()
+
+
+def _result_columns(conn, sql, params):
+    with _columns_lock:
+        columns = _columns_cache.get(sql)
+    if columns is None:
+        cursor = conn.execute(f'SELECT * FROM ({sql}) LIMIT 0', params)
+        columns = [description[0] for description in cursor.description]
+        with _columns_lock:
+            _columns_cache[sql] = columns
+    return columns
+
+
+def _quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def query_json_array(conn, sql, params=()):
+    """
+    执行查询并由 SQLite 直接生成 JSON 数组（每行一个对象，键为列名）
+
+    行按 sql 中的 ORDER BY 排列：外层是聚合查询时 SQLite 不会展开带 ORDER BY 的子查询。
+
+    Args:
+        conn: 数据库连接
+        sql: SELECT 语句
+        params: 查询参数
+
+    Returns:
+        bytes: JSON 数组文本
+    """
+    columns = _result_columns(conn, sql, params)
+    fields = ', '.join(f'{_quote_string(name)}, {_quote_identifier(name)}' for name in columns)
+    row = conn.execute(
+        f'SELECT json_group_array(json_object({fields})) FROM ({sql})', params
+    ).fetchone()
+    return row[0].encode('utf-8')
+
+
+def iter_json_rows(conn, sql, params=(), batch_size=500):
+    """
+    执行查询并逐行返回由 SQLite 生成的 JSON 对象，按批从游标读取，内存占用与结果行数无关
+
+    Args:
+        conn: 数据库连接
+        sql: SELECT 语句
+        params: 查询参数
+        batch_size: 每次从游标读取的行数
+
+    Yields:
+        bytes: 一行对应的 JSON 对象文本
+    """
+    columns = _result_columns(conn, sql, params)
+    fields = ', '.join(f'{_quote_string(name)}, {_quote_identifier(name)}' for name in columns)
+    cursor = conn.execute(f'SELECT json_object({fields}) FROM ({sql})', params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield row[0].encode('utf-8')
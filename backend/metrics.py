@@ -0,0 +1,213 @@
+"""
+请求指标
+
+进程内的计数器、仪表和直方图，GET /metrics 以 Prometheus 文本格式输出。
+每个请求结束时只做几次加锁的累加（observe_request），不访问数据库；输出时才格式化文本。
+"""
+
+import bisect
+import threading
+
+# 请求耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}' for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}' for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """按桶统计的分布（每个标签组合保存各桶计数、总和与总数）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class Registry:
+    """指标集合；collectors 在输出时调用，用于读取连接池等组件的当前状态"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector):
+        """
+        注册采集函数
+
+        Args:
+            collector: 无参函数，返回 [(指标名, 类型, 说明, 值)] 列表；值为 None 的项不输出
+        """
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """
+        生成 Prometheus 文本格式
+
+        Returns:
+            bytes: 响应体
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f'[METRICS] Collector failed: {e}')
+                continue
+            for name, kind, help_text, value in samples:
+                if value is None:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_format_value(value)}')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+registry = Registry()
+
+REQUEST_LABELS = ('method', 'route')
+
+request_duration = registry.histogram(
+    'capsule_http_request_duration_seconds', 'HTTP request latency by route', REQUEST_LABELS)
+request_db_duration = registry.histogram(
+    'capsule_http_request_db_seconds', 'SQLite execute time per HTTP request by route', REQUEST_LABELS)
+responses = registry.counter(
+    'capsule_http_responses_total', 'HTTP responses by route and status code', REQUEST_LABELS + ('status',))
+in_flight = registry.gauge(
+    'capsule_http_requests_in_flight', 'HTTP requests currently being handled')
+in_flight.set(0)
+upload_bytes = registry.counter(
+    'capsule_upload_bytes_total', 'Bytes received in uploaded files')
+upload_bytes.inc(amount=0)
+uploads = registry.counter(
+    'capsule_uploads_total', 'Uploaded files by result', ('result',))
+
+
+def observe_request(method, route, status, duration, db_seconds):
+    """
+    记录一个请求
+
+    Args:
+        method: HTTP 方法
+        route: 路由模式（未匹配的请求为 'unmatched'，避免标签数量随 URL 增长）
+        status: 响应状态码
+        duration: 总耗时（秒）
+        db_seconds: SQL 执行耗时（秒）
+    """
+    request_duration.observe(duration, method, route)
+    request_db_duration.observe(db_seconds, method, route)
+    responses.inc(method, route, status)
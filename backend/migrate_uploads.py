@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+迁移工具：把旧的平铺上传文件（uploads/<uuid>.jpg）迁移到按内容寻址的存储
+
+对每个旧文件计算 SHA-256，移动到 uploads/ab/cd/<sha256>.jpg（内容相同的文件只保留一份），
+并更新引用它的胶囊的 image_path。可以重复运行，已迁移的文件不会再处理。
+
+用法：python migrate_uploads.py
+"""
+
+import sys
+import os
+import re
+import glob
+import hashlib
+import time
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app
+import upload_store
+from db import get_db
+
+# 缩略图文件名：<stem>_w320.jpg
+VARIANT_PATTERN = re.compile(r'_w\d+\.\w+$')
+
+
+def hash_file(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def migrate_uploads():
+    """
+    迁移所有旧上传文件
+
+    Returns:
+        int: 迁移的文件数
+    """
+    # 确保 uploads 表和引用计数触发器已建立
+    app.init_db()
+
+    folder = upload_store.UPLOAD_FOLDER
+    migrated = 0
+    deduplicated = 0
+
+    for name in sorted(os.listdir(folder)):
+        old_path = os.path.join(folder, name)
+        if not os.path.isfile(old_path) or name.startswith('.') or '.' not in name:
+            continue
+        if VARIANT_PATTERN.search(name):
+            continue
+
+        ext = name.rsplit('.', 1)[1].lower()
+        sha256 = hash_file(old_path)
+        size = os.path.getsize(old_path)
+        old_image_path = f'/uploads/{name}'
+
+        # 删除旧缩略图，首次请求新文件的缩略图时会重新生成
+        stem = os.path.splitext(old_path)[0]
+        for variant in glob.glob(glob.escape(stem) + '_w*'):
+            os.unlink(variant)
+
+        image_path, filepath, is_duplicate = upload_store.store_file(old_path, sha256, ext, size)
+
+        # 先登记文件再改 image_path，由触发器统计引用数
+        conn = get_db()
+        cursor = conn.execute('UPDATE capsules SET image_path = ? WHERE image_path = ?', (image_path, old_image_path))
+        conn.commit()
+        conn.close()
+
+        migrated += 1
+        if is_duplicate:
+            deduplicated += 1
+        print(f'{name} -> {image_path}（{cursor.rowcount} 个胶囊）{"，重复文件已删除" if is_duplicate else ""}')
+
+    print(f'\n迁移完成：{migrated} 个文件，其中 {deduplicated} 个为重复文件')
+    return migrated
+
+
+def recount_references():
+    """按 capsules 表重新计算所有文件的引用数（修复计数偏差）"""
+    conn = get_db()
+    conn.execute('''
+        UPDATE uploads SET ref_count = (
+            SELECT COUNT(*) FROM capsules WHERE capsules.image_path = uploads.path
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+if __name__ == '__main__':
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 开始迁移上传文件...")
+    migrate_uploads()
+    recount_references()
+    upload_store.collect_garbage()
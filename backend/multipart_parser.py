@@ -0,0 +1,197 @@
+"""
+流式 multipart/form-data 解析器
+
+按块读取请求体，文件字段边读边写入临时文件，
+内存占用只与块大小有关，与上传文件的大小无关。
+"""
+
+import hashlib
+import os
+import tempfile
+from email.parser import BytesHeaderParser
+
+# 每次从请求体读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+# 单个分段头部的最大字节数
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class MultipartError(ValueError):
+    """请求体格式错误，或上传的文件不符合要求"""
+
+
+class UploadedFile:
+    """
+    已写入临时文件的上传文件
+
+    Attributes:
+        filename: 客户端提供的原始文件名（已去掉目录部分）
+        path: 临时文件路径，由调用方负责移动或删除
+        size: 文件字节数
+        sha256: 文件内容的 SHA-256（十六进制），写入过程中同步计算
+    """
+
+    def __init__(self, filename, path, size):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = None
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_boundary(content_type):
+    """
+    从 Content-Type 请求头中取出 boundary
+
+    Raises:
+        MultipartError: 缺少 boundary
+    """
+    msg = BytesHeaderParser().parsebytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n')
+    boundary = msg.get_param('boundary')
+    if not boundary:
+        raise MultipartError('Missing multipart boundary')
+    return boundary.encode('latin-1')
+
+
+class _BodyReader:
+    """从 rfile 中最多读取 content_length 字节，并维护一个小缓冲区"""
+
+    def __init__(self, stream, content_length):
+        self.stream = stream
+        self.remaining = content_length
+        self.buffer = b''
+
+    def fill(self):
+        """再读入一块数据，请求体已读完时返回 False"""
+        if self.remaining <= 0:
+            return False
+        chunk = self.stream.read(min(CHUNK_SIZE, self.remaining))
+        if not chunk:
+            self.remaining = 0
+            return False
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def read_until(self, marker, limit):
+        """读取到 marker 为止（不含 marker），超过 limit 字节仍未找到时报错"""
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                data = self.buffer[:index]
+                self.buffer = self.buffer[index + len(marker):]
+                return data
+            if len(self.buffer) > limit:
+                raise MultipartError('Malformed multipart body')
+            if not self.fill():
+                raise MultipartError('Unexpected end of multipart body')
+
+    def drain(self):
+        """丢弃请求体中剩余的数据（结束分隔符之后的尾部）"""
+        while self.fill():
+            self.buffer = b''
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            if not self.fill():
+                raise MultipartError('Unexpected end of multipart body')
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+    def stream_until(self, marker, write):
+        """把 marker 之前的数据分块交给 write，缓冲区只保留可能属于 marker 的尾部"""
+        keep = len(marker) - 1
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                if index:
+                    write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(marker):]
+                return
+            if len(self.buffer) > keep:
+                write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                raise MultipartError('Unexpected end of multipart body')
+
+
+def receive_file(stream, content_length, boundary, field_name, temp_dir, max_size, is_allowed):
+    """
+    流式读取 multipart 请求体，把指定文件字段写入 temp_dir 下的临时文件
+
+    文件扩展名在读到分段头部时立即检查，文件大小在写入过程中检查，
+    不符合要求时立刻中止读取。
+
+    Args:
+        stream: 请求体输入流（handler.rfile）
+        content_length: 请求体字节数
+        boundary: parse_boundary() 返回的分隔符
+        field_name: 文件字段名
+        temp_dir: 临时文件目录，应与最终目录在同一文件系统以便原子重命名
+        max_size: 文件最大字节数
+        is_allowed: 判断文件名是否允许上传的函数
+
+    Returns:
+        UploadedFile: 上传的文件；请求中没有该字段或文件为空时返回 None
+
+    Raises:
+        MultipartError: 请求体格式错误、文件类型不允许或文件过大
+    """
+    reader = _BodyReader(stream, content_length)
+    delimiter = b'--' + boundary
+    separator = b'\r\n' + delimiter
+    uploaded = None
+
+    # 跳过第一个分隔符之前的内容
+    reader.read_until(delimiter, MAX_HEADER_SIZE)
+
+    try:
+        while True:
+            if reader.read_exact(2) == b'--':
+                break
+
+            header_bytes = reader.read_until(b'\r\n\r\n', MAX_HEADER_SIZE)
+            headers = BytesHeaderParser().parsebytes(header_bytes.lstrip(b'\r\n') + b'\r\n\r\n')
+            name = headers.get_param('name', header='content-disposition')
+            filename = headers.get_filename()
+
+            if uploaded is None and name == field_name and filename:
+                filename = os.path.basename(filename)
+                if not is_allowed(filename):
+                    raise MultipartError('Invalid file type. Allowed: png, jpg, jpeg, gif, webp')
+
+                fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix='.upload-', suffix='.tmp')
+                uploaded = UploadedFile(filename, temp_path, 0)
+                digest = hashlib.sha256()
+                with os.fdopen(fd, 'wb') as f:
+                    def write(data):
+                        uploaded.size += len(data)
+                        if uploaded.size > max_size:
+                            raise MultipartError(f'File too large. Maximum size is {max_size // (1024*1024)}MB')
+                        digest.update(data)
+                        f.write(data)
+
+                    reader.stream_until(separator, write)
+                uploaded.sha256 = digest.hexdigest()
+            else:
+                # 其他字段直接丢弃
+                reader.stream_until(separator, lambda data: None)
+
+        # 读完请求体，以便连接可以继续处理下一个请求
+        reader.drain()
+    except BaseException:
+        if uploaded is not None:
+            uploaded.discard()
+        raise
+
+    if uploaded is not None and uploaded.size == 0:
+        uploaded.discard()
+        return None
+    return uploaded
@@ -0,0 +1,279 @@
+"""
+邮件发件箱：持久化的提醒邮件队列
+
+HTTP 接口和定时脚本只把提醒写入 email_outbox 表，由后台线程领取并发送。
+发送失败按指数退避重试并记录尝试次数，永久性错误或超过最大次数的任务标记为 dead，
+不再重试，可在表中查看 last_error 排查。
+
+任务状态：pending（等待发送）-> sending（已领取）-> sent / dead
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.errors import HeaderParseError
+
+import email_sender
+from db import get_db
+
+# 每次领取的任务数
+OUTBOX_BATCH_SIZE = 20
+
+# 队列为空时的轮询间隔（秒）；新任务入队时会立即唤醒
+OUTBOX_POLL_INTERVAL = 30
+
+# 领取后的租约秒数，进程崩溃时租约过期的任务会被重新领取
+OUTBOX_LEASE_SECONDS = 300
+
+# 最大尝试次数，超过后进入 dead 状态
+OUTBOX_MAX_ATTEMPTS = 6
+
+# 退避时间：第 n 次失败后等待 BACKOFF_BASE * 2^(n-1) 秒，不超过 BACKOFF_MAX
+OUTBOX_BACKOFF_BASE = 60
+OUTBOX_BACKOFF_MAX = 6 * 3600
+
+KIND_REMINDER = 'reminder'
+
+
+def backoff_seconds(attempts):
+    """第 attempts 次失败后的等待秒数"""
+    return min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+
+def enqueue_reminders(conn, capsules):
+    """
+    把提醒邮件写入发件箱（不提交事务）
+
+    每个胶囊只会入队一次（kind + capsule_id 唯一），重复调用不会重复发送。
+
+    Args:
+        conn: 数据库连接
+        capsules: 含 id、title、open_date、username、email 字段的胶囊行
+
+    Returns:
+        int: 新入队的任务数
+    """
+    now = time.time()
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT OR IGNORE INTO email_outbox (kind, capsule_id, to_email, payload, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (KIND_REMINDER, capsule['id'], capsule['email'], json.dumps({
+            'username': capsule['username'],
+            'capsule_title': capsule['title'],
+            'open_date': capsule['open_date'],
+        }, ensure_ascii=False), now, now)
+        for capsule in capsules
+    ])
+    return conn.total_changes - before
+
+
+def claim(limit=OUTBOX_BATCH_SIZE):
+    """
+    领取到期的任务（包括租约已过期的 sending 任务）
+
+    单条 UPDATE ... RETURNING 完成领取，多个进程同时运行也不会重复领取。
+
+    Returns:
+        list: 已领取的任务行
+    """
+    now = time.time()
+    conn = get_db()
+    try:
+        jobs = conn.execute('''
+            UPDATE email_outbox
+            SET status = 'sending', locked_until = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND locked_until < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            )
+            RETURNING id, kind, capsule_id, to_email, payload, attempts
+        ''', (now + OUTBOX_LEASE_SECONDS, now, now, limit)).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return jobs
+
+
+def _render(jobs):
+    """
+    批量生成任务的邮件文本
+
+    Returns:
+        list: 邮件文本；payload 或邮件头无效的任务对应的位置为异常对象
+    """
+    reminders = []
+    errors = {}
+    for index, job in enumerate(jobs):
+        try:
+            payload = json.loads(job['payload'])
+            reminders.append((job['to_email'], payload['username'], payload['capsule_title'], payload['open_date']))
+        except (ValueError, KeyError) as e:
+            errors[index] = e
+            reminders.append((job['to_email'], '', '', ''))
+    try:
+        messages = email_sender.build_reminder_messages(reminders)
+    except HeaderParseError:
+        # 有任务的收件人地址或名称含换行：逐封生成，只让这些任务失败
+        messages = []
+        for reminder in reminders:
+            try:
+                messages.extend(email_sender.build_reminder_messages([reminder]))
+            except HeaderParseError as e:
+                messages.append(e)
+    for index, error in errors.items():
+        messages[index] = error
+    return messages
+
+
+def _deliver(job, message):
+    """
+    发送一个任务
+
+    Returns:
+        Exception: 发送失败时的错误，成功时返回 None
+    """
+    if isinstance(message, Exception):
+        return message
+    try:
+        email_sender.get_pool().send(job['to_email'], message)
+    except Exception as e:
+        return e
+    return None
+
+
+def _record_results(jobs, errors):
+    now = time.time()
+    sent = []
+    retry = []
+    dead = []
+    for job, error in zip(jobs, errors):
+        if error is None:
+            sent.append(job)
+        elif email_sender.is_permanent_error(error) or job['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+            dead.append((str(error), job['id']))
+        else:
+            retry.append((now + backoff_seconds(job['attempts']), str(error), job['id']))
+
+    conn = get_db()
+    try:
+        conn.executemany(
+            "UPDATE email_outbox SET status = 'sent', sent_at = ?, locked_until = NULL, last_error = NULL WHERE id = ?",
+            [(now, job['id']) for job in sent]
+        )
+        conn.executemany(
+            'UPDATE capsules SET email_sent = 1 WHERE id = ?',
+            [(job['capsule_id'],) for job in sent if job['kind'] == KIND_REMINDER]
+        )
+        conn.executemany(
+            "UPDATE email_outbox SET status = 'pending', next_attempt_at = ?, locked_until = NULL, last_error = ? WHERE id = ?",
+            retry
+        )
+        conn.executemany(
+            "UPDATE email_outbox SET status = 'dead', locked_until = NULL, last_error = ? WHERE id = ?",
+            dead
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    for job, error in zip(jobs, errors):
+        if error is not None:
+            print(f'[OUTBOX] Job {job["id"]} to {job["to_email"]} failed (attempt {job["attempts"]}): {error}')
+    if dead:
+        print(f'[OUTBOX] {len(dead)} jobs moved to dead letter')
+    return len(sent), len(retry) + len(dead)
+
+
+def process_batch(limit=OUTBOX_BATCH_SIZE):
+    """
+    领取并发送一批任务（通过 SMTP 连接池并发发送）
+
+    Returns:
+        int: 领取的任务数
+        int: 成功数
+        int: 失败数
+    """
+    jobs = claim(limit)
+    if not jobs:
+        return 0, 0, 0
+    with ThreadPoolExecutor(max_workers=email_sender.get_pool().size, thread_name_prefix='outbox-sender') as executor:
+        errors = list(executor.map(_deliver, jobs, _render(jobs)))
+    sent, failed = _record_results(jobs, errors)
+    return len(jobs), sent, failed
+
+
+def run_pending():
+    """
+    发送所有已到期的任务，直到没有可领取的任务（供定时脚本使用）
+
+    Returns:
+        int: 成功数
+        int: 失败数
+    """
+    total_sent = 0
+    total_failed = 0
+    while True:
+        claimed, sent, failed = process_batch()
+        if not claimed:
+            return total_sent, total_failed
+        total_sent += sent
+        total_failed += failed
+
+
+def stats(conn):
+    """各状态的任务数"""
+    counts = {'pending': 0, 'sending': 0, 'sent': 0, 'dead': 0}
+    for row in conn.execute('SELECT status, COUNT(*) FROM email_outbox GROUP BY status'):
+        counts[row[0]] = row[1]
+    return counts
+
+
+class OutboxWorker:
+    """
+    在后台线程中持续发送发件箱任务
+
+    队列为空时每 poll_interval 秒检查一次，notify() 可立即唤醒。
+    """
+
+    def __init__(self, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                claimed, _, _ = process_batch()
+            except Exception as e:
+                print(f'[OUTBOX] Worker error: {e}')
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+
+
+worker = OutboxWorker()
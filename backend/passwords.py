@@ -0,0 +1,210 @@
+"""
+密码哈希
+
+新密码使用加盐的 scrypt（OpenSSL 不支持 scrypt 时使用 PBKDF2-SHA256）保存，格式：
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+salt 和 hash 为 base64。旧版本保存的是不加盐的 sha256 十六进制摘要，
+仍然可以验证，needs_rehash() 对它返回 True，登录成功后由调用方换成新格式。
+
+KDF 计算很慢（每次几十毫秒、scrypt 还要占用约 16MB 内存），
+请求线程通过 hash_in_pool / verify_in_pool 交给专用线程池执行，
+同时计算的数量固定为 HASH_WORKERS，登录高峰不会占满所有请求线程和 CPU。
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 哈希算法：scrypt / pbkdf2_sha256
+PASSWORD_SCHEME = os.environ.get('CAPSULE_PASSWORD_SCHEME', 'scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2_sha256')
+
+# scrypt 参数（内存占用约 128 * r * n 字节）
+SCRYPT_N = int(os.environ.get('CAPSULE_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# PBKDF2 迭代次数
+PBKDF2_ITERATIONS = int(os.environ.get('CAPSULE_PBKDF2_ITERATIONS', 600000))
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# 专用哈希线程数和最多排队的任务数（超过时拒绝，避免登录请求无限堆积）
+HASH_WORKERS = int(os.environ.get('CAPSULE_HASH_WORKERS', 2))
+HASH_MAX_PENDING = int(os.environ.get('CAPSULE_HASH_MAX_PENDING', 64))
+
+# 等待哈希结果的最长秒数
+HASH_TIMEOUT = 30
+
+
+class HashPoolBusy(RuntimeError):
+    """哈希线程池排队的任务过多"""
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n, dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, HASH_BYTES)
+
+
+def hash_password(password):
+    """
+    按当前配置计算密码哈希（在调用线程中执行）
+
+    Returns:
+        str: 编码后的哈希，保存在 users.password_hash
+    """
+    salt = secrets.token_bytes(SALT_BYTES)
+    if PASSWORD_SCHEME == 'scrypt':
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}'
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f'pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def verify_password(password, encoded):
+    """
+    校验密码（在调用线程中执行），摘要用 hmac.compare_digest 做常数时间比较
+
+    Returns:
+        bool: 密码是否正确；哈希格式无法识别时返回 False
+    """
+    try:
+        if encoded.startswith('scrypt$'):
+            _, n, r, p, salt, digest = encoded.split('$')
+            actual = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(actual, _b64decode(digest))
+        if encoded.startswith('pbkdf2_sha256$'):
+            _, iterations, salt, digest = encoded.split('$')
+            actual = _pbkdf2(password, _b64decode(salt), int(iterations))
+            return hmac.compare_digest(actual, _b64decode(digest))
+    except ValueError:
+        return False
+    # 旧格式：不加盐的 sha256 十六进制摘要
+    legacy = hashlib.sha256(password.encode('utf-8')).hexdigest()
+    return hmac.compare_digest(legacy.encode('ascii'), encoded.encode('utf-8'))
+
+
+def needs_rehash(encoded):
+    """哈希是旧格式或参数与当前配置不同时返回 True"""
+    if PASSWORD_SCHEME == 'scrypt':
+        return not encoded.startswith(f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$')
+    return not encoded.startswith(f'pbkdf2_sha256${PBKDF2_ITERATIONS}$')
+
+
+# 用户不存在时也校验一次，响应时间不暴露用户名是否存在
+_dummy_hash = None
+_dummy_lock = threading.Lock()
+
+
+def _get_dummy_hash():
+    global _dummy_hash
+    with _dummy_lock:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password(secrets.token_hex(16))
+        return _dummy_hash
+
+
+def _verify_unknown_user(password):
+    verify_password(password, _get_dummy_hash())
+    return False
+
+
+class HashPool:
+    """执行密码哈希的专用线程池"""
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or HASH_WORKERS
+        self.max_pending = max_pending or HASH_MAX_PENDING
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self):
+        # 调用方持有 self._lock
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='capsule-hash')
+        return self._executor
+
+    def start(self):
+        """启动线程池，并在池中预先计算用户不存在时使用的哈希（不让第一个这样的登录请求等待）"""
+        with self._lock:
+            self._ensure_executor().submit(_get_dummy_hash)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashPoolBusy('Too many pending password hashes')
+            self._ensure_executor()
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future.result(timeout=HASH_TIMEOUT)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        return self._submit(hash_password, password)
+
+    def verify(self, password, encoded):
+        return self._submit(verify_password, password, encoded)
+
+    def verify_unknown_user(self, password):
+        return self._submit(_verify_unknown_user, password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+pool = HashPool()
+
+
+def hash_in_pool(password):
+    """
+    在哈希线程池中计算密码哈希，当前线程等待结果
+
+    Raises:
+        HashPoolBusy: 排队的任务过多
+    """
+    return pool.hash(password)
+
+
+def verify_in_pool(password, encoded):
+    """
+    在哈希线程池中校验密码，当前线程等待结果
+
+    Args:
+        password: 明文密码
+        encoded: 保存的哈希；用户不存在时传 None，仍会做一次等价耗时的校验并返回 False
+
+    Raises:
+        HashPoolBusy: 排队的任务过多
+    """
+    if encoded is None:
+        return pool.verify_unknown_user(password)
+    return pool.verify(password, encoded)
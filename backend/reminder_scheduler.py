@@ -0,0 +1,191 @@
+"""
+进程内的胶囊开启提醒调度器
+
+按"开启日期 - 7 天"为键维护一个最小堆，后台线程睡眠到最早的提醒时间，
+到期时把提醒写入发件箱（outbox）。胶囊的创建、修改和删除会增量更新堆，
+服务启动时用一次索引查询重建，不再需要定时全表扫描。
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+import outbox
+from db import get_db
+
+# 提前多少天发送提醒
+REMINDER_LEAD_DAYS = 7
+
+# 线程最长睡眠秒数（兜底系统时间调整）
+MAX_SLEEP_SECONDS = 3600
+
+# 入队失败后重试的等待秒数
+RETRY_DELAY_SECONDS = 60
+
+
+def due_time(open_date):
+    """
+    提醒时间（时间戳）
+
+    Returns:
+        float: open_date 前 REMINDER_LEAD_DAYS 天的时间戳；日期格式无效时返回 None
+    """
+    try:
+        return (datetime.fromisoformat(open_date) - timedelta(days=REMINDER_LEAD_DAYS)).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ReminderScheduler:
+    """
+    capsule_id -> 提醒时间 的最小堆调度器（线程安全）
+
+    取消和改期不从堆中删除旧条目，而是在弹出时与 _due 比对后丢弃（惰性删除）。
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, capsule_id, open_date):
+        """新增或更新胶囊的提醒"""
+        due = due_time(open_date)
+        with self._cond:
+            if due is None:
+                self._due.pop(capsule_id, None)
+                return
+            self._due[capsule_id] = due
+            heapq.heappush(self._heap, (due, capsule_id))
+            self._compact()
+            self._cond.notify()
+
+    def cancel(self, capsule_id):
+        with self._cond:
+            self._due.pop(capsule_id, None)
+
+    def _compact(self):
+        # 过期条目过多时重建堆
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(due, capsule_id) for capsule_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def rebuild(self):
+        """从数据库加载所有待提醒的胶囊（使用 idx_capsules_reminder 索引）"""
+        conn = get_db()
+        try:
+            rows = conn.execute('''
+                SELECT id, open_date FROM capsules
+                WHERE is_opened = 0 AND email_sent = 0
+            ''').fetchall()
+        finally:
+            conn.close()
+
+        due = {}
+        for row in rows:
+            when = due_time(row['open_date'])
+            if when is not None:
+                due[row['id']] = when
+        with self._cond:
+            self._due = due
+            self._heap = [(when, capsule_id) for capsule_id, when in due.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        print(f'[REMINDER] Scheduled {len(due)} capsule reminders')
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._due)
+
+    def next_due(self):
+        """最早的提醒时间戳，没有待发提醒时返回 None"""
+        with self._cond:
+            return min(self._due.values(), default=None)
+
+    def _wait_for_due(self):
+        """阻塞直到有提醒到期，返回到期的 capsule_id 列表；停止时返回 None"""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait(MAX_SLEEP_SECONDS)
+                    continue
+                due, capsule_id = self._heap[0]
+                if self._due.get(capsule_id) != due:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due - time.time()
+                if delay > 0:
+                    self._cond.wait(min(delay, MAX_SLEEP_SECONDS))
+                    continue
+
+                now = time.time()
+                ready = []
+                while self._heap and self._heap[0][0] <= now:
+                    due, capsule_id = heapq.heappop(self._heap)
+                    if self._due.get(capsule_id) == due:
+                        del self._due[capsule_id]
+                        ready.append(capsule_id)
+                return ready
+            return None
+
+    def _enqueue(self, capsule_ids):
+        """把到期的提醒写入发件箱，已开启、已发送或已过开启日期的胶囊跳过"""
+        conn = get_db()
+        try:
+            placeholders = ','.join('?' * len(capsule_ids))
+            capsules = conn.execute(f'''
+                SELECT c.id, c.title, c.open_date, u.username, u.email
+                FROM capsules c
+                JOIN users u ON c.user_id = u.id
+                WHERE c.id IN ({placeholders})
+                  AND c.is_opened = 0
+                  AND c.email_sent = 0
+                  AND c.open_date >= ?
+            ''', capsule_ids + [datetime.now().strftime('%Y-%m-%d')]).fetchall()
+            queued = outbox.enqueue_reminders(conn, capsules)
+            conn.commit()
+        finally:
+            conn.close()
+        if queued:
+            print(f'[REMINDER] Queued {queued} reminders')
+            outbox.worker.notify()
+
+    def _run(self):
+        while True:
+            ready = self._wait_for_due()
+            if ready is None:
+                return
+            if not ready:
+                continue
+            try:
+                self._enqueue(ready)
+            except Exception as e:
+                print(f'[REMINDER] Failed to queue reminders: {e}')
+                retry_at = time.time() + RETRY_DELAY_SECONDS
+                with self._cond:
+                    for capsule_id in ready:
+                        self._due.setdefault(capsule_id, retry_at)
+                        heapq.heappush(self._heap, (self._due[capsule_id], capsule_id))
+
+    def start(self):
+        """重建调度堆并启动后台线程"""
+        if self._thread is not None:
+            return
+        self.rebuild()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+scheduler = ReminderScheduler()
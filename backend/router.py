@@ -0,0 +1,228 @@
+"""
+URL 路由：按路径段组织的前缀树
+
+路由在启动时注册，请求到来时按路径段逐层查找，耗时只与路径段数有关，
+与已注册的路由数量和注册顺序无关。静态段优先于参数段，
+因此 /api/capsules/random 不会被 /api/capsules/<int:capsule_id> 截获。
+不含参数的路由另外按完整路径放在字典里，命中时一次查找即可。
+
+路径参数写作 <类型:名称>，类型：
+    int   整数
+    str   任意单个路径段（默认）
+    path  剩余的全部路径（只能放在最后）
+"""
+
+CONVERTERS = {
+    'int': int,
+    'str': str,
+    'path': str,
+}
+
+
+class RouteNotFound(LookupError):
+    """没有与路径和方法匹配的路由"""
+
+
+class MethodNotAllowed(RouteNotFound):
+    """
+    路径有对应的路由，但不支持该 HTTP 方法
+
+    Attributes:
+        allowed: 该路径支持的方法（排序后的列表）
+    """
+
+    def __init__(self, path, allowed):
+        super().__init__(path)
+        self.allowed = allowed
+
+
+class InvalidPathParameter(ValueError):
+    """
+    路径匹配但参数无法转换（如 /api/capsules/abc 中的 abc 不是整数）
+
+    Attributes:
+        name: 参数名
+    """
+
+    def __init__(self, name):
+        super().__init__(f'Invalid path parameter: {name}')
+        self.name = name
+
+
+class Route:
+    """
+    一条路由
+
+    Attributes:
+        method: HTTP 方法
+        pattern: 注册时的路径模式
+        handler: 处理函数，调用方式为 handler(request_handler, **path_params)
+        options: 注册时传入的其他选项（如 auth、json_body），由调用方解释
+    """
+
+    def __init__(self, method, pattern, handler, options):
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        self.options = options
+
+    def __repr__(self):
+        return f'<Route {self.method} {self.pattern}>'
+
+
+class _Node:
+    __slots__ = ('static', 'param', 'routes')
+
+    def __init__(self):
+        # 路径段 -> 子节点
+        self.static = {}
+        # (参数名, 类型, 子节点)，每层最多一个参数段
+        self.param = None
+        # HTTP 方法 -> Route
+        self.routes = {}
+
+
+def _split(path):
+    return [segment for segment in path.split('/') if segment]
+
+
+def _parse_param(segment):
+    """'<int:capsule_id>' -> ('capsule_id', 'int')；不是参数段时返回 None"""
+    if not (segment.startswith('<') and segment.endswith('>')):
+        return None
+    kind, _, name = segment[1:-1].rpartition(':')
+    kind = kind or 'str'
+    if kind not in CONVERTERS:
+        raise ValueError(f'Unknown path parameter type: {kind}')
+    return name, kind
+
+
+class Router:
+    """路由表"""
+
+    def __init__(self):
+        self._root = _Node()
+        # 不含参数的完整路径 -> 节点，resolve() 先查这里，命中时不必逐段查找
+        self._static = {}
+        self.routes = []
+
+    def add(self, method, pattern, handler, **options):
+        """
+        注册路由
+
+        Args:
+            method: HTTP 方法
+            pattern: 路径模式，如 /api/capsules/<int:capsule_id>/open
+            handler: 处理函数
+            **options: 路由选项，保存在 Route 上
+
+        Raises:
+            ValueError: 模式无效或与已有路由冲突
+        """
+        node = self._root
+        segments = _split(pattern)
+        static = True
+        for index, segment in enumerate(segments):
+            param = _parse_param(segment)
+            if param is None:
+                node = node.static.setdefault(segment, _Node())
+                continue
+
+            static = False
+
+            name, kind = param
+            if kind == 'path' and index != len(segments) - 1:
+                raise ValueError(f'path parameter must be the last segment: {pattern}')
+            if node.param is None:
+                node.param = (name, kind, _Node())
+            elif node.param[:2] != (name, kind):
+                raise ValueError(f'Conflicting path parameter in {pattern}')
+            node = node.param[2]
+
+        method = method.upper()
+        if method in node.routes:
+            raise ValueError(f'Duplicate route: {method} {pattern}')
+        route = Route(method, pattern, handler, options)
+        node.routes[method] = route
+        if static:
+            self._static['/' + '/'.join(segments)] = node
+        self.routes.append(route)
+        return route
+
+    def route(self, method, pattern, **options):
+        """装饰器形式的 add()"""
+        def decorator(handler):
+            self.add(method, pattern, handler, **options)
+            return handler
+        return decorator
+
+    def get(self, pattern, **options):
+        return self.route('GET', pattern, **options)
+
+    def post(self, pattern, **options):
+        return self.route('POST', pattern, **options)
+
+    def put(self, pattern, **options):
+        return self.route('PUT', pattern, **options)
+
+    def delete(self, pattern, **options):
+        return self.route('DELETE', pattern, **options)
+
+    def resolve(self, method, path):
+        """
+        查找路由
+
+        Args:
+            method: HTTP 方法
+            path: 请求路径（不含查询字符串）
+
+        Returns:
+            Route: 匹配的路由
+            dict: 已转换类型的路径参数
+
+        Raises:
+            RouteNotFound: 没有匹配的路由
+            MethodNotAllowed: 路径匹配但方法不支持（RouteNotFound 的子类）
+            InvalidPathParameter: 路径参数类型不符
+        """
+        node = self._static.get(path)
+        if node is not None:
+            return self._match(node, method, path), {}
+
+        node = self._root
+        params = {}
+        invalid = None
+        segments = _split(path)
+        for index, segment in enumerate(segments):
+            child = node.static.get(segment)
+            if child is not None:
+                node = child
+                continue
+            if node.param is None:
+                raise RouteNotFound(path)
+
+            name, kind, child = node.param
+            if kind == 'path':
+                params[name] = '/'.join(segments[index:])
+                node = child
+                break
+            try:
+                params[name] = CONVERTERS[kind](segment)
+            except ValueError:
+                # 继续匹配，路径完整匹配后再报告参数错误
+                invalid = invalid or name
+            node = child
+
+        route = self._match(node, method, path)
+        if invalid is not None:
+            raise InvalidPathParameter(invalid)
+        return route, params
+
+    @staticmethod
+    def _match(node, method, path):
+        route = node.routes.get(method.upper())
+        if route is None:
+            if node.routes:
+                raise MethodNotAllowed(path, sorted(node.routes))
+            raise RouteNotFound(path)
+        return route
@@ -0,0 +1,94 @@
+"""
+会话缓存：token -> (user_id, expires_at) 的进程内 LRU 缓存
+
+缓存命中时 get_user_from_token 不再查询 sessions 表。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# 缓存的最大会话数
+SESSION_CACHE_SIZE = 10000
+
+# 缓存条目的存活秒数，超时后重新查询数据库（兜底其他进程对 sessions 表的修改）
+SESSION_CACHE_TTL = 300
+
+
+class SessionCache:
+    """
+    有容量上限和存活时间的 LRU 缓存（线程安全）
+
+    Args:
+        max_size: 最大条目数，超出时淘汰最久未使用的条目
+        ttl: 条目存活秒数
+    """
+
+    def __init__(self, max_size=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # 未命中时查询 sessions 表的次数和耗时
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.lookup_max_seconds = 0.0
+
+    def get(self, token):
+        """
+        查询缓存
+
+        Returns:
+            tuple: (user_id, expires_at)，未命中时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, value):
+        deadline = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[token] = (deadline, value)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_lookup(self, seconds):
+        """记录一次 sessions 表查询的耗时"""
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += seconds
+            self.lookup_max_seconds = max(self.lookup_max_seconds, seconds)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中/未命中计数，用于确认大部分请求没有访问数据库"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'db_lookups': self.lookups,
+                'db_lookup_seconds': self.lookup_seconds,
+                'db_lookup_avg_ms': self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+                'db_lookup_max_ms': self.lookup_max_seconds * 1000,
+            }
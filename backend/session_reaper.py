@@ -0,0 +1,108 @@
+"""
+过期会话回收
+
+后台线程定期按 expires_at 索引分批删除过期会话，每批一个短事务，
+不会长时间占用写锁；被删除的 token 同时从会话缓存中移除。
+"""
+
+import threading
+import time
+
+from db import get_db
+
+# 两次回收之间的秒数
+REAP_INTERVAL = 600
+
+# 每批删除的会话数
+REAP_BATCH_SIZE = 500
+
+# 两批之间让出写锁的秒数
+REAP_BATCH_PAUSE = 0.05
+
+
+class SessionReaper:
+    """
+    过期会话回收线程
+
+    Args:
+        cache: 会话缓存（SessionCache），删除的 token 会从中移除
+        interval: 回收间隔秒数
+        batch_size: 每批删除的会话数
+    """
+
+    def __init__(self, cache=None, interval=REAP_INTERVAL, batch_size=REAP_BATCH_SIZE):
+        self.cache = cache
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.reaped_total = 0
+        self.table_size = None
+        self.last_reap_at = None
+
+    def reap(self):
+        """
+        删除所有已过期的会话
+
+        Returns:
+            int: 删除的会话数
+        """
+        removed = 0
+        conn = get_db()
+        try:
+            while not self._stop.is_set():
+                tokens = [row['token'] for row in conn.execute('''
+                    DELETE FROM sessions WHERE token IN (
+                        SELECT token FROM sessions WHERE expires_at <= ? LIMIT ?
+                    ) RETURNING token
+                ''', (int(time.time()), self.batch_size))]
+                conn.commit()
+                if self.cache is not None:
+                    for token in tokens:
+                        self.cache.invalidate(token)
+                removed += len(tokens)
+                if len(tokens) < self.batch_size:
+                    break
+                self._stop.wait(REAP_BATCH_PAUSE)
+            table_size = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.reaped_total += removed
+            self.table_size = table_size
+            self.last_reap_at = time.time()
+        if removed:
+            print(f'[SESSION] Reaped {removed} expired sessions, {table_size} remaining')
+        return removed
+
+    def stats(self):
+        """回收计数和最近一次回收后的会话表行数"""
+        with self._lock:
+            return {
+                'table_size': self.table_size,
+                'reaped_total': self.reaped_total,
+                'last_reap_at': self.last_reap_at,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.reap()
+            except Exception as e:
+                print(f'[SESSION] Reap failed: {e}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
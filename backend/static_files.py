@@ -0,0 +1,209 @@
+"""
+上传图片的静态文件服务
+
+支持 Range 分段请求、ETag / Last-Modified 条件请求（304），
+文件内容通过 socket.sendfile() 零拷贝发送，文件元数据有一个小的 stat 缓存。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+# stat 缓存的条目数与有效秒数
+STAT_CACHE_SIZE = 1024
+STAT_CACHE_TTL = 10
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+}
+
+
+class FileMeta:
+    """文件元数据：大小、修改时间和由它们生成的响应头"""
+
+    def __init__(self, filepath, st):
+        self.size = st.st_size
+        self.mtime = int(st.st_mtime)
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        ext = filepath.rsplit('.', 1)[-1].lower()
+        self.content_type = CONTENT_TYPES.get(ext, 'image/jpeg')
+
+
+class StatCache:
+    """路径 -> FileMeta 的 LRU 缓存，条目在 ttl 秒后重新 stat"""
+
+    def __init__(self, max_size=STAT_CACHE_SIZE, ttl=STAT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filepath):
+        """
+        Raises:
+            FileNotFoundError: 文件不存在
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(filepath)
+                return entry[1]
+
+        meta = FileMeta(filepath, os.stat(filepath))
+        with self._lock:
+            self._entries[filepath] = (now + self.ttl, meta)
+            self._entries.move_to_end(filepath)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return meta
+
+    def invalidate(self, filepath):
+        with self._lock:
+            self._entries.pop(filepath, None)
+
+
+stat_cache = StatCache()
+
+
+def etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    # 弱比较：两边都忽略 W/ 前缀
+    etag = etag[2:] if etag.startswith('W/') else etag
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
+
+def _not_modified_since(header, mtime):
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    return mtime <= since.timestamp()
+
+
+def is_not_modified(headers, meta):
+    """按 RFC 7232：有 If-None-Match 时忽略 If-Modified-Since"""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, meta.etag)
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since is not None:
+        return _not_modified_since(if_modified_since, meta.mtime)
+    return False
+
+
+def parse_range(header, size):
+    """
+    解析单段 Range 请求头
+
+    Returns:
+        tuple: (start, end)，end 为包含的最后一个字节；
+               不支持的格式（如多段）返回 None，表示按完整文件响应
+
+    Raises:
+        ValueError: 范围无法满足（应返回 416）
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first == '':
+            # bytes=-N：最后 N 个字节
+            length = int(last)
+            if length <= 0:
+                raise ValueError('Unsatisfiable range')
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError('Unsatisfiable range')
+    if start >= size or end < start:
+        raise ValueError('Unsatisfiable range')
+    return start, min(end, size - 1)
+
+
+def _send_common_headers(handler, meta, extra_headers):
+    extra_headers = extra_headers or {}
+    for name, value in extra_headers.items():
+        handler.send_header(name, value)
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+    handler.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, Range')
+    if 'Cache-Control' not in extra_headers:
+        handler.send_header('Cache-Control', 'public, max-age=31536000')  # 缓存一年
+    handler.send_header('ETag', meta.etag)
+    handler.send_header('Last-Modified', meta.last_modified)
+    handler.send_header('Accept-Ranges', 'bytes')
+
+
+def send_file(handler, filepath, extra_headers=None):
+    """
+    发送文件，处理条件请求和 Range 请求
+
+    Args:
+        handler: 请求处理器
+        filepath: 文件路径
+        extra_headers: 额外的响应头（如 Vary；包含 Cache-Control 时替换默认的一年缓存）
+
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    meta = stat_cache.get(filepath)
+
+    if is_not_modified(handler.headers, meta):
+        handler.send_response(304)
+        _send_common_headers(handler, meta, extra_headers)
+        handler.end_headers()
+        return 304, 0
+
+    start, end = 0, meta.size - 1
+    status = 200
+    range_header = handler.headers.get('Range')
+    if_range = handler.headers.get('If-Range')
+    if range_header and (if_range is None or if_range.strip() in (meta.etag, meta.last_modified)):
+        try:
+            byte_range = parse_range(range_header, meta.size)
+        except ValueError:
+            handler.send_response(416)
+            _send_common_headers(handler, meta, extra_headers)
+            handler.send_header('Content-Range', f'bytes */{meta.size}')
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return 416, 0
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+
+    length = end - start + 1 if meta.size else 0
+    try:
+        f = open(filepath, 'rb')
+    except FileNotFoundError:
+        stat_cache.invalidate(filepath)
+        raise
+    with f:
+        handler.send_response(status)
+        handler.send_header('Content-type', meta.content_type)
+        _send_common_headers(handler, meta, extra_headers)
+        if status == 206:
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{meta.size}')
+        handler.send_header('Content-Length', str(length))
+        handler.end_headers()
+        handler.wfile.flush()
+        if length:
+            # 由内核直接把文件内容写入 socket（不支持时自动退回普通 send）
+            handler.connection.sendfile(f, start, length)
+    return status, length
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+邮件生成基准测试
+
+对比三种方式生成提醒邮件的速度（封/秒）：
+    mime     旧实现：每封邮件构造 MIMEMultipart + MIMEText 再 as_string()
+    single   预编译模板，逐封调用 build_reminder_message()
+    batched  预编译模板，一次 build_reminder_messages()（发件箱批量发送的方式）
+
+加 --smtp 时再把 batched 生成的邮件经 SMTPPool 发给进程内的 SMTP 测试服务器（smtp_stub），
+测量包含 SMTP 往返的整体速度（不限速）。
+
+用法：
+    python backend/tests/bench_email_templates.py
+    python backend/tests/bench_email_templates.py --messages 10000 --smtp
+"""
+
+import argparse
+import html
+import os
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+from string import Template
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_config
+import email_sender
+import email_templates
+from smtp_stub import SMTPStub
+
+_BODY = Template(email_templates.REMINDER_BODY)
+
+
+def build_mime(to_email, username, capsule_title, open_date):
+    """旧实现：每封邮件构造一次 MIME 对象"""
+    msg = MIMEMultipart()
+    msg['From'] = formataddr((email_config.SENDER_NAME, email_config.SENDER_EMAIL))
+    msg['To'] = formataddr((username, to_email))
+    msg['Subject'] = f'📬 您的时间胶囊"{capsule_title}"即将开启！'
+    body = _BODY.substitute(
+        username=html.escape(username), capsule_title=html.escape(capsule_title),
+        open_date=html.escape(open_date), sent_time='2030-01-01 00:00:00')
+    msg.attach(MIMEText(body, 'html', 'utf-8'))
+    return msg.as_string()
+
+
+def make_reminders(count):
+    return [(f'user{i}@example.com', f'用户{i}', f'第 {i} 个胶囊', '2030-01-01') for i in range(count)]
+
+
+def measure(label, func, count):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<10}{count / elapsed:>12,.0f}{elapsed * 1000 / count:>12.3f}')
+
+
+def send_all(reminders):
+    stub = SMTPStub().start()
+    config = mock.patch.multiple(email_config, SMTP_USE_SSL=False, SENDER_PASSWORD='', SMTP_TIMEOUT=5)
+    config.start()
+    pool = email_sender.SMTPPool('127.0.0.1', stub.port, size=1, rate=0)
+    try:
+        def run():
+            for (to_email, *_), message in zip(reminders, email_sender.build_reminder_messages(reminders)):
+                pool.send(to_email, message)
+        measure('smtp', run, len(reminders))
+        assert len(stub.messages) == len(reminders)
+    finally:
+        pool.close()
+        config.stop()
+        stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='邮件生成基准测试')
+    parser.add_argument('--messages', type=int, default=3000, help='每种方式生成的邮件数')
+    parser.add_argument('--smtp', action='store_true', help='同时测量经 SMTP 测试服务器发送的速度')
+    args = parser.parse_args()
+
+    reminders = make_reminders(args.messages)
+    print(f'{"method":<10}{"msg/s":>12}{"ms/msg":>12}')
+    measure('mime', lambda: [build_mime(*reminder) for reminder in reminders], args.messages)
+    measure('single', lambda: [email_sender.build_reminder_message(*reminder) for reminder in reminders], args.messages)
+    measure('batched', lambda: email_sender.build_reminder_messages(reminders), args.messages)
+    if args.smtp:
+        send_all(reminders)
+
+
+if __name__ == '__main__':
+    main()
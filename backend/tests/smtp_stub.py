@@ -0,0 +1,144 @@
+"""
+进程内的 SMTP 测试服务器
+
+只实现 email_sender 用到的命令（EHLO/HELO、MAIL、RCPT、DATA、RSET、NOOP、QUIT），
+不支持 STARTTLS 和 AUTH，配合 SMTP_USE_SSL = False、SENDER_PASSWORD = '' 使用。
+记录建立过的连接数和收到的邮件，可以拒绝指定收件人，也可以从服务器端断开所有连接。
+"""
+
+import socket
+import socketserver
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.server.stub._opened(self.connection)
+
+    def finish(self):
+        self.server.stub._closed(self.connection)
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        stub = self.server.stub
+        self.reply('220 localhost stub SMTP')
+        sender, recipients = None, []
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            command, _, argument = line.decode('utf-8').strip().partition(' ')
+            command = command.upper()
+            if command == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif command == 'HELO':
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                sender, recipients = argument.split(':', 1)[1].strip().strip('<>'), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipient = argument.split(':', 1)[1].strip().strip('<>')
+                if recipient in stub.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                stub._received(sender, recipients, b''.join(lines))
+                sender, recipients = None, []
+                self.reply('250 OK queued')
+            elif command == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStub:
+    """
+    在后台线程运行的 SMTP 服务器
+
+    Attributes:
+        port: 监听端口（自动分配）
+        connections: 已建立的连接总数
+        messages: 收到的邮件 [(sender, recipients, data)]
+        refused: 拒绝（550）的收件人集合
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+        self._active = set()
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _SMTPHandler)
+        self._server.stub = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), name='smtp-stub', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.disconnect_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def disconnect_all(self):
+        """从服务器端关闭所有已建立的连接（模拟服务器空闲超时）"""
+        with self._lock:
+            active = list(self._active)
+        for sock in active:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def active(self):
+        with self._lock:
+            return len(self._active)
+
+    def _opened(self, sock):
+        with self._lock:
+            self.connections += 1
+            self._active.add(sock)
+
+    def _closed(self, sock):
+        with self._lock:
+            self._active.discard(sock)
+
+    def _received(self, sender, recipients, data):
+        with self._lock:
+            self.messages.append((sender, recipients, data))
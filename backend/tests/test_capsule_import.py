@@ -0,0 +1,105 @@
+"""
+批量导入测试
+
+无效的行（包括带时区的开启日期、校验时抛出异常的输入）只记为该行的错误，
+其余行照常导入，不会让整个请求失败。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+os.environ.setdefault('CAPSULE_SCRYPT_N', '1024')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import capsule_import
+import db
+
+
+def ndjson(*rows):
+    return b''.join(row if isinstance(row, bytes) else json.dumps(row).encode() + b'\n' for row in rows)
+
+
+def capsule(title, open_date='2020-01-01T00:00:00', **fields):
+    return dict({'title': title, 'content': f'{title} content', 'open_date': open_date}, **fields)
+
+
+class CapsuleImportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        conn = db.get_db()
+        cls.user_id = conn.execute('''
+            INSERT INTO users (username, password_hash, email, created_at)
+            VALUES ('importer', '', 'importer@example.com', '2024-01-01T00:00:00')
+        ''').lastrowid
+        conn.commit()
+        conn.close()
+
+    def run_import(self, body, validate=app.validate_capsule_data):
+        conn = db.get_db()
+        try:
+            lines = capsule_import.iter_lines(io.BytesIO(body), len(body))
+            return capsule_import.import_capsules(conn, self.user_id, lines, validate)
+        finally:
+            conn.close()
+
+    def titles(self):
+        conn = db.get_db()
+        try:
+            return {row['title'] for row in conn.execute('SELECT title FROM capsules WHERE user_id = ?', (self.user_id,))}
+        finally:
+            conn.close()
+
+    def test_aware_open_date_rejected_per_line(self):
+        result = self.run_import(ndjson(
+            capsule('naive'),
+            capsule('aware', '2030-01-01T00:00:00+08:00'),
+            capsule('utc', '2030-01-01T00:00:00Z'),
+            b'not json\n',
+            capsule('after'),
+        ))
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(result['failed'], 3)
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3, 4])
+        self.assertEqual(result['errors'][0]['errors'], ['开启日期不能包含时区'])
+        self.assertLessEqual({'naive', 'after'}, self.titles())
+        self.assertNotIn('aware', self.titles())
+
+    def test_aware_optional_dates_ignored(self):
+        result = self.run_import(ndjson(capsule(
+            'aware-create', create_date='2020-01-01T00:00:00+08:00', is_opened=1, open_time='2020-02-01T00:00:00+00:00')))
+        self.assertEqual(result['imported'], 1)
+        conn = db.get_db()
+        try:
+            row = conn.execute("SELECT create_date, open_time FROM capsules WHERE title = 'aware-create'").fetchone()
+        finally:
+            conn.close()
+        self.assertNotIn('+', row['create_date'])
+        self.assertIsNone(row['open_time'])
+
+    def test_validator_exception_fails_only_that_line(self):
+        def validate(data, allow_past_open_date=False):
+            if data['title'] == 'boom':
+                raise TypeError('unexpected input')
+            return app.validate_capsule_data(data, allow_past_open_date)
+
+        result = self.run_import(ndjson(capsule('before-boom'), capsule('boom'), capsule('after-boom')), validate)
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(result['errors'], [{'line': 2, 'errors': ['字段格式无效']}])
+
+    def test_validate_capsule_data_rejects_aware_datetime(self):
+        errors = app.validate_capsule_data(capsule('x', '2099-01-01T00:00:00+08:00'))
+        self.assertEqual(errors, ['开启日期不能包含时区'])
+        self.assertEqual(app.validate_capsule_data(capsule('x', '2099-01-01T00:00:00')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
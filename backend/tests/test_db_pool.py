@@ -0,0 +1,70 @@
+"""
+数据库连接池测试
+
+- 连接池耗尽时，等待中的请求在连接归还后立即拿到连接，不做垃圾回收
+- 未调用 close() 的连接（sqlite3 连接与自己的语句缓存构成引用循环，只能由垃圾回收释放）
+  在等待超过 LEAK_CHECK_DELAY 后由一次垃圾回收找回
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import contextlib
+import gc
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='capsule-pool-')
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.pool = db.ConnectionPool(os.path.join(self.temp_dir, 'pool.db'), max_size=1, timeout=5)
+        self.addCleanup(self.pool.close)
+        patcher = mock.patch.object(db, 'LEAK_CHECK_DELAY', 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waiter_gets_released_connection_without_gc(self):
+        conn = self.pool.acquire()
+        threading.Timer(0.05, conn.close).start()
+        with mock.patch.object(db.gc, 'collect') as collect:
+            started = time.monotonic()
+            self.pool.acquire().close()
+        self.assertLess(time.monotonic() - started, db.LEAK_CHECK_DELAY)
+        collect.assert_not_called()
+
+    def test_leaked_connection_reclaimed_after_delay(self):
+        gc.disable()
+        self.addCleanup(gc.enable)
+        conn = self.pool.acquire()
+        del conn
+
+        started = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.pool.acquire().close()
+        self.assertGreaterEqual(time.monotonic() - started, db.LEAK_CHECK_DELAY)
+        self.assertIn('collecting garbage', output.getvalue())
+
+    def test_timeout(self):
+        self.pool.timeout = 0.3
+        conn = self.pool.acquire()
+        with mock.patch.object(db.gc, 'collect'):
+            with self.assertRaises(db.PoolTimeoutError):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.pool.acquire()
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
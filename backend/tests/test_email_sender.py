@@ -0,0 +1,114 @@
+"""
+SMTP 连接池测试
+
+用 smtp_stub.SMTPStub 在本进程内启动 SMTP 服务器，检查 email_sender.SMTPPool：
+会话复用、服务器断开后重连、收件人被拒以及发送限速。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import os
+import smtplib
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_config
+import email_sender
+from smtp_stub import SMTPStub
+
+MESSAGE = 'Subject: test\r\n\r\nhello\r\n'
+
+
+class SMTPPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = SMTPStub().start()
+        self.addCleanup(self.stub.stop)
+        config = mock.patch.multiple(
+            email_config, SMTP_USE_SSL=False, SENDER_PASSWORD='', SENDER_EMAIL='sender@example.com', SMTP_TIMEOUT=5)
+        config.start()
+        self.addCleanup(config.stop)
+
+    def make_pool(self, size=2, rate=0):
+        pool = email_sender.SMTPPool('127.0.0.1', self.stub.port, size=size, rate=rate)
+        self.addCleanup(pool.close)
+        return pool
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('condition not met')
+            time.sleep(0.01)
+
+    def test_reuses_connection(self):
+        pool = self.make_pool()
+        for i in range(5):
+            pool.send(f'user{i}@example.com', MESSAGE)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual([recipients for _, recipients, _ in self.stub.messages],
+                         [[f'user{i}@example.com'] for i in range(5)])
+        self.assertEqual(self.stub.messages[0][0], 'sender@example.com')
+
+    def test_concurrent_sends_bounded_by_pool_size(self):
+        pool = self.make_pool(size=2)
+        threads = [threading.Thread(target=pool.send, args=(f'user{i}@example.com', MESSAGE)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.stub.messages), 8)
+        self.assertLessEqual(self.stub.connections, 2)
+
+    def test_reconnects_after_server_disconnect(self):
+        pool = self.make_pool()
+        pool.send('first@example.com', MESSAGE)
+        self.stub.disconnect_all()
+        self.wait_for(lambda: self.stub.active == 0)
+
+        pool.send('second@example.com', MESSAGE)
+        self.assertEqual(self.stub.connections, 2)
+        self.assertEqual([recipients for _, recipients, _ in self.stub.messages],
+                         [['first@example.com'], ['second@example.com']])
+
+        # 重连后的会话放回池中继续使用
+        pool.send('third@example.com', MESSAGE)
+        self.assertEqual(self.stub.connections, 2)
+
+    def test_refused_recipient_keeps_session(self):
+        self.stub.refused.add('nobody@example.com')
+        pool = self.make_pool()
+        with self.assertRaises(smtplib.SMTPRecipientsRefused) as caught:
+            pool.send('nobody@example.com', MESSAGE)
+        self.assertTrue(email_sender.is_permanent_error(caught.exception))
+        self.assertEqual(self.stub.messages, [])
+
+        pool.send('someone@example.com', MESSAGE)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(len(self.stub.messages), 1)
+
+    def test_rate_limit(self):
+        rate = 20
+        pool = self.make_pool(rate=rate)
+        started = time.monotonic()
+        for i in range(rate + 10):
+            pool.send(f'user{i}@example.com', MESSAGE)
+        elapsed = time.monotonic() - started
+        # 令牌桶初始有 rate 个令牌，之后每秒补充 rate 个：多出的 10 封至少需要 0.5 秒
+        self.assertGreaterEqual(elapsed, 10 / rate * 0.9)
+        self.assertEqual(len(self.stub.messages), rate + 10)
+
+    def test_close_quits_idle_sessions(self):
+        pool = self.make_pool()
+        pool.send('user@example.com', MESSAGE)
+        self.assertEqual(self.stub.active, 1)
+        pool.close()
+        self.wait_for(lambda: self.stub.active == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
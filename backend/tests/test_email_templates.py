@@ -0,0 +1,84 @@
+"""
+邮件模板测试
+
+检查预编译模板生成的邮件能被 email 包正确解析，
+以及收件人、用户名和胶囊标题中的换行不能注入额外的邮件头。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import email
+import json
+import os
+import sys
+import tempfile
+import unittest
+from email.errors import HeaderParseError
+from email.header import decode_header, make_header
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_sender
+import email_templates
+import outbox
+
+
+def parse(message):
+    return email.message_from_string(message)
+
+
+def header(message, name):
+    return str(make_header(decode_header(message[name])))
+
+
+class MessageTemplateTest(unittest.TestCase):
+    def test_reminder_structure(self):
+        message = parse(email_sender.build_reminder_message(
+            'user@example.com', '小明 <b>', '生日 & 聚会', '2030-01-01'))
+        self.assertEqual(message.get_content_type(), 'multipart/mixed')
+        self.assertEqual(header(message, 'To'), '小明 <b> <user@example.com>')
+        self.assertIn('生日 & 聚会', header(message, 'Subject'))
+        [part] = message.get_payload()
+        self.assertEqual(part.get_content_type(), 'text/html')
+        body = part.get_payload(decode=True).decode('utf-8')
+        self.assertIn('小明 &lt;b&gt;', body)
+        self.assertIn('生日 &amp; 聚会', body)
+        self.assertIn('2030-01-01', body)
+
+    def test_newline_in_recipient_rejected(self):
+        for to_email, username in [
+            ('user@example.com\r\nBcc: victim@example.com', 'user'),
+            ('user@example.com', 'user\nX-Evil: 1'),
+            ('user@example.com', '用户\r\nBcc: victim@example.com'),
+        ]:
+            with self.subTest(to_email=to_email, username=username):
+                with self.assertRaises(HeaderParseError):
+                    email_templates.REMINDER.render(to_email, username, capsule_title='t', open_date='2030-01-01')
+                with self.assertRaises(HeaderParseError):
+                    email_templates.WELCOME.render(to_email, username)
+
+    def test_newline_in_subject_field_removed(self):
+        for title in ['title\r\nBcc: victim@example.com', '标题\nX-Evil: 1']:
+            with self.subTest(title=title):
+                raw = email_sender.build_reminder_message('user@example.com', 'user', title, '2030-01-01')
+                message = parse(raw)
+                self.assertIsNone(message['Bcc'])
+                self.assertIsNone(message['X-Evil'])
+                self.assertEqual(sorted(message.keys()), ['Content-Type', 'From', 'MIME-Version', 'Subject', 'To'])
+                self.assertNotIn('\n', header(message, 'Subject').replace('\n ', ' '))
+
+    def test_outbox_isolates_invalid_recipient(self):
+        payload = json.dumps({'username': 'user', 'capsule_title': 't', 'open_date': '2030-01-01'})
+        jobs = [
+            {'to_email': 'good@example.com', 'payload': payload},
+            {'to_email': 'bad@example.com\nBcc: victim@example.com', 'payload': payload},
+        ]
+        good, bad = outbox._render(jobs)
+        self.assertEqual(parse(good)['To'], 'user <good@example.com>')
+        self.assertIsInstance(bad, HeaderParseError)
+        self.assertTrue(email_sender.is_permanent_error(bad))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+JSON 编解码测试
+
+query_json_array() / iter_json_rows() 由 SQLite 生成的 JSON，解析后必须与旧的
+[dict(row) ...] + json.dumps 得到相同的对象：中文、emoji、引号和控制字符、NULL、
+整数与浮点数，以及以 JSON 文本保存的 tags 列（仍是字符串，不会被展开成数组）。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import db
+import json_codec
+
+TRICKY = [
+    '时间胶囊：给十年后的自己',
+    'emoji 🎉🚀 and 𝄞',
+    'quotes " \' and back\\slash',
+    'line\nbreak\ttab\r\x01\x1f',
+    '</script><!-- &   ',
+    '',
+]
+
+CAPSULES_SQL = 'SELECT * FROM capsules WHERE user_id = ? ORDER BY create_date DESC'
+
+
+def old_json(conn, sql, params):
+    """旧实现：每行构造字典，再由标准库 json 序列化"""
+    return json.dumps([dict(row) for row in conn.execute(sql, params)]).encode()
+
+
+class QueryJsonTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        conn = db.get_db()
+        cls.user_id = conn.execute('''
+            INSERT INTO users (username, password_hash, email, created_at)
+            VALUES ('json', '', 'json@example.com', '2024-01-01T00:00:00')
+        ''').lastrowid
+        category_id = conn.execute(
+            "INSERT INTO categories (user_id, name, color, icon, created_at) VALUES (?, '旅行', '#fff', '✈️', '2024-01-01T00:00:00')",
+            (cls.user_id,)).lastrowid
+        for i, text in enumerate(TRICKY):
+            conn.execute('''
+                INSERT INTO capsules (user_id, title, content, mood, tags, create_date, open_date,
+                                      is_opened, open_time, image_path, category_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (cls.user_id, text or 'empty', text, None if i % 2 else 'happy',
+                  json.dumps([text, '标签'], ensure_ascii=i % 2 == 0) if i != 3 else None,
+                  f'2024-01-0{i + 1}T10:00:00', '2030-01-01T00:00:00', i % 2,
+                  '2030-01-01T00:00:01' if i % 2 else None, None if i % 3 else f'ab/{text[:2]}.png',
+                  category_id if i % 2 else None))
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.conn = db.get_db()
+        self.addCleanup(self.conn.close)
+
+    def test_capsule_list_matches_dict_rows(self):
+        params = (self.user_id,)
+        expected = json.loads(old_json(self.conn, CAPSULES_SQL, params))
+        self.assertEqual(len(expected), len(TRICKY))
+        self.assertEqual(json.loads(json_codec.query_json_array(self.conn, CAPSULES_SQL, params)), expected)
+        self.assertEqual(json_codec.loads(json_codec.query_json_array(self.conn, CAPSULES_SQL, params)), expected)
+        rows = [json.loads(row) for row in json_codec.iter_json_rows(self.conn, CAPSULES_SQL, params, batch_size=4)]
+        self.assertEqual(rows, expected)
+
+    def test_tags_column_stays_a_string(self):
+        capsules = json.loads(json_codec.query_json_array(self.conn, CAPSULES_SQL, (self.user_id,)))
+        tags = [capsule['tags'] for capsule in capsules]
+        self.assertIn(None, tags)
+        for value in filter(None, tags):
+            self.assertIsInstance(value, str)
+            self.assertEqual(json.loads(value)[1], '标签')
+
+    def test_numbers_nulls_and_aliases(self):
+        sql = '''
+            SELECT id, 1.5 AS ratio, -0.25 * id AS scaled, 9007199254740993 AS big,
+                   NULL AS missing, title AS "标题", title AS "with ""quote"""
+            FROM capsules WHERE user_id = ? ORDER BY id
+        '''
+        expected = json.loads(old_json(self.conn, sql, (self.user_id,)))
+        self.assertEqual(json.loads(json_codec.query_json_array(self.conn, sql, (self.user_id,))), expected)
+
+    def test_empty_result(self):
+        self.assertEqual(json_codec.query_json_array(self.conn, CAPSULES_SQL, (-1,)), b'[]')
+        self.assertEqual(list(json_codec.iter_json_rows(self.conn, CAPSULES_SQL, (-1,))), [])
+
+    def test_dumps_round_trip(self):
+        data = {'title': TRICKY, 'nothing': None, 'ratio': 1.5, 'ok': True}
+        encoded = json_codec.dumps(data)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(json_codec.loads(encoded), data)
+        self.assertEqual(json.loads(encoded), data)
+        with self.assertRaises(json_codec.JSONDecodeError):
+            json_codec.loads(b'\xff')
+
+
+if __name__ == '__main__':
+    unittest.main()
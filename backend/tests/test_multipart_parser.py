@@ -0,0 +1,156 @@
+"""
+multipart 解析器测试
+
+- 分隔符被任意切分到两次读取之间（包括跨 CHUNK_SIZE 边界）时，文件内容保持不变
+- 流式读取一个很大的请求体时，峰值内存（tracemalloc）只与块大小有关
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import multipart_parser
+
+BOUNDARY = b'----capsuleBoundary7MA4YWxkTrZu0gW'
+
+
+def allowed(filename):
+    return filename.rsplit('.', 1)[-1] in ('png', 'jpg')
+
+
+def build_body(content, filename='photo.png', extra_fields=(), preamble=b'', epilogue=b'\r\n'):
+    parts = [preamble]
+    for name, value in extra_fields:
+        parts.append(b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="' + name + b'"\r\n\r\n' + value + b'\r\n')
+    parts.append(b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="'
+                 + filename.encode() + b'"\r\nContent-Type: image/png\r\n\r\n')
+    parts.append(content)
+    parts.append(b'\r\n--' + BOUNDARY + b'--' + epilogue)
+    return b''.join(parts)
+
+
+class PieceReader(io.RawIOBase):
+    """每次 read() 最多返回 piece 字节，模拟网络分段到达"""
+
+    def __init__(self, data, piece):
+        self.data = data
+        self.piece = piece
+        self.position = 0
+
+    def read(self, size=-1):
+        size = self.piece if size < 0 else min(size, self.piece)
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+
+class GeneratedBody(io.RawIOBase):
+    """按需生成的大请求体，不在内存中保存整个内容"""
+
+    def __init__(self, size):
+        self.head = build_body(b'')[:-len(b'\r\n--' + BOUNDARY + b'--\r\n')]
+        self.tail = b'\r\n--' + BOUNDARY + b'--\r\n'
+        self.size = size
+        self.block = bytes(range(256)) * 1024
+        self.digest = hashlib.sha256()
+        self.length = len(self.head) + size + len(self.tail)
+        self.position = 0
+
+    def read(self, size=-1):
+        head_end = len(self.head)
+        data_end = head_end + self.size
+        if self.position < head_end:
+            chunk = self.head[self.position:self.position + size]
+        elif self.position < data_end:
+            offset = (self.position - head_end) % len(self.block)
+            chunk = self.block[offset:offset + min(size, data_end - self.position)]
+            self.digest.update(chunk)
+        else:
+            start = self.position - data_end
+            chunk = self.tail[start:start + size]
+        self.position += len(chunk)
+        return chunk
+
+
+class ReceiveFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='capsule-multipart-')
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def receive(self, stream, length, max_size=64 * 1024 * 1024):
+        return multipart_parser.receive_file(stream, length, BOUNDARY, 'file', self.temp_dir, max_size, allowed)
+
+    def assert_received(self, uploaded, content):
+        self.assertIsNotNone(uploaded)
+        with open(uploaded.path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(uploaded.size, len(content))
+        self.assertEqual(uploaded.sha256, hashlib.sha256(content).hexdigest())
+        uploaded.discard()
+
+    def test_boundary_split_across_reads(self):
+        separator = b'\r\n--' + BOUNDARY
+        # 内容中包含分隔符的各种前缀，容易被误判为分隔符
+        content = b'abc' + b''.join(separator[:i] + b'x' for i in range(1, len(separator))) + b'\r\n-\r'
+        body = build_body(content, extra_fields=[(b'title', b'hello\r\n--' + BOUNDARY[:-1])],
+                          preamble=b'preamble\r\n', epilogue=b'\r\nepilogue')
+        for piece in [1, 2, 3, 5, 7, len(separator) - 1, len(separator), len(separator) + 1, 4096, len(body)]:
+            with self.subTest(piece=piece):
+                stream = PieceReader(body, piece)
+                self.assert_received(self.receive(stream, len(body)), content)
+                self.assertEqual(stream.position, len(body))
+
+    def test_separator_straddles_chunk_size(self):
+        separator = b'\r\n--' + BOUNDARY
+        head_length = len(build_body(b'')) - len(separator) - len(b'--\r\n')
+        for shift in range(len(separator) + 2):
+            # 分隔符从 CHUNK_SIZE 之前 shift 字节处开始
+            size = multipart_parser.CHUNK_SIZE - head_length - shift
+            content = bytes(i % 251 for i in range(size))
+            body = build_body(content)
+            with self.subTest(shift=shift):
+                self.assert_received(self.receive(io.BytesIO(body), len(body)), content)
+
+    def test_rejects_invalid_uploads(self):
+        body = build_body(b'data', filename='script.exe')
+        with self.assertRaises(multipart_parser.MultipartError):
+            self.receive(io.BytesIO(body), len(body))
+
+        body = build_body(b'x' * 1000)
+        with self.assertRaises(multipart_parser.MultipartError):
+            self.receive(io.BytesIO(body), len(body), max_size=999)
+
+        body = build_body(b'data')[:-10]
+        with self.assertRaises(multipart_parser.MultipartError):
+            self.receive(io.BytesIO(body), len(body))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_large_body_constant_memory(self):
+        size = 32 * 1024 * 1024
+        stream = GeneratedBody(size)
+        tracemalloc.start()
+        try:
+            uploaded = self.receive(stream, stream.length)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        try:
+            self.assertEqual(uploaded.size, size)
+            self.assertEqual(uploaded.sha256, stream.digest.hexdigest())
+        finally:
+            uploaded.discard()
+        # 缓冲区最多约两块数据；与 32MB 的文件大小无关
+        self.assertLess(peak, 8 * multipart_parser.CHUNK_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+查询计划回归测试
+
+用 init_db() 在临时数据库中建立完整的表结构，通过 HTTP 调用各个接口并运行 check_reminders.py 和上传文件回收，
+记录连接池上执行的每一条 SQL，逐条 EXPLAIN QUERY PLAN：
+除了数据量固定很小的表（模板），不允许出现对普通表的全表 SCAN。
+修改表结构或查询时如果丢掉了对应的索引，这里会失败并打印查询和计划。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import contextlib
+import http.client
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import unittest
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+os.environ.setdefault('CAPSULE_SCRYPT_N', '1024')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import check_reminders
+import db
+import upload_store
+
+# 允许全表扫描的表：行数固定且很少（capsules_fts_config 是 FTS5 在新连接上读取配置的影子表）
+SMALL_TABLES = {'templates', 'capsules_fts_config'}
+
+# 不需要检查计划的语句
+_SKIPPED = re.compile(r'^\s*(--|BEGIN|COMMIT|ROLLBACK|PRAGMA|SAVEPOINT|RELEASE|INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*VALUES)', re.I)
+
+
+def full_scans(plan):
+    """计划中的全表扫描（子查询、常量行和带约束的虚拟表除外）"""
+    scans = []
+    for detail in plan:
+        match = re.match(r'SCAN (\S+)(.*)', detail)
+        if not match:
+            continue
+        name, rest = match.groups()
+        name = name.split('.')[-1]
+        if name.startswith('(') or name == 'CONSTANT' or name in SMALL_TABLES:
+            continue
+        if 'VIRTUAL TABLE INDEX' in rest and rest.split(':', 1)[1].strip():
+            continue
+        scans.append(detail)
+    return scans
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        cls.statements = []
+        cls._acquire = db.pool.acquire
+
+        def acquire():
+            conn = cls._acquire()
+            conn.set_trace_callback(cls.statements.append)
+            return conn
+
+        db.pool.acquire = acquire
+        cls.server = app.create_server('pool', 0, workers=4, backlog=16)
+        cls.port = cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        db.pool.acquire = cls._acquire
+
+    def request(self, method, path, body=None, token=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        if response.headers.get('Content-Type') == 'application/json' and data:
+            return response.status, json.loads(data)
+        return response.status, data
+
+    def exercise_api(self):
+        """调用各个接口，让它们的查询都被执行一遍"""
+        user = {'username': 'planner', 'password': 'secret12', 'email': 'planner@example.com'}
+        self.assertEqual(self.request('POST', '/api/auth/register', user)[0], 201)
+        status, login = self.request('POST', '/api/auth/login', user)
+        self.assertEqual(status, 200)
+        token = login['token']
+
+        status, category = self.request('POST', '/api/categories', {'name': '旅行', 'color': '#fff', 'icon': 'x'}, token)
+        self.assertEqual(status, 201)
+        capsule_ids = []
+        for title in ('hello world', '生日快乐', 'third'):
+            status, created = self.request('POST', '/api/capsules', {
+                'title': title, 'content': f'{title} content', 'mood': 'happy', 'tags': ['trip', '家人'],
+                'open_date': '2099-01-01T00:00:00', 'category_id': category['id'],
+            }, token)
+            self.assertEqual(status, 201)
+            capsule_ids.append(created['id'])
+
+        for path in [
+            '/api/auth/me',
+            '/api/capsules',
+            '/api/capsules?limit=2',
+            '/api/capsules?status=sealed',
+            '/api/capsules?status=ready',
+            '/api/capsules?status=opened',
+            f'/api/capsules?category_id={category["id"]}',
+            '/api/capsules?category_id=none',
+            '/api/capsules?from=2000-01-01&to=2100-01-01',
+            '/api/capsules?tag=trip',
+            f'/api/capsules/{capsule_ids[0]}',
+            '/api/capsules/random',
+            '/api/capsules/search?q=hello',
+            '/api/capsules/search?q=he&field=title',
+            '/api/stats/mood',
+            '/api/stats',
+            '/api/tags?prefix=tr',
+            '/api/templates?tag=trip',
+            '/api/categories',
+        ]:
+            self.assertIn(self.request('GET', path, token=token)[0], (200, 404), path)
+
+        # 游标分页的第二页
+        status, page = self.request('GET', '/api/capsules?limit=1', token=token)
+        self.request('GET', f'/api/capsules?limit=1&cursor={page["next_cursor"]}', token=token)
+
+        # 胶囊很多的用户使用 FTS5 路径
+        threshold = app.SEARCH_SCAN_MAX_CAPSULES
+        app.SEARCH_SCAN_MAX_CAPSULES = -1
+        try:
+            self.assertEqual(self.request('GET', '/api/capsules/search?q=hello&field=title', token=token)[0], 200)
+            self.assertEqual(self.request('GET', '/api/capsules/search?q=he', token=token)[0], 200)
+        finally:
+            app.SEARCH_SCAN_MAX_CAPSULES = threshold
+
+        for method, path, body in [
+            ('POST', '/api/capsules/export', None),
+            ('POST', '/api/capsules/export?format=zip', None),
+            ('POST', '/api/reminders/check', None),
+            ('PUT', f'/api/capsules/{capsule_ids[1]}', {
+                'title': 'updated', 'content': 'updated content', 'open_date': '2099-01-02T00:00:00', 'tags': ['trip'],
+            }),
+            ('POST', f'/api/capsules/{capsule_ids[0]}/open', None),
+            ('DELETE', f'/api/capsules/{capsule_ids[0]}', None),
+            ('POST', '/api/capsules/batch', {'ids': capsule_ids[1:]}),
+            ('DELETE', f'/api/categories/{category["id"]}', None),
+            ('POST', '/api/auth/logout', None),
+        ]:
+            self.assertLess(self.request(method, path, body, token)[0], 500, path)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_reminders.check_and_send_reminders(deliver=False)
+            upload_store.collect_garbage()
+
+    def test_hot_queries_use_indexes(self):
+        self.exercise_api()
+
+        statements = []
+        for sql in self.statements:
+            if not _SKIPPED.match(sql) and sql not in statements:
+                statements.append(sql)
+        self.assertTrue(any('FROM capsules' in sql for sql in statements))
+
+        conn = db.get_db()
+        try:
+            failures = []
+            for sql in statements:
+                plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+                scans = full_scans(plan)
+                if scans:
+                    failures.append(f'{" ".join(sql.split())}\n    ' + '\n    '.join(plan))
+        finally:
+            conn.close()
+        self.assertFalse(failures, 'Full table scans:\n' + '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+路由测试
+
+- 静态段优先于参数段，参数按类型转换
+- 未知路径为 RouteNotFound（404），路径存在但方法不支持为 MethodNotAllowed（405）
+- 应用的路由表：每条路由都能按自己的模式找回自己；经 HTTP 请求时分别返回 404 / 405 / 400
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from router import Router, RouteNotFound, MethodNotAllowed, InvalidPathParameter
+
+
+def handler(name):
+    def handle(request_handler, **params):
+        return name
+    handle.__name__ = name
+    return handle
+
+
+class RouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.add('GET', '/api/capsules', handler('list'))
+        self.router.add('POST', '/api/capsules', handler('create'))
+        self.router.add('GET', '/api/capsules/random', handler('random'))
+        self.router.add('GET', '/api/capsules/<int:capsule_id>', handler('get'))
+        self.router.add('DELETE', '/api/capsules/<int:capsule_id>', handler('delete'))
+        self.router.add('POST', '/api/capsules/<int:capsule_id>/open', handler('open'))
+        self.router.add('GET', '/api/users/<name>', handler('user'))
+        self.router.add('GET', '/uploads/<path:filename>', handler('upload'))
+
+    def resolve(self, method, path):
+        route, params = self.router.resolve(method, path)
+        return route.handler.__name__, params
+
+    def test_static_routes(self):
+        self.assertEqual(self.resolve('GET', '/api/capsules'), ('list', {}))
+        self.assertEqual(self.resolve('post', '/api/capsules/'), ('create', {}))
+        # 静态段优先，与注册顺序无关
+        self.assertEqual(self.resolve('GET', '/api/capsules/random'), ('random', {}))
+
+    def test_parameter_extraction(self):
+        self.assertEqual(self.resolve('GET', '/api/capsules/42'), ('get', {'capsule_id': 42}))
+        self.assertEqual(self.resolve('DELETE', '/api/capsules/7'), ('delete', {'capsule_id': 7}))
+        self.assertEqual(self.resolve('POST', '/api/capsules/3/open'), ('open', {'capsule_id': 3}))
+        self.assertEqual(self.resolve('GET', '/api/users/小明'), ('user', {'name': '小明'}))
+        self.assertEqual(self.resolve('GET', '/uploads/ab/cd/photo.png'), ('upload', {'filename': 'ab/cd/photo.png'}))
+
+    def test_not_found(self):
+        for method, path in [('GET', '/'), ('GET', '/api'), ('GET', '/api/unknown'),
+                             ('GET', '/api/capsules/1/close'), ('GET', '/api/capsules/1/open/extra'),
+                             ('GET', '/uploads')]:
+            with self.subTest(path=path):
+                with self.assertRaises(RouteNotFound) as ctx:
+                    self.router.resolve(method, path)
+                self.assertNotIsInstance(ctx.exception, MethodNotAllowed)
+
+    def test_method_not_allowed(self):
+        for method, path, allowed in [('DELETE', '/api/capsules', ['GET', 'POST']),
+                                      ('PUT', '/api/capsules/1', ['DELETE', 'GET']),
+                                      ('GET', '/api/capsules/1/open', ['POST']),
+                                      ('POST', '/api/capsules/random', ['GET'])]:
+            with self.subTest(method=method, path=path):
+                with self.assertRaises(MethodNotAllowed) as ctx:
+                    self.router.resolve(method, path)
+                self.assertEqual(ctx.exception.allowed, allowed)
+
+    def test_invalid_parameter(self):
+        with self.assertRaises(InvalidPathParameter) as ctx:
+            self.router.resolve('GET', '/api/capsules/abc')
+        self.assertEqual(ctx.exception.name, 'capsule_id')
+        # 参数错误只在路径完整匹配时报告
+        with self.assertRaises(RouteNotFound):
+            self.router.resolve('GET', '/api/capsules/abc/close')
+
+    def test_invalid_registrations(self):
+        with self.assertRaises(ValueError):
+            self.router.add('GET', '/api/capsules', handler('again'))
+        with self.assertRaises(ValueError):
+            self.router.add('GET', '/api/capsules/<str:slug>/edit', handler('edit'))
+        with self.assertRaises(ValueError):
+            self.router.add('GET', '/files/<path:rest>/meta', handler('meta'))
+        with self.assertRaises(ValueError):
+            self.router.add('GET', '/api/<float:value>', handler('float'))
+
+
+class AppRouteTableTest(unittest.TestCase):
+    def test_every_route_resolves_to_itself(self):
+        samples = {'int': '12', 'str': 'name', 'path': 'ab/photo.png'}
+        for route in app.router.routes:
+            segments = []
+            for segment in route.pattern.split('/'):
+                if segment.startswith('<'):
+                    kind = segment[1:-1].rpartition(':')[0] or 'str'
+                    segment = samples[kind]
+                segments.append(segment)
+            with self.subTest(route=route):
+                resolved, _ = app.router.resolve(route.method, '/'.join(segments))
+                self.assertIs(resolved, route)
+
+    def test_random_is_not_a_capsule_id(self):
+        route, params = app.router.resolve('GET', '/api/capsules/random')
+        self.assertEqual(route.pattern, '/api/capsules/random')
+        self.assertEqual(params, {})
+
+
+class DispatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        cls.server = app.create_server('pool', 0, workers=2, backlog=16)
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def request(self, method, path):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        conn.request(method, path)
+        response = conn.getresponse()
+        data = json.loads(response.read())
+        conn.close()
+        return response.status, response.getheader('Allow'), data
+
+    def test_status_codes(self):
+        self.assertEqual(self.request('GET', '/api/unknown'), (404, None, {'error': 'Not found'}))
+        self.assertEqual(self.request('DELETE', '/api/capsules'), (405, 'GET, POST', {'error': 'Method not allowed'}))
+        self.assertEqual(self.request('GET', '/api/capsules/abc'), (400, None, {'error': 'Invalid capsule ID'}))
+        self.assertEqual(self.request('GET', '/api/capsules')[0], 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+会话数上限测试
+
+同一秒内反复登录超过 MAX_SESSIONS_PER_USER 次：每次新发的令牌都必须立即可用，
+只保留最新的若干个会话，更早的令牌返回 401。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+os.environ.setdefault('CAPSULE_SCRYPT_N', '1024')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import db
+
+
+class SessionCapTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        cls.server = app.create_server('pool', 0, workers=4, backlog=16)
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @classmethod
+    def request(cls, method, path, body=None, token=None):
+        conn = http.client.HTTPConnection('127.0.0.1', cls.port)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        return response.status, json.loads(data) if data else None
+
+    def register(self, username):
+        user = {'username': username, 'password': 'secret12', 'email': f'{username}@example.com'}
+        self.assertEqual(self.request('POST', '/api/auth/register', user)[0], 201)
+        return user
+
+    def test_newest_token_survives_cap_within_one_second(self):
+        user = self.register('samesecond')
+        cap = 3
+        tokens = []
+        with mock.patch.object(app, 'MAX_SESSIONS_PER_USER', cap), \
+                mock.patch.object(app.time, 'time', return_value=1_900_000_000.0):
+            # 时间固定在同一秒：created_at 全部相同也不能注销刚发出的令牌
+            for _ in range(cap * 3):
+                status, login = self.request('POST', '/api/auth/login', user)
+                self.assertEqual(status, 200)
+                tokens.append(login['token'])
+                self.assertEqual(self.request('GET', '/api/auth/me', token=tokens[-1])[0], 200)
+
+        conn = db.get_db()
+        try:
+            remaining = {row['token'] for row in conn.execute(
+                'SELECT token FROM sessions WHERE user_id = (SELECT id FROM users WHERE username = ?)',
+                (user['username'],))}
+        finally:
+            conn.close()
+        self.assertEqual(len(remaining), cap)
+        self.assertIn(tokens[-1], remaining)
+
+    def test_oldest_sessions_evicted(self):
+        user = self.register('evicted')
+        cap = 3
+        tokens = []
+        with mock.patch.object(app, 'MAX_SESSIONS_PER_USER', cap):
+            for _ in range(cap + 2):
+                status, login = self.request('POST', '/api/auth/login', user)
+                self.assertEqual(status, 200)
+                tokens.append(login['token'])
+
+        for token in tokens[:2]:
+            self.assertEqual(self.request('GET', '/api/auth/me', token=token)[0], 401)
+        for token in tokens[2:]:
+            self.assertEqual(self.request('GET', '/api/auth/me', token=token)[0], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
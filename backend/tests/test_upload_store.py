@@ -0,0 +1,128 @@
+"""
+上传文件回收测试
+
+回收保留期从文件最后一次被上传、被胶囊引用或解除引用时算起：
+很久以前上传、刚从胶囊上换下来的图片不会被立即回收。
+
+运行：python -m unittest discover backend/tests（或 python -m pytest backend/tests）
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault('CAPSULE_DATABASE', os.path.join(tempfile.mkdtemp(prefix='capsule-test-'), 'test.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import db
+import upload_store
+
+DAY = 24 * 3600
+
+
+class UploadGraceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        upload_dir = tempfile.mkdtemp(prefix='capsule-uploads-')
+        cls.addClassCleanup(shutil.rmtree, upload_dir, True)
+        patcher = mock.patch.object(upload_store, 'UPLOAD_FOLDER', upload_dir)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        app.init_db()
+        conn = db.get_db()
+        cls.user_id = conn.execute('''
+            INSERT INTO users (username, password_hash, email, created_at)
+            VALUES ('uploader', '', 'uploader@example.com', '2024-01-01T00:00:00')
+        ''').lastrowid
+        conn.commit()
+        conn.close()
+
+    def store(self, content):
+        fd, temp_path = tempfile.mkstemp(dir=upload_store.UPLOAD_FOLDER)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        image_path, filepath, _ = upload_store.store_file(
+            temp_path, hashlib.sha256(content).hexdigest(), 'png', len(content))
+        return image_path, filepath
+
+    def execute(self, sql, params=()):
+        conn = db.get_db()
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def age(self, image_path, seconds):
+        """把文件的最后引用时间往前推"""
+        self.execute('UPDATE uploads SET uploaded_at = uploaded_at - ? WHERE path = ?', (seconds, image_path))
+
+    def uploaded_at(self, image_path):
+        conn = db.get_db()
+        try:
+            return conn.execute('SELECT uploaded_at FROM uploads WHERE path = ?', (image_path,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def create_capsule(self, image_path):
+        return self.execute('''
+            INSERT INTO capsules (user_id, title, content, create_date, open_date, image_path)
+            VALUES (?, 't', 'c', '2024-01-01T00:00:00', '2030-01-01T00:00:00', ?)
+        ''', (self.user_id, image_path))
+
+    def collect(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return upload_store.collect_garbage()
+
+    def test_default_grace_is_days(self):
+        self.assertGreaterEqual(upload_store.GC_GRACE_SECONDS, DAY)
+
+    def test_unreferenced_upload_kept_during_grace(self):
+        image_path, filepath = self.store(b'draft image')
+        self.age(image_path, upload_store.GC_GRACE_SECONDS - 60)
+        self.collect()
+        self.assertTrue(os.path.exists(filepath))
+
+        self.age(image_path, 120)
+        self.collect()
+        self.assertFalse(os.path.exists(filepath))
+
+    def test_grace_restarts_when_reference_released(self):
+        old_path, old_file = self.store(b'old image')
+        new_path, new_file = self.store(b'new image')
+        capsule_id = self.create_capsule(old_path)
+        # 很久以前上传并引用的图片
+        self.age(old_path, upload_store.GC_GRACE_SECONDS * 2)
+
+        before = time.time()
+        self.execute('UPDATE capsules SET image_path = ? WHERE id = ?', (new_path, capsule_id))
+        self.assertGreaterEqual(self.uploaded_at(old_path), before - 1)
+        self.collect()
+        self.assertTrue(os.path.exists(old_file), 'replaced image removed before its grace period')
+
+        # 恢复旧图片：新图片在此之前已引用很久，换下时同样重新开始保留期
+        self.age(new_path, upload_store.GC_GRACE_SECONDS * 2)
+        self.execute('UPDATE capsules SET image_path = ? WHERE id = ?', (old_path, capsule_id))
+        self.execute('DELETE FROM capsules WHERE id = ?', (capsule_id,))
+        self.collect()
+        self.assertTrue(os.path.exists(old_file))
+        self.assertTrue(os.path.exists(new_file))
+
+        self.age(old_path, upload_store.GC_GRACE_SECONDS + 60)
+        self.age(new_path, upload_store.GC_GRACE_SECONDS + 60)
+        self.collect()
+        self.assertFalse(os.path.exists(old_file))
+        self.assertFalse(os.path.exists(new_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
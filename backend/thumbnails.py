@@ -0,0 +1,196 @@
+"""
+上传图片的缩略图生成
+
+图片上传后由后台线程池按固定宽度档位生成缩小版本和 WebP 版本，
+与原图放在同一目录。/uploads/<文件>?w=320 会返回对应档位的版本，
+尚未生成时先返回原图并把生成任务放入队列。
+
+依赖 Pillow（可选）：未安装时不生成缩略图，始终返回原图。
+"""
+
+import os
+import queue
+import re
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安装
+    Image = ImageOps = None
+
+# 缩略图宽度档位
+THUMBNAIL_WIDTHS = [320, 640, 1280]
+
+# 后台生成线程数和等待队列长度
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUEUE_SIZE = 100
+
+# 不处理的格式（GIF 缩放会丢失动画）
+SKIPPED_EXTENSIONS = {'gif'}
+
+WEBP_QUALITY = 80
+
+_SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+# variant_path() 生成的文件名
+_VARIANT_NAME = re.compile(r'_w\d+\.[^.]+$')
+
+
+def pick_width(requested):
+    """返回不小于请求宽度的最小档位，超过最大档位时返回最大档位"""
+    for width in THUMBNAIL_WIDTHS:
+        if width >= requested:
+            return width
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def variant_path(filepath, width, webp=False):
+    """abc.jpg -> abc_w320.jpg，或 WebP 版本 abc_w320.webp"""
+    stem, ext = os.path.splitext(filepath)
+    return f'{stem}_w{width}{".webp" if webp else ext}'
+
+
+def is_variant(filepath):
+    """是否为已生成的缩略图（abc_w320.jpg），不再为它生成缩略图"""
+    return bool(_VARIANT_NAME.search(os.path.basename(filepath)))
+
+
+def is_supported(filepath):
+    ext = filepath.rsplit('.', 1)[-1].lower()
+    return Image is not None and ext not in SKIPPED_EXTENSIONS
+
+
+def _save_atomic(image, target, fmt, **options):
+    temp = target + '.tmp'
+    image.save(temp, fmt, **options)
+    os.replace(temp, target)
+
+
+def generate_variants(filepath):
+    """为一张图片生成所有档位的缩略图和 WebP 版本（已存在的跳过）"""
+    ext = filepath.rsplit('.', 1)[-1].lower()
+    fmt = _SAVE_FORMATS.get(ext)
+    if fmt is None:
+        return
+
+    with Image.open(filepath) as source:
+        # 按 EXIF 方向旋转（手机竖拍的照片），宽度档位按旋转后的宽度计算；
+        # 缩略图不保留 EXIF，不会被再旋转一次
+        original = ImageOps.exif_transpose(source)
+        for width in THUMBNAIL_WIDTHS:
+            targets = [(variant_path(filepath, width, webp=True), 'WEBP')]
+            if ext != 'webp':
+                targets.append((variant_path(filepath, width), fmt))
+            targets = [(path, target_fmt) for path, target_fmt in targets if not os.path.exists(path)]
+            if not targets:
+                continue
+
+            # 原图比档位窄时不放大，只重新编码
+            image = original.copy()
+            image.thumbnail((width, width * 10))
+            for path, target_fmt in targets:
+                if target_fmt == 'WEBP':
+                    _save_atomic(image, path, 'WEBP', quality=WEBP_QUALITY)
+                elif target_fmt == 'JPEG':
+                    _save_atomic(image.convert('RGB'), path, 'JPEG', quality=85, optimize=True)
+                else:
+                    _save_atomic(image, path, target_fmt, optimize=True)
+
+
+class ThumbnailWorker:
+    """
+    有界队列 + 固定数量后台线程的缩略图生成器
+
+    队列满时丢弃新任务，之后请求该图片的缩略图时会再次入队。
+    """
+
+    def __init__(self, workers=THUMBNAIL_WORKERS, queue_size=THUMBNAIL_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'thumbnail-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, filepath):
+        """
+        提交生成任务
+
+        Returns:
+            bool: 是否已入队（或已在队列中）
+        """
+        if not is_supported(filepath) or is_variant(filepath):
+            return False
+        with self._lock:
+            if filepath in self._pending:
+                return True
+            self._ensure_started()
+            try:
+                self._queue.put_nowait(filepath)
+            except queue.Full:
+                print(f'[THUMB] Queue full, skipped {filepath}')
+                return False
+            self._pending.add(filepath)
+            return True
+
+    def _run(self):
+        while True:
+            filepath = self._queue.get()
+            try:
+                generate_variants(filepath)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f'[THUMB] Failed to process {filepath}: {e}')
+            finally:
+                with self._lock:
+                    self._pending.discard(filepath)
+                self._queue.task_done()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+
+worker = ThumbnailWorker()
+
+
+def submit(filepath):
+    return worker.submit(filepath)
+
+
+def find_variant(filepath, requested_width, accept_webp):
+    """
+    查找请求宽度对应的缩略图
+
+    Args:
+        filepath: 原图路径
+        requested_width: 请求的宽度
+        accept_webp: 客户端是否接受 WebP
+
+    Returns:
+        str: 缩略图路径；尚未生成或不支持时返回 None（调用方返回原图）
+    """
+    if not is_supported(filepath) or is_variant(filepath):
+        return None
+
+    width = pick_width(requested_width)
+    candidates = []
+    if accept_webp:
+        candidates.append(variant_path(filepath, width, webp=True))
+    if not filepath.lower().endswith('.webp'):
+        candidates.append(variant_path(filepath, width))
+
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+
+    # 缩略图缺失（生成前或队列满被丢弃），重新入队
+    submit(filepath)
+    return None
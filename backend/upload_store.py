@@ -0,0 +1,178 @@
+"""
+按内容寻址的上传文件存储
+
+文件以 SHA-256 命名并按前缀分目录保存：uploads/ab/cd/abcd....jpg，
+相同内容只保存一份。uploads 表记录每个文件被多少个胶囊引用
+（由 capsules 表上的触发器维护，引用数每次变化都刷新 uploaded_at），
+引用数为零且超过保留期（GC_GRACE_SECONDS）的文件由后台线程（UploadCollector）回收，
+删除胶囊的请求只负责唤醒它，不在请求中删除文件。
+"""
+
+import glob
+import os
+import threading
+import time
+
+import static_files
+from db import get_db
+
+# 上传目录（与 app.py 相同；压测等脚本可用 CAPSULE_UPLOAD_FOLDER 指定其他目录）
+UPLOAD_FOLDER = os.environ.get('CAPSULE_UPLOAD_FOLDER') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+
+# 未被胶囊引用的文件保留的秒数（默认 7 天），从上传或最后一次被胶囊引用/解除引用时算起，
+# 草稿中或编辑表单里暂时未保存的图片在此期间不会被回收
+GC_GRACE_SECONDS = int(os.environ.get('CAPSULE_UPLOAD_GRACE_SECONDS', 7 * 24 * 3600))
+
+# 单次回收的最大文件数
+GC_BATCH_SIZE = 100
+
+# 后台回收线程没有被唤醒时，每隔该秒数检查一次（回收过了保留期仍未被引用的上传）
+GC_INTERVAL = 600
+
+# 放置文件和回收文件互斥，避免回收刚被重新上传的同一文件
+_store_lock = threading.Lock()
+
+
+def relative_path(sha256, ext):
+    """ab/cd/abcd....ext"""
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}'
+
+
+def image_path_for(rel):
+    """胶囊 image_path 字段的值"""
+    return f'/uploads/{rel}'
+
+
+def store_file(temp_path, sha256, ext, size):
+    """
+    把已写好的临时文件放入内容寻址存储
+
+    内容相同的文件已存在时直接删除临时文件，不再写盘。
+
+    Args:
+        temp_path: 临时文件路径（须在 UPLOAD_FOLDER 所在文件系统）
+        sha256: 文件内容哈希
+        ext: 小写扩展名
+        size: 文件字节数
+
+    Returns:
+        str: 胶囊使用的 image_path
+        str: 文件绝对路径
+        bool: 是否命中已有文件
+    """
+    rel = relative_path(sha256, ext)
+    image_path = image_path_for(rel)
+    filepath = os.path.join(UPLOAD_FOLDER, rel)
+
+    with _store_lock:
+        deduplicated = os.path.exists(filepath)
+        if deduplicated:
+            os.unlink(temp_path)
+        else:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            os.replace(temp_path, filepath)
+
+        conn = get_db()
+        conn.execute('''
+            INSERT INTO uploads (path, sha256, size, ref_count, uploaded_at)
+            VALUES (?, ?, ?, 0, ?)
+            ON CONFLICT(path) DO UPDATE SET uploaded_at = excluded.uploaded_at
+        ''', (image_path, sha256, size, time.time()))
+        conn.commit()
+        conn.close()
+
+    return image_path, filepath, deduplicated
+
+
+def remove_file(filepath):
+    """删除文件及其缩略图"""
+    stem, _ = os.path.splitext(filepath)
+    for path in [filepath] + glob.glob(glob.escape(stem) + '_w*'):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        static_files.stat_cache.invalidate(path)
+
+
+def collect_garbage(grace_seconds=GC_GRACE_SECONDS):
+    """
+    回收不再被任何胶囊引用的文件
+
+    选择和删除在同一条 DELETE ... RETURNING 中完成，只删除真正被删掉的行对应的文件：
+    如果期间有胶囊开始引用某个文件，它的 ref_count 已经大于 0，这一行不会被删除，文件也会保留。
+
+    Returns:
+        int: 删除的文件数
+    """
+    removed = 0
+    with _store_lock:
+        while True:
+            conn = get_db()
+            try:
+                paths = [row['path'] for row in conn.execute('''
+                    DELETE FROM uploads
+                    WHERE path IN (
+                        SELECT path FROM uploads
+                        WHERE ref_count <= 0 AND uploaded_at < ?
+                        LIMIT ?
+                    ) AND ref_count <= 0
+                    RETURNING path
+                ''', (time.time() - grace_seconds, GC_BATCH_SIZE))]
+                conn.commit()
+            finally:
+                conn.close()
+
+            for path in paths:
+                remove_file(os.path.join(UPLOAD_FOLDER, path[len('/uploads/'):]))
+            removed += len(paths)
+            if len(paths) < GC_BATCH_SIZE:
+                break
+
+    if removed:
+        print(f'[UPLOAD] Garbage collected {removed} unreferenced files')
+    return removed
+
+
+class UploadCollector:
+    """
+    在后台线程中回收不再被引用的上传文件
+
+    删除或修改胶囊后调用 notify() 唤醒；没有唤醒时每 interval 秒检查一次。
+    """
+
+    def __init__(self, interval=GC_INTERVAL):
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='upload-collector', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                collect_garbage()
+            except Exception as e:
+                print(f'[UPLOAD] Garbage collection failed: {e}')
+            self._wakeup.wait(self.interval)
+
+
+collector = UploadCollector()
@@ -19,11 +19,14 @@ import 'animate.css/animate.min.css';
 import axios from 'axios';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+const PAGE_SIZE = 20;
 
 function App() {
   const [user, setUser] = useState(null);
   const [currentView, setCurrentView] = useState('timeline');
   const [capsules, setCapsules] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedCapsule, setSelectedCapsule] = useState(null);
   const [editingCapsule, setEditingCapsule] = useState(null);
   const [showTemplateSelector, setShowTemplateSelector] = useState(false);
@@ -89,23 +92,31 @@ function App() {
     }
   }, []);
 
+  const buildCapsuleParams = (cursor) => {
+    const params = { limit: PAGE_SIZE };
+    if (filter !== 'all') {
+      params.status = filter;
+    }
+    if (selectedCategory !== null) {
+      params.category_id = selectedCategory;
+    }
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    return params;
+  };
+
   const fetchCapsules = async () => {
     console.log('fetchCapsules - starting');
     try {
       const token = localStorage.getItem('token');
-      console.log('fetchCapsules - token:', token);
       const response = await axios.get(`${API_URL}/api/capsules`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: buildCapsuleParams(null)
       });
-      console.log('fetchCapsules - response status:', response.status);
-      console.log('fetchCapsules - response data type:', typeof response.data);
-      console.log('fetchCapsules - response data length:', response.data.length);
-      console.log('fetchCapsules - response data is array:', Array.isArray(response.data));
-      console.log('fetchCapsules - setting capsules with', response.data.length, 'items');
-      response.data.forEach((c, idx) => {
-        console.log(`  Capsule ${idx + 1}: ID=${c.id}, title=${c.title}, status=${c.is_opened}, category_id=${c.category_id} (type: ${typeof c.category_id})`);
-      });
-      setCapsules(response.data);
+      console.log('fetchCapsules - loaded', response.data.capsules.length, 'capsules');
+      setCapsules(response.data.capsules);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Failed to fetch capsules:', error);
       console.error('Error details:', error.response?.data, error.response?.status);
@@ -115,13 +126,41 @@ function App() {
     }
   };
 
+  // 滚动到底部时加载下一页
+  const loadMoreCapsules = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get(`${API_URL}/api/capsules`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: buildCapsuleParams(nextCursor)
+      });
+      setCapsules(prev => [...prev, ...response.data.capsules]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Failed to load more capsules:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // 列表接口不返回 content 全文，查看和编辑前获取完整胶囊
+  const fetchCapsuleDetail = async (capsuleId) => {
+    const token = localStorage.getItem('token');
+    const response = await axios.get(`${API_URL}/api/capsules/${capsuleId}`, {
+      headers: { Authorization: `Bearer ${token}` }
+    });
+    return response.data;
+  };
+
   useEffect(() => {
     console.log('useEffect - user changed:', user);
     if (user && user.id) {
       console.log('useEffect - calling fetchCapsules');
       fetchCapsules();
     }
-  }, [user]);
+  }, [user, filter, selectedCategory]);
 
   const handleLogin = (userData) => {
     setUser(userData);
@@ -132,6 +171,7 @@ function App() {
     localStorage.removeItem('user');
     setUser(null);
     setCapsules([]);
+    setNextCursor(null);
     setCurrentView('timeline');
   };
 
@@ -148,14 +188,24 @@ function App() {
     }
   };
 
-  const handleCapsuleClick = (capsule) => {
-    setSelectedCapsule(capsule);
-    setCurrentView('view');
+  const handleCapsuleClick = async (capsule) => {
+    try {
+      setSelectedCapsule(await fetchCapsuleDetail(capsule.id));
+      setCurrentView('view');
+    } catch (error) {
+      console.error('Failed to fetch capsule:', error);
+      showToast('加载胶囊失败', 'error');
+    }
   };
 
-  const handleEditCapsule = (capsule) => {
-    setEditingCapsule(capsule);
-    setCurrentView('edit');
+  const handleEditCapsule = async (capsule) => {
+    try {
+      setEditingCapsule(await fetchCapsuleDetail(capsule.id));
+      setCurrentView('edit');
+    } catch (error) {
+      console.error('Failed to fetch capsule:', error);
+      showToast('加载胶囊失败', 'error');
+    }
   };
 
   const handleCreate = () => {
@@ -280,6 +330,9 @@ function App() {
             <div className="col-md-9">
               <CapsuleTimeline
                 capsules={capsules}
+                hasMore={nextCursor !== null}
+                loadingMore={loadingMore}
+                onLoadMore={loadMoreCapsules}
                 onCapsuleClick={handleCapsuleClick}
                 onEditCapsule={handleEditCapsule}
                 onBatchDelete={handleBatchDelete}
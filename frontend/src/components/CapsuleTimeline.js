@@ -1,11 +1,70 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import './CapsuleTimeline.css';
+import { getImageUrl } from '../utils/imageUtils';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
-function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelete, onExport, showToast, selectedCategory, filter, setFilter, selectedCapsules, setSelectedCapsules, searchQuery, setSearchQuery, searchType, setSearchType }) {
+function CapsuleTimeline({ capsules, hasMore, loadingMore, onLoadMore, onCapsuleClick, onEditCapsule, onBatchDelete, onExport, showToast, selectedCategory, filter, setFilter, selectedCapsules, setSelectedCapsules, searchQuery, setSearchQuery, searchType, setSearchType }) {
   const [categories, setCategories] = useState([]);
+  const [searchResults, setSearchResults] = useState([]);
+  const [searchNextOffset, setSearchNextOffset] = useState(null);
+  const [searching, setSearching] = useState(false);
+  const loadMoreRef = useRef(null);
+  const isSearching = searchQuery.trim() !== '';
+
+  // 服务端全文搜索，offset 为 0 时重新搜索，否则加载下一页
+  const runSearch = async (offset) => {
+    setSearching(true);
+    try {
+      const token = localStorage.getItem('token');
+      const params = { q: searchQuery.trim(), field: searchType, offset };
+      if (filter !== 'all') {
+        params.status = filter;
+      }
+      if (selectedCategory !== null) {
+        params.category_id = selectedCategory;
+      }
+      const response = await axios.get(`${API_URL}/api/capsules/search`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params
+      });
+      setSearchResults(prev => offset === 0 ? response.data.capsules : [...prev, ...response.data.capsules]);
+      setSearchNextOffset(response.data.next_offset);
+    } catch (error) {
+      console.error('Search failed:', error);
+    } finally {
+      setSearching(false);
+    }
+  };
+
+  useEffect(() => {
+    if (!isSearching) {
+      setSearchResults([]);
+      setSearchNextOffset(null);
+      return;
+    }
+    const timer = setTimeout(() => runSearch(0), 300);
+    return () => clearTimeout(timer);
+  }, [searchQuery, searchType, filter, selectedCategory]);
+
+  const listHasMore = isSearching ? searchNextOffset !== null : hasMore;
+  const listLoadingMore = isSearching ? searching : loadingMore;
+  const listLoadMore = isSearching ? () => !searching && runSearch(searchNextOffset) : onLoadMore;
+
+  // 滚动到列表底部时加载下一页
+  useEffect(() => {
+    const sentinel = loadMoreRef.current;
+    if (!sentinel || !listHasMore || !listLoadMore) return;
+
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) {
+        listLoadMore();
+      }
+    }, { rootMargin: '200px' });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [listHasMore, listLoadMore]);
 
   // 获取分类列表
   useEffect(() => {
@@ -78,44 +137,15 @@ function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelet
     return `${Math.floor(diffDays / 365)}年前`;
   };
 
-  const filteredCapsules = capsules.filter(capsule => {
-    const status = getCapsuleStatus(capsule);
-
-    // 状态过滤
-    if (filter !== 'all' && status !== filter) {
-      return false;
-    }
+  // 状态、分类过滤和搜索都由服务端完成
+  const filteredCapsules = isSearching ? searchResults : capsules;
 
-    // 分类过滤
-    if (selectedCategory !== null && capsule.category_id !== selectedCategory) {
-      console.log(`Capsule "${capsule.title}" (ID: ${capsule.id}) - 胶囊分类ID: ${capsule.category_id}, 选中分类ID: ${selectedCategory}, 类型不匹配: ${typeof capsule.category_id} vs ${typeof selectedCategory}`);
-      return false;
-    }
-
-    // 搜索过滤
-    if (searchQuery.trim()) {
-      const query = searchQuery.toLowerCase();
-      const tags = capsule.tags ? JSON.parse(capsule.tags) : [];
-
-      switch (searchType) {
-        case 'title':
-          return capsule.title.toLowerCase().includes(query);
-        case 'content':
-          return capsule.content.toLowerCase().includes(query);
-        case 'tags':
-          return tags.some(tag => tag.toLowerCase().includes(query));
-        case 'all':
-        default:
-          return (
-            capsule.title.toLowerCase().includes(query) ||
-            capsule.content.toLowerCase().includes(query) ||
-            tags.some(tag => tag.toLowerCase().includes(query))
-          );
-      }
-    }
-
-    return true;
-  });
+  // 渲染搜索摘要，只把 <mark> 包裹的部分高亮，其余按纯文本显示
+  const renderSnippet = (snippet) => snippet.split(/(<mark>.*?<\/mark>)/g).map((part, idx) => (
+    part.startsWith('<mark>')
+      ? <mark key={idx}>{part.slice(6, -7)}</mark>
+      : <span key={idx}>{part}</span>
+  ));
 
   console.log('CapsuleTimeline - filtered capsules:', filteredCapsules.length);
 
@@ -357,7 +387,7 @@ function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelet
                     )}
                     <span className="meta-item text-muted">
                       <i className="bi bi-file-text me-1"></i>
-                      {capsule.content.length} 字
+                      {capsule.content_length} 字
                     </span>
                   </div>
 
@@ -365,9 +395,11 @@ function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelet
                   {status === 'opened' && (
                     <div className="capsule-preview">
                       <p className="preview-text">
-                        {capsule.content.length > 100
-                          ? capsule.content.substring(0, 100) + '...'
-                          : capsule.content}
+                        {capsule.snippet
+                          ? renderSnippet(capsule.snippet)
+                          : capsule.content_length > 100
+                            ? capsule.preview + '...'
+                            : capsule.preview}
                       </p>
                     </div>
                   )}
@@ -375,7 +407,7 @@ function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelet
                   {capsule.image_path && status === 'opened' && (
                     <div className="capsule-image-preview">
                       <img
-                        src={`${API_URL}${capsule.image_path}`}
+                        src={getImageUrl(capsule.image_path, 640)}
                         alt="胶囊图片"
                         loading="lazy"
                         style={{width: '100%', maxHeight: '200px', objectFit: 'cover'}}
@@ -414,6 +446,11 @@ function CapsuleTimeline({ capsules, onCapsuleClick, onEditCapsule, onBatchDelet
             );
           })
         )}
+        {listHasMore && (
+          <div ref={loadMoreRef} className="text-center py-3">
+            {listLoadingMore && <div className="spinner-border spinner-border-sm text-primary" role="status"></div>}
+          </div>
+        )}
       </div>
     </div>
   );
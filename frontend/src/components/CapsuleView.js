@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import './CapsuleView.css';
+import { getImageUrl } from '../utils/imageUtils';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
@@ -117,7 +118,7 @@ function CapsuleView({ capsule, onBack, onOpen, showToast }) {
           {capsule.image_path && (
             <div className="capsule-image-blur">
               <img
-                src={`${API_URL}${capsule.image_path}`}
+                src={getImageUrl(capsule.image_path, 320)}
                 alt="胶囊图片（模糊）"
                 style={{width: '100%', height: '100%', objectFit: 'cover', filter: 'blur(4px)'}}
               />
@@ -195,7 +196,7 @@ function CapsuleView({ capsule, onBack, onOpen, showToast }) {
                   return null;
                 })()}
                 <img
-                  src={`${API_URL}${capsule.image_path}`}
+                  src={getImageUrl(capsule.image_path, 1280)}
                   alt="胶囊图片"
                   onError={(e) => {
                     console.error('CapsuleView - Image load error:', e.target.src);
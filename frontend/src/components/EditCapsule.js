@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import './EditCapsule.css';
+import { getImageUrl } from '../utils/imageUtils';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
@@ -253,7 +254,7 @@ function EditCapsule({ capsule, onEdit, onCancel, showToast }) {
           {(formData.image_path || imageFile) && (
             <div className="mt-2">
               <img
-                src={imageFile ? URL.createObjectURL(imageFile) : `${API_URL}${formData.image_path}`}
+                src={imageFile ? URL.createObjectURL(imageFile) : getImageUrl(formData.image_path, 320)}
                 alt="Preview"
                 className="img-preview"
               />
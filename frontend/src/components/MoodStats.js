@@ -10,6 +10,7 @@ ChartJS.register(ArcElement, Tooltip, Legend, CategoryScale, LinearScale, BarEle
 
 function MoodStats() {
   const [moodData, setMoodData] = useState(null);
+  const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -19,10 +20,11 @@ function MoodStats() {
   const fetchMoodStats = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API_URL}/api/stats/mood`, {
+      const response = await axios.get(`${API_URL}/api/stats`, {
         headers: { Authorization: `Bearer ${token}` }
       });
-      setMoodData(response.data);
+      setStats(response.data);
+      setMoodData(response.data.moods);
     } catch (error) {
       console.error('Fetch failed:', error);
     } finally {
@@ -120,6 +122,11 @@ function MoodStats() {
           <div className="stat-value">{Object.keys(moodData).length}</div>
           <div className="stat-label">心情种类</div>
         </div>
+        <div className="stat-card">
+          <i className="bi bi-unlock"></i>
+          <div className="stat-value">{stats.opened} / {stats.sealed}</div>
+          <div className="stat-label">已开启 / 未开启</div>
+        </div>
       </div>
 
       <div className="charts-container">
@@ -215,6 +222,80 @@ function MoodStats() {
         </div>
       </div>
 
+      <div className="charts-container">
+        <div className="chart-card">
+          <h4 className="chart-title">每月创建</h4>
+          <div className="chart-wrapper">
+            <Bar
+              data={{
+                labels: stats.months.map(item => item.month),
+                datasets: [
+                  {
+                    label: '已开启',
+                    data: stats.months.map(item => item.opened),
+                    backgroundColor: '#6BCB77',
+                    borderRadius: 8,
+                    borderWidth: 0
+                  },
+                  {
+                    label: '未开启',
+                    data: stats.months.map(item => item.count - item.opened),
+                    backgroundColor: '#667eea',
+                    borderRadius: 8,
+                    borderWidth: 0
+                  }
+                ]
+              }}
+              options={{
+                responsive: true,
+                maintainAspectRatio: true,
+                plugins: {
+                  legend: {
+                    position: 'bottom'
+                  }
+                },
+                scales: {
+                  x: {
+                    stacked: true,
+                    grid: {
+                      display: false
+                    }
+                  },
+                  y: {
+                    stacked: true,
+                    beginAtZero: true,
+                    ticks: {
+                      stepSize: 1
+                    },
+                    grid: {
+                      color: 'rgba(0, 0, 0, 0.05)'
+                    }
+                  }
+                }
+              }}
+            />
+          </div>
+        </div>
+
+        {stats.tags.length > 0 && (
+          <div className="chart-card">
+            <h4 className="chart-title">常用标签</h4>
+            <div className="insights-grid">
+              {stats.tags.map(({ tag, count }) => (
+                <div key={tag} className="insight-item">
+                  <div className="insight-emoji">#</div>
+                  <div className="insight-info">
+                    <div className="insight-mood">{tag}</div>
+                    <div className="insight-count">{count} 个胶囊</div>
+                  </div>
+                  <div className="insight-bar" style={{ width: `${(count / stats.tags[0].count) * 100}%` }}></div>
+                </div>
+              ))}
+            </div>
+          </div>
+        )}
+      </div>
+
       <div className="mood-insights">
         <h4 className="insights-title">
           <i className="bi bi-lightbulb me-2"></i>
@@ -0,0 +1,17 @@
+/**
+ * 图片地址工具函数
+ */
+
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+
+/**
+ * 获取上传图片的地址，默认请求缩略图
+ * @param {string} imagePath - 胶囊的 image_path（如 /uploads/xxx.jpg）
+ * @param {number|null} width - 需要的宽度（像素），为 null 时返回原图
+ * @returns {string} 图片地址
+ */
+export const getImageUrl = (imagePath, width = 640) => {
+  if (!imagePath) return '';
+  if (!width) return `${API_URL}${imagePath}`;
+  return `${API_URL}${imagePath}?w=${width}`;
+};